@@ -0,0 +1,522 @@
+# -*- coding: utf-8 -*-
+"""
+API HTTP local (JSON) para usar el simulador desde otros programas, sin la
+interfaz de Streamlit.
+
+    python api.py --port 8765 --workers 4 --queue 64
+    curl -s localhost:8765/simulate -d '{"assets": [{"ticker": "VWRA.L", "weight": 0.8},
+                                                   {"ticker": "AGGU.L", "role": "bond", "weight": 0.2}]}'
+
+POST /simulate  cartera DCA (core.simulate_dca_multi): métricas, valor final e historial
+POST /stats     CAGR, Vol, MaxDD y Sharpe (core.perf_stats) de tickers o de una serie dada
+POST /signals   medias, cruces y tendencia bajista (core.screen_watchlist, core.trend_is_bearish)
+POST /sweep     perfiles × rebalanceos × aportaciones (robo.sweep_profiles)
+GET  /health    estado del pool y de la cola
+
+El cuerpo es un objeto JSON (ver cada función). Las tablas (historial, filas
+del barrido, señales) se devuelven por columnas en JSON o, con `?format=ndjson`
+o `?format=arrow` (o la cabecera Accept), en streaming: NDJSON con una línea
+de metadatos y una por fila, o un stream IPC de Arrow con los metadatos en el
+esquema.
+
+Los cálculos corren en un pool de procesos (o de hilos con `--threads`) con
+una cola acotada: si están todos los huecos ocupados la API responde 503 con
+Retry-After en lugar de acumular peticiones. Cada worker cachea resultados en
+result_cache y lee los precios del panel compartido (price_panel).
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+import robo
+import telemetry
+from core import (
+    Asset, FXUnavailable, convert_series_to, get_currency_of_ticker, month_end_prices, perf_stats,
+    price_version, screen_watchlist, simulate_dca_multi, trend_is_bearish,
+)
+from costs import CostModel
+from fx import pairs_for
+from price_store import load_prices_many, ticker_currencies
+from result_cache import RESULTS, make_key
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = int(os.environ.get("FINCONTROL_API_PORT", 8765))
+QUEUE_SIZE = 64            # peticiones en espera además de las que se están calculando
+REQUEST_TIMEOUT = 120.0    # segundos por petición antes de responder 504
+MAX_BODY = 1 << 20         # bytes
+CHUNK_ROWS = 2048          # filas por trozo en NDJSON / Arrow
+LISTEN_BACKLOG = 128       # conexiones pendientes de accept (socketserver usa 5 por defecto)
+FORMATS = {"json": "application/json", "ndjson": "application/x-ndjson",
+           "arrow": "application/vnd.apache.arrow.stream"}
+
+class ApiError(ValueError):
+    """Petición inválida o sin datos: se responde con `status` y el mensaje."""
+
+    def __init__(self, message, status=HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = int(status)
+
+class Busy(RuntimeError):
+    """Pool y cola llenos."""
+
+@dataclass
+class Reply:
+    meta: dict
+    table: pd.DataFrame | None = None
+
+# ─────────────────────────────────────────────────────────────────────
+# Lectura de peticiones
+# ─────────────────────────────────────────────────────────────────────
+def _field(body, name, kind, default=None):
+    # Un null explícito equivale a omitir el campo (se usa `default`)
+    value = body.get(name)
+    if value is None:
+        return default
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ApiError(f"'{name}' no válido: {value!r}") from None
+
+def _date(body, name, default=None):
+    """Fecha como 'AAAA-MM-DD' (null = `default`); 400 si no se puede leer."""
+    value = body.get(name)
+    if value is None:
+        return default
+    try:
+        ts = pd.Timestamp(value) if isinstance(value, str) else pd.NaT
+    except (TypeError, ValueError):
+        ts = pd.NaT
+    if pd.isna(ts):
+        raise ApiError(f"'{name}' no es una fecha válida: {value!r}")
+    return ts.strftime("%Y-%m-%d")
+
+def _currency(value, name, default=None):
+    """Código de moneda de 3 letras (se respeta la caja: GBp ≠ GBP); null = `default`."""
+    if value is None:
+        return default
+    if not isinstance(value, str) or len(value.strip()) != 3 or not value.strip().isalpha():
+        raise ApiError(f"'{name}' debe ser un código de moneda de 3 letras: {value!r}")
+    return value.strip()
+
+def _tickers(body):
+    tickers = body.get("tickers")
+    if not isinstance(tickers, list) or not tickers or not all(isinstance(t, str) and t.strip() for t in tickers):
+        raise ApiError("'tickers' debe ser una lista de tickers")
+    return list(dict.fromkeys(t.strip() for t in tickers))
+
+def _assets(body):
+    items = body.get("assets")
+    if not isinstance(items, list) or not items:
+        raise ApiError("'assets' debe ser una lista de {ticker, weight, role?, currency?}")
+    assets = []
+    for i, a in enumerate(items):
+        if not isinstance(a, dict) or not isinstance(a.get("ticker"), str) or not a["ticker"].strip():
+            raise ApiError(f"assets[{i}] sin 'ticker'")
+        ticker = a["ticker"].strip()
+        weight = _field(a, "weight", float)
+        if weight is None or not np.isfinite(weight) or weight < 0:
+            raise ApiError(f"assets[{i}]: 'weight' debe ser un número ≥ 0")
+        currency = _currency(a.get("currency"), f"assets[{i}].currency") or get_currency_of_ticker(ticker)
+        assets.append(Asset(ticker, str(a.get("role") or "equity"), weight, currency))
+    return assets
+
+def _costs(body):
+    if not body.get("costs"):
+        return None
+    try:
+        return CostModel(**body["costs"])
+    except (TypeError, ValueError) as e:
+        raise ApiError(f"'costs' no válido: {e}") from None
+
+def _jsonable(v):
+    if isinstance(v, dict):
+        return {str(k): _jsonable(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [_jsonable(x) for x in v]
+    if isinstance(v, (pd.Timestamp, np.datetime64)):
+        return None if pd.isna(v) else pd.Timestamp(v).strftime("%Y-%m-%d")
+    if isinstance(v, (np.bool_, bool)):
+        return bool(v)
+    if isinstance(v, (np.integer, int)):
+        return int(v)
+    if isinstance(v, (np.floating, float)):
+        return None if not np.isfinite(v) else float(v)
+    return v
+
+# ─────────────────────────────────────────────────────────────────────
+# Endpoints (se ejecutan en el worker)
+# ─────────────────────────────────────────────────────────────────────
+def simulate(body):
+    """
+    {"assets": [{"ticker", "weight", "role"?, "currency"?}], "monthly": 300,
+     "start": "2018-01-01", "end": null, "rebalance": 6, "currency": "EUR",
+     "costs": {campos de costs.CostModel}?, "history": true}
+    """
+    assets = _assets(body)
+    monthly = _field(body, "monthly", float, 300.0)
+    if not np.isfinite(monthly):
+        raise ApiError(f"'monthly' no válido: {body.get('monthly')!r}")
+    start = _date(body, "start", "2018-01-01")
+    end = _date(body, "end")
+    rb = _field(body, "rebalance", int, 6) or 0
+    currency = _currency(body.get("currency"), "currency", "EUR").upper()
+    costs = _costs(body)
+
+    def compute():
+        df = simulate_dca_multi(assets, monthly, start, end, rb, currency, costs)[0]
+        if df is None or df.empty:
+            return None
+        meta = {"months": len(df), "final_value": df["total"].iloc[-1], "contributed": len(df) * monthly,
+                "currency": currency, "stats": perf_stats(df["total"])}
+        if "fees" in df:
+            meta.update(fees=df["fees"].sum(), taxes=df["taxes"].sum())
+        return Reply(_jsonable(meta), df.rename_axis("date").reset_index())
+
+    try:
+        version = price_version([a.ticker for a in assets], [a.currency for a in assets], start, currency, end)
+        key = make_key("api.simulate", assets, monthly, start, end, rb, currency, costs, version)
+        reply = RESULTS.get_or_compute(key, compute)
+    except FXUnavailable as e:
+        raise ApiError(str(e), HTTPStatus.UNPROCESSABLE_ENTITY) from None
+    if reply is None:
+        raise ApiError("sin precios en el rango pedido", HTTPStatus.UNPROCESSABLE_ENTITY)
+    return reply if body.get("history", True) else Reply(reply.meta)
+
+def stats(body):
+    """
+    {"tickers": [...], "start": "2018-01-01", "end": null, "currency": "EUR"}: métricas
+    de cada ticker sobre sus precios mensuales en `currency`; o {"dates": [...],
+    "values": [...]}: métricas de esa serie (p.ej. el historial de una cartera).
+    """
+    if "values" in body:
+        try:
+            series = pd.Series([float(v) for v in body["values"]], index=pd.DatetimeIndex(body.get("dates")))
+        except (TypeError, ValueError) as e:
+            raise ApiError(f"'dates'/'values' no válidos: {e}") from None
+        return Reply({"stats": perf_stats(series.sort_index())})
+    tickers = _tickers(body)
+    start = _date(body, "start", "2018-01-01")
+    end = _date(body, "end")
+    currency = _currency(body.get("currency"), "currency", "EUR").upper()
+    currencies = ticker_currencies(tickers)
+    prices = load_prices_many(tickers + pairs_for(currencies.values(), currency), start, end)
+    out = {}
+    for t in tickers:
+        s = prices.get(t, pd.Series(dtype=float))
+        try:
+            s = convert_series_to(s, currencies[t], currency, start)
+        except FXUnavailable as e:
+            out[t] = {"error": str(e)}
+            continue
+        if s.empty:
+            out[t] = {"error": "sin precios en el rango pedido"}
+            continue
+        monthly = month_end_prices(s.dropna())
+        out[t] = perf_stats(monthly)
+    return Reply({"currency": currency, "stats": out})
+
+def signals(body):
+    """{"tickers": [...], "start": "2018-01-01", "currency": "EUR"}: una fila por ticker."""
+    tickers = _tickers(body)
+    start = _date(body, "start", "2018-01-01")
+    currency = _currency(body.get("currency"), "currency", "EUR").upper()
+    rows = screen_watchlist(tickers, start, currency)
+    bearish = {t: trend_is_bearish(t, start, currency) for t in tickers}
+    table = rows.rename_axis("ticker").reset_index() if not rows.empty else pd.DataFrame({"ticker": []})
+    table["bearish"] = [bearish.get(t) for t in table["ticker"]]
+    return Reply({"currency": currency, "missing": [t for t in tickers if t not in rows.index]}, table)
+
+def sweep(body):
+    """
+    {"equity": "VWCE.DE", "bond": "AGGU.L", "start": "2018-01-01", "end": null,
+     "profiles": {"nombre": [peso_acciones, peso_bonos]}?, "rebalance": [2, 6, 0]?,
+     "contributions": [300]?}: una fila por combinación (precios en su moneda).
+    """
+    cfg = robo.PortfolioConfig(
+        equity_ticker=_field(body, "equity", str, robo.DEFAULT_EQUITY["ticker"]),
+        bond_ticker=_field(body, "bond", str, robo.DEFAULT_BOND["ticker"]),
+        start=_date(body, "start", "2018-01-01"), end=_date(body, "end"))
+    profiles = body.get("profiles") or robo.PROFILE_WEIGHTS
+    rebalance = body.get("rebalance") or robo.REBALANCE_OPTIONS
+    contributions = body.get("contributions") or [cfg.monthly_contribution]
+    try:
+        profiles = {str(k): tuple(float(x) for x in v) for k, v in profiles.items()}
+        rebalance = [int(r or 0) for r in rebalance]
+        contributions = [float(c) for c in contributions]
+    except (AttributeError, TypeError, ValueError) as e:
+        raise ApiError(f"barrido no válido: {e}") from None
+    # Precios en su moneda: la versión solo depende de los dos tickers
+    version = price_version([cfg.equity_ticker, cfg.bond_ticker], [], cfg.start, None, cfg.end)
+    key = make_key("api.sweep", cfg, profiles, rebalance, contributions, version)
+    try:
+        table = RESULTS.get_or_compute(key, lambda: robo.sweep_profiles(cfg, profiles, rebalance, contributions))
+    except (AttributeError, TypeError, ValueError) as e:
+        raise ApiError(f"barrido no válido: {e}") from None
+    if table.empty:
+        raise ApiError("sin precios en el rango pedido", HTTPStatus.UNPROCESSABLE_ENTITY)
+    return Reply({"combinations": len(table)}, table.reset_index(drop=True))
+
+ENDPOINTS = {"simulate": simulate, "stats": stats, "signals": signals, "sweep": sweep}
+
+def _call(name, body):
+    """En el worker: (estado HTTP, Reply | mensaje de error)."""
+    try:
+        with telemetry.stage(f"api.{name}"):
+            return HTTPStatus.OK, ENDPOINTS[name](body)
+    except ApiError as e:
+        return e.status, str(e)
+    except Exception as e:
+        return HTTPStatus.INTERNAL_SERVER_ERROR, f"{type(e).__name__}: {e}"
+
+def _ping():
+    return os.getpid()
+
+# ─────────────────────────────────────────────────────────────────────
+# Pool con cola acotada
+# ─────────────────────────────────────────────────────────────────────
+class WorkerPool:
+    """
+    `workers` procesos (o hilos) y como mucho `queue_size` peticiones
+    esperando: `submit` lanza Busy al instante si no hay hueco.
+    """
+
+    def __init__(self, workers=None, queue_size=QUEUE_SIZE, processes=True):
+        self.workers = workers or os.cpu_count() or 1
+        self.processes = processes
+        self.capacity = self.workers + queue_size
+        self.executor = (ProcessPoolExecutor(self.workers) if processes
+                         else ThreadPoolExecutor(self.workers, thread_name_prefix="api"))
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self.counts = {"accepted": 0, "rejected": 0, "in_flight": 0}
+
+    def start(self):
+        """Arranca los workers antes de servir (no a mitad de la primera ráfaga)."""
+        for f in [self.executor.submit(_ping) for _ in range(self.workers)]:
+            f.result()
+        return self
+
+    def _release(self, _future):
+        with self._lock:
+            self.counts["in_flight"] -= 1
+        self._slots.release()
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.counts["rejected"] += 1
+            raise Busy()
+        with self._lock:
+            self.counts["accepted"] += 1
+            self.counts["in_flight"] += 1
+        fut = self.executor.submit(fn, *args)
+        fut.add_done_callback(self._release)
+        return fut
+
+    def status(self):
+        with self._lock:
+            return {"workers": self.workers, "processes": self.processes, "capacity": self.capacity,
+                    **self.counts}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+# ─────────────────────────────────────────────────────────────────────
+# Serialización de respuestas
+# ─────────────────────────────────────────────────────────────────────
+def _column(values):
+    """Columna de la tabla como lista JSON (fechas ISO, NaN → null)."""
+    if np.issubdtype(values.dtype, np.datetime64):
+        out = np.datetime_as_string(values.astype("datetime64[D]"), unit="D").tolist()
+        return [None if d == "NaT" else d for d in out]
+    if np.issubdtype(values.dtype, np.floating):
+        return [None if x != x else x for x in values.tolist()]
+    return [_jsonable(x) for x in values.tolist()]
+
+def _rows(table, lo, hi):
+    cols = {c: _column(table[c].to_numpy()[lo:hi]) for c in table.columns}
+    return [dict(zip(cols, vals)) for vals in zip(*cols.values())]
+
+class _ChunkedWriter:
+    """Escribe en el socket con Transfer-Encoding: chunked (lo usa también pyarrow)."""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        if data:                                   # un trozo vacío cerraría la respuesta
+            self.wfile.write(b"%X\r\n%s\r\n" % (len(data), data))
+        return len(data)
+
+    def flush(self):
+        self.wfile.flush()
+
+    def close(self):
+        if not self.closed:
+            self.wfile.write(b"0\r\n\r\n")
+            self.closed = True
+
+def _arrow_stream(out, meta, table):
+    import pyarrow as pa
+
+    at = pa.Table.from_pandas(table, preserve_index=False)
+    at = at.replace_schema_metadata({**(at.schema.metadata or {}), b"fincontrol": json.dumps(meta).encode()})
+    with pa.ipc.new_stream(out, at.schema) as writer:
+        for batch in at.to_batches(max_chunksize=CHUNK_ROWS):
+            writer.write_batch(batch)
+
+# ─────────────────────────────────────────────────────────────────────
+# Servidor
+# ─────────────────────────────────────────────────────────────────────
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"          # conexiones persistentes
+    server_version = "FincontrolAPI/1.0"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, allow_nan=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", FORMATS["json"])
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, message, headers=None):
+        self._send_json(status, {"error": message}, headers)
+
+    def _format(self, query):
+        fmt = (query.get("format") or [None])[0]
+        if fmt is None:
+            accept = self.headers.get("Accept", "")
+            fmt = next((k for k, v in FORMATS.items() if v in accept), "json")
+        if fmt not in FORMATS:
+            raise ApiError(f"formato no soportado: {fmt} (json, ndjson, arrow)")
+        return fmt
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") in ("/health", ""):
+            self._send_json(HTTPStatus.OK, {"ok": True, "endpoints": sorted(ENDPOINTS),
+                                            "pool": self.server.pool.status()})
+        else:
+            self._error(HTTPStatus.NOT_FOUND, f"no existe {url.path}")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        name = url.path.strip("/")
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            self.close_connection = True
+            return self._error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"cuerpo de más de {MAX_BODY} bytes")
+        raw = self.rfile.read(length) if length else b""
+        if name not in ENDPOINTS:
+            return self._error(HTTPStatus.NOT_FOUND, f"no existe {url.path}")
+        try:
+            fmt = self._format(parse_qs(url.query))
+            body = json.loads(raw or b"{}")
+            if not isinstance(body, dict):
+                raise ApiError("el cuerpo debe ser un objeto JSON")
+        except ValueError as e:
+            return self._error(getattr(e, "status", HTTPStatus.BAD_REQUEST), str(e))
+
+        try:
+            fut = self.server.pool.submit(_call, name, body)
+        except Busy:
+            return self._error(HTTPStatus.SERVICE_UNAVAILABLE, "servidor ocupado, reintenta", {"Retry-After": "1"})
+        try:
+            status, reply = fut.result(timeout=self.server.timeout_s)
+        except FutureTimeout:
+            return self._error(HTTPStatus.GATEWAY_TIMEOUT, f"sin respuesta en {self.server.timeout_s:.0f} s")
+        if status != HTTPStatus.OK:
+            return self._error(status, reply)
+        self._reply(fmt, reply)
+
+    def _reply(self, fmt, reply):
+        meta, table = _jsonable(reply.meta), reply.table
+        if fmt == "json" or table is None:
+            payload = dict(meta)
+            if table is not None:
+                payload["table"] = {c: _column(table[c].to_numpy()) for c in table.columns}
+            return self._send_json(HTTPStatus.OK, payload)
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", FORMATS[fmt])
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        out = _ChunkedWriter(self.wfile)
+        if fmt == "ndjson":
+            out.write(json.dumps({"meta": meta}).encode() + b"\n")
+            for lo in range(0, len(table), CHUNK_ROWS):
+                lines = (json.dumps(row, allow_nan=False) for row in _rows(table, lo, lo + CHUNK_ROWS))
+                out.write(("\n".join(lines) + "\n").encode())
+        else:
+            _arrow_stream(out, meta, table)
+        out.close()
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, pool, timeout_s=REQUEST_TIMEOUT, verbose=False):
+        # Backlog de listen() al menos igual a la capacidad del pool: en una ráfaga el kernel no
+        # debe resetear conexiones, que lleguen al handler y reciban 503 con Retry-After
+        self.request_queue_size = max(LISTEN_BACKLOG, pool.capacity)
+        super().__init__(address, Handler)
+        self.pool = pool
+        self.timeout_s = timeout_s
+        self.verbose = verbose
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, queue_size=QUEUE_SIZE, processes=True,
+                timeout_s=REQUEST_TIMEOUT, verbose=False):
+    """Servidor listo para `serve_forever()` (port=0: puerto libre); los workers ya arrancados."""
+    pool = WorkerPool(workers, queue_size, processes).start()
+    return ApiServer((host, port), pool, timeout_s, verbose)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default=DEFAULT_HOST)
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--workers", type=int, default=None, help="workers (por defecto, nº de CPUs)")
+    ap.add_argument("--queue", type=int, default=QUEUE_SIZE, help="peticiones en espera como máximo")
+    ap.add_argument("--threads", action="store_true", help="pool de hilos en este proceso en vez de procesos")
+    ap.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT, help="segundos por petición")
+    ap.add_argument("--verbose", action="store_true", help="registra cada petición")
+    args = ap.parse_args(argv)
+
+    server = make_server(args.host, args.port, args.workers, args.queue, not args.threads, args.timeout,
+                         args.verbose)
+    st = server.pool.status()
+    print(f"API en {server.url} • {st['workers']} {'procesos' if st['processes'] else 'hilos'} • "
+          f"cola {args.queue}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.pool.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,23 @@
 # -*- coding: utf-8 -*-
-import io
-from dataclasses import dataclass
 from datetime import date, datetime
 from pathlib import Path
 
-import numpy as np
 import pandas as pd
 import plotly.express as px
 import streamlit as st
-import yfinance as yf
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.pdfgen import canvas
+
+from core import (
+    Asset, FXUnavailable, first_available_month, get_currency_of_ticker, has_history,
+    hhi_and_neff, prefetch_simulation_data, recommend_tickers, remember_kinds, suggest_tickers,
+    ticker_label, trend_is_bearish,
+)
+from costs import CostModel
+from optimizer import load_model, min_variance, risk_parity, tolerance_weights
+from report import ReportData, prefetch_pdf
+from results import resultados
+from result_cache import RESULTS, make_key
+import telemetry
+import warmup
 
 # ───────────────────────────── CONFIG ─────────────────────────────
 BRAND_NAME = "Fincontrol"
@@ -23,10 +29,16 @@ DEFAULTS = {
     "bond_ticker": "AGGU.L",    # ETF global bonos (LSE, USD)
     "crypto_ticker": "BTC-USD",
     "start": "2018-01-01",
+    "monthly": 300,
+    "horizon": 7,
 }
 
 st.set_page_config(page_title=f"{BRAND_NAME} — Simulador de Inversión", page_icon="💼", layout="wide")
 
+# Precalentado en segundo plano (una vez por proceso): precios, monedas y simulaciones por defecto
+warmup.start_default(DEFAULTS["equity_ticker"], DEFAULTS["bond_ticker"], DEFAULTS["crypto_ticker"],
+                     DEFAULTS["start"], DEFAULTS["monthly"], DEFAULTS["horizon"])
+
 # ───────────────────────────── TEXTOS ─────────────────────────────
 LANGS = {
     "ES": {
@@ -34,6 +46,13 @@ LANGS = {
         "language": "Idioma", "spanish": "Español", "english": "English",
         "currency": "Moneda", "eur": "EUR (€)", "usd": "USD ($)",
         "darkmode": "Tema oscuro",
+        "debug": "Panel de depuración",
+        "debug_header": "🛠️ Depuración: tiempos por etapa",
+        "debug_note": "Tiempos inclusivos (una etapa incluye las que llama). Bytes de Yahoo: tamaño de lo descargado ya decodificado. Total de la ejecución: {ms:,.0f} ms.",
+        "debug_json": "Métricas (JSON)",
+        "debug_cache": "Caché de resultados: {hits} aciertos de {lookups} consultas ({rate:.0%}) • {entries} entradas • {mb:.1f} MB",
+        "debug_prom": "Métricas (Prometheus)",
+        "debug_warmup": "Precalentado en segundo plano (último refresco correcto de cada tarea, UTC):",
         "demo_note": "Demo educativa — Sin conexión a broker. Aprende cómo podría comportarse una cartera en el tiempo.",
         "sidebar_header": "🧭 Onboarding rápido",
         "age": "Tu edad",
@@ -46,7 +65,24 @@ LANGS = {
         "reb_opt_none": "Sin rebalanceo",
         "profiles_header": "Perfiles & Pesos",
         "choose_profile": "Perfil sugerido (editable)",
+        "weights_method": "Método de pesos",
+        "weights_profile": "Perfil fijo",
+        "weights_minvar": "Mínima varianza",
+        "weights_rp": "Paridad de riesgo",
+        "weights_target": "Volatilidad objetivo (según tolerancia)",
+        "weights_note": "Con {n} meses de histórico: vol. esperada {vol:.1%} • rent. esperada {ret:.1%}",
+        "weights_unavailable": "No hay histórico suficiente para optimizar; se usan los pesos del perfil.",
         "custom_weights": "Ajusta pesos (suman 100%)",
+        "costs_header": "Costes e impuestos",
+        "costs_enable": "Incluir costes e impuestos",
+        "commission_pct": "Comisión (%)",
+        "commission_min": "Comisión mínima por operación",
+        "spread_bps": "Diferencial compra/venta (pb)",
+        "fx_fee": "Comisión de cambio de divisa (%)",
+        "tax_rate": "Impuesto sobre plusvalías (%)",
+        "lot_method": "Coste fiscal de las ventas",
+        "lot_fifo": "FIFO", "lot_average": "Coste medio",
+        "fees_taxes": "Costes: {sym}{fees:,.2f} • Impuestos: {sym}{taxes:,.2f}",
         "equity_weight": "Acciones (%)",
         "bond_weight": "Bonos (%)",
         "crypto_weight": "Cripto (%)",
@@ -81,6 +117,12 @@ LANGS = {
         "total_title": "Valor total de la cartera",
         "date": "Fecha", "component": "Componente", "hover_total": "Total",
         "last12": "Datos (últimos 12 meses)",
+        "projection": "Proyección a {years} años (Monte Carlo)",
+        "projection_note": "{paths:,} escenarios remuestreando bloques de 12 meses del histórico. Mediana: {sym}{p50:,.0f} • Rango 5–95%: {sym}{p5:,.0f} – {sym}{p95:,.0f} • Aportado: {sym}{contrib:,.0f}",
+        "projection_years": "Años",
+        "entry_dates": "Sensibilidad a la fecha de entrada (CAGR)",
+        "entry_dates_note": "Cada celda es la misma cartera empezando en ese mes y mantenida durante ese nº de años. Peor CAGR a {years} años: {worst:.2%} • Mejor: {best:.2%}",
+        "entry_start": "Mes de entrada",
         "glossary": "📖 Cómo leer los resultados",
         "glossary_text": (
             "- **DCA:** aportas una cantidad fija cada mes.\n"
@@ -104,6 +146,13 @@ LANGS = {
         "language": "Language", "spanish": "Español", "english": "English",
         "currency": "Currency", "eur": "EUR (€)", "usd": "USD ($)",
         "darkmode": "Dark theme",
+        "debug": "Debug panel",
+        "debug_header": "🛠️ Debug: per-stage timings",
+        "debug_note": "Inclusive timings (a stage includes the ones it calls). Yahoo bytes: decoded size of what was downloaded. Run total: {ms:,.0f} ms.",
+        "debug_json": "Metrics (JSON)",
+        "debug_cache": "Result cache: {hits} hits out of {lookups} lookups ({rate:.0%}) • {entries} entries • {mb:.1f} MB",
+        "debug_prom": "Metrics (Prometheus)",
+        "debug_warmup": "Background warm-up (last successful refresh of each job, UTC):",
         "demo_note": "Educational demo — No broker connection.",
         "sidebar_header": "🧭 Quick onboarding",
         "age": "Your age",
@@ -116,7 +165,24 @@ LANGS = {
         "reb_opt_none": "No rebalancing",
         "profiles_header": "Profiles & Weights",
         "choose_profile": "Suggested profile (editable)",
+        "weights_method": "Weighting method",
+        "weights_profile": "Fixed profile",
+        "weights_minvar": "Minimum variance",
+        "weights_rp": "Risk parity",
+        "weights_target": "Target volatility (from tolerance)",
+        "weights_note": "Using {n} months of history: expected vol {vol:.1%} • expected return {ret:.1%}",
+        "weights_unavailable": "Not enough history to optimize; using the profile weights.",
         "custom_weights": "Adjust weights (sum to 100%)",
+        "costs_header": "Costs and taxes",
+        "costs_enable": "Include costs and taxes",
+        "commission_pct": "Commission (%)",
+        "commission_min": "Minimum commission per trade",
+        "spread_bps": "Bid/ask spread (bps)",
+        "fx_fee": "FX conversion fee (%)",
+        "tax_rate": "Capital-gains tax (%)",
+        "lot_method": "Tax basis for sales",
+        "lot_fifo": "FIFO", "lot_average": "Average cost",
+        "fees_taxes": "Costs: {sym}{fees:,.2f} • Taxes: {sym}{taxes:,.2f}",
         "equity_weight": "Equities (%)",
         "bond_weight": "Bonds (%)",
         "crypto_weight": "Crypto (%)",
@@ -151,6 +217,12 @@ LANGS = {
         "total_title": "Total portfolio value",
         "date": "Date", "component": "Component", "hover_total": "Total",
         "last12": "Data (last 12 months)",
+        "projection": "{years}-year projection (Monte Carlo)",
+        "projection_note": "{paths:,} scenarios resampling 12-month blocks of history. Median: {sym}{p50:,.0f} • 5–95% range: {sym}{p5:,.0f} – {sym}{p95:,.0f} • Contributed: {sym}{contrib:,.0f}",
+        "projection_years": "Years",
+        "entry_dates": "Sensitivity to the start date (CAGR)",
+        "entry_dates_note": "Each cell is the same portfolio started in that month and held for that many years. Worst {years}-year CAGR: {worst:.2%} • Best: {best:.2%}",
+        "entry_start": "Start month",
         "glossary": "How to read the results",
         "glossary_text": "Month-end values: Equity, Bond, Crypto, Cash and **Total** (sum).",
         "pdf_btn": "📄 Download PDF report",
@@ -172,6 +244,9 @@ currency = st.sidebar.selectbox(t(lang, "currency"), ["EUR", "USD"], index=0,
                                 format_func=lambda x: t(lang, "eur") if x=="EUR" else t(lang, "usd"))
 CURRENCY_SYMBOL = "€" if currency == "EUR" else "$"
 dark = st.sidebar.toggle(t(lang, "darkmode"), value=False)
+# Panel de depuración (también con ?debug=1): traza de esta ejecución por etapas
+debug = st.sidebar.toggle(t(lang, "debug"), value=st.query_params.get("debug") == "1")
+run_trace = telemetry.start_trace() if debug else telemetry.stop_trace()
 
 # --- HEADER con logo (robusto para SVG) ---
 from pathlib import Path
@@ -237,219 +312,8 @@ div.card { background:#111827; border:1px solid #1F2937; border-radius:14px;
 st.markdown(base_css + (dark_css if dark else ""), unsafe_allow_html=True)
 
 # ────────────────────────── DATOS / HELPERS ──────────────────────────
-@st.cache_data(show_spinner=False, ttl=3600)
-def yahoo_prices(ticker, start, end=None):
-    df = yf.download(ticker.strip(), start=start.strip(), end=end, progress=False, auto_adjust=True)
-    if df is None or df.empty:
-        return pd.Series(dtype=float)
-    s = df["Close"].dropna()
-    s.index = pd.to_datetime(s.index)
-    return s
-
-@st.cache_data(show_spinner=False, ttl=86400)
-def get_currency_of_ticker(ticker):
-    try:
-        info = yf.Ticker(ticker).fast_info
-        cur = getattr(info, "currency", None)
-        if cur:
-            return cur
-    except Exception:
-        pass
-    try:
-        cur = yf.Ticker(ticker).info.get("currency")
-        if cur:
-            return cur
-    except Exception:
-        pass
-    return "USD"
-
-def fx_pair(src, dst):
-    return None if src == dst else f"{src}{dst}=X"
-
-def convert_series_to(series, src_cur, dst_cur, start):
-    if src_cur == dst_cur:
-        return series
-    pair = fx_pair(src_cur, dst_cur)
-    fx = yahoo_prices(pair, start) if pair else pd.Series(dtype=float)
-    if fx.empty:
-        st.warning(f"FX no disponible para {src_cur}->{dst_cur} ({pair}). Se muestran valores sin convertir.")
-        return series
-    fx = fx.reindex(series.index).ffill().bfill()
-    return series * fx
-
-def has_history(ticker, start):
-    try:
-        return not yahoo_prices(ticker, start).empty
-    except Exception:
-        return False
-
-def first_available_month(ticker):
-    """Devuelve 'YYYY-MM-01' de la primera vela mensual disponible para el ticker (o None)."""
-    try:
-        df = yf.download(ticker.strip(), period="max", interval="1mo", progress=False, auto_adjust=True)
-        if df is None or df.empty:
-            return None
-        d0 = pd.to_datetime(df.index.min())
-        return f"{d0.year:04d}-{d0.month:02d}-01"
-    except Exception:
-        return None
-
-def recommend_tickers(kind, currency):
-    """kind: 'equity' | 'bond' | 'crypto'"""
-    if kind == "equity":
-        return ["VWRA.L", "VWCE.DE", "IWDA.AS", "VT", "ACWI"]
-    if kind == "bond":
-        return ["AGGU.L", "AGGH.MI", "BNDW", "IGLO.L", "IGLA.L"]
-    if kind == "crypto":
-        return ["BTC-USD", "ETH-USD"]
-    return []
-
-# precios con posibles fechas duplicadas → obtener float seguro
-def px_at(series, d):
-    v = series.loc[d]
-    if isinstance(v, pd.Series):
-        v = v.iloc[-1]
-    return float(v)
-
-@dataclass
-class Asset:
-    ticker: str
-    role: str   # 'equity' | 'bond' | 'crypto'
-    weight: float
-    currency: str
-
-def monthly_index_union(series_list):
-    idx = None
-    for s in series_list:
-        if s is None or s.empty:
-            continue
-        m = s.resample("M").last().index
-        idx = m if idx is None else idx.union(m)
-    return pd.DatetimeIndex([]) if idx is None else idx.sort_values()
-
-def simulate_dca_multi(assets, monthly_contribution, start, end, rebalance_months, display_currency):
-    native_prices = {a.ticker: yahoo_prices(a.ticker, start, end) for a in assets}
-    conv_prices = {}
-    for a in assets:
-        s = native_prices[a.ticker]
-        conv_prices[a.ticker] = convert_series_to(s, a.currency, display_currency, start) if not s.empty else s
-    if all(s.empty for s in conv_prices.values()):
-        return pd.DataFrame(), conv_prices
-
-    m_idx = monthly_index_union([s for s in conv_prices.values()])
-    if len(m_idx) == 0:
-        return pd.DataFrame(), conv_prices
-
-    prices_m = {t: s.reindex(m_idx).ffill() for t, s in conv_prices.items()}
-    shares = {a.ticker: 0.0 for a in assets}
-    cash = 0.0
-    target_w = {a.ticker: a.weight for a in assets}
-    role_by_ticker = {a.ticker: a.role for a in assets}
-    hist, months_since_reb = [], 0
-
-    for d in m_idx:
-        # aporte del mes
-        cash += monthly_contribution
-        # compra proporcional a pesos objetivo
-        for a in assets:
-            t = a.ticker
-            px = px_at(prices_m[t], d)
-            if px > 0:
-                alloc = monthly_contribution * target_w[t]
-                shares[t] += alloc / px
-
-        months_since_reb += 1
-        values = {t: shares[t] * px_at(prices_m[t], d) for t in shares}
-        port_value = sum(values.values()) + cash
-
-        # rebalanceo
-        if rebalance_months and months_since_reb >= rebalance_months and port_value > 0:
-            target_values = {t: target_w[t] * port_value for t in shares}
-            for t in shares:
-                px = px_at(prices_m[t], d)
-                if px > 0:
-                    diff = target_values[t] - values[t]
-                    shares[t] += diff / px
-            cash = 0.0
-            months_since_reb = 0
-            values = {t: shares[t] * px_at(prices_m[t], d) for t in shares}
-            port_value = sum(values.values()) + cash
-
-        row = {"date": d, "cash": cash, "total": port_value}
-        for t, val in values.items():
-            role = role_by_ticker[t]
-            if role == "equity":
-                row["equity_value"] = val
-            elif role == "bond":
-                row["bond_value"] = val
-            elif role == "crypto":
-                row["crypto_value"] = val
-        hist.append(row)
-
-    df = pd.DataFrame(hist).set_index("date")
-    for c in ["equity_value", "bond_value", "crypto_value"]:
-        if c not in df.columns:
-            df[c] = 0.0
-    return df, prices_m
-
-def perf_stats(series):
-    r = series.pct_change().dropna()
-    if r.empty:
-        return {"CAGR": 0.0, "Vol": 0.0, "MaxDD": 0.0, "Sharpe": 0.0}
-    years = (series.index[-1] - series.index[0]).days / 365.25
-    cagr = (series.iloc[-1] / series.iloc[0]) ** (1 / years) - 1 if years > 0 else 0.0
-    vol = r.std() * np.sqrt(12)
-    maxdd = (series / series.cummax() - 1.0).min()
-    sharpe = (r.mean() * 12) / vol if vol > 0 else 0.0
-    return {"CAGR": cagr, "Vol": vol, "MaxDD": maxdd, "Sharpe": sharpe}
-
-def risk_level(vol, maxdd):
-    if vol < 0.08 and maxdd > -0.15: return "Bajo / Low"
-    if vol <= 0.15 or maxdd >= -0.30: return "Medio / Medium"
-    return "Alto / High"
-
-def hhi_and_neff(weights):
-    w = np.array([max(0.0, v) for v in weights.values()], dtype=float)
-    if w.sum() <= 0:
-        return 0.0, 0.0
-    w = w / w.sum()
-    hhi = float(np.sum(w ** 2))
-    neff = float(1.0 / hhi) if hhi > 0 else 0.0
-    return hhi, neff
-
-def trend_is_bearish(ticker: str, start: str, display_currency: str) -> bool | None:
-    """
-    Devuelve:
-      True  -> bajista (precio < MA200)
-      False -> no bajista
-      None  -> datos insuficientes o NaN
-    """
-    s = yahoo_prices(ticker, start)
-    if s is None or s.empty:
-        return None
-
-    # Convertir a moneda objetivo
-    src_cur = get_currency_of_ticker(ticker)
-    s = convert_series_to(s, src_cur, display_currency, start)
-
-    # Necesitamos al menos 200 datos para MA200
-    if s is None or len(s.dropna()) < 200:
-        return None
-
-    # MA200 y último precio como floats seguros
-    ma200 = s.rolling(200).mean()
-    last_px = s.iloc[-1]
-    last_ma = ma200.iloc[-1]
-
-    try:
-        last_px_f = float(last_px)
-        last_ma_f = float(last_ma)
-    except Exception:
-        return None
-    if np.isnan(last_px_f) or np.isnan(last_ma_f):
-        return None
-
-    return bool(last_px_f < last_ma_f)
+# Datos, FX, motor, métricas y señales viven en core.py (importable sin Streamlit)
+
 # ────────────────────────── CONTROLES (SIDEBAR) ──────────────────────
 # Estado inicial para poder rellenar con botones
 for k, v in {
@@ -463,19 +327,31 @@ for k, v in {
 with st.sidebar:
     st.header(t(lang, "sidebar_header"))
     edad = st.number_input(t(lang, "age"), 18, 90, 18, step=1)
-    horizonte = st.slider(t(lang, "horizon"), 1, 30, 7)
+    horizonte = st.slider(t(lang, "horizon"), 1, 30, DEFAULTS["horizon"])
     tolerancia = st.slider(t(lang, "tolerance"), 1, 10, 7, help=t(lang, "tol_help"))
     st.caption(t(lang, "tol_help"))
     st.markdown('<div class="sidebar-spacer"></div>', unsafe_allow_html=True)
 
     aportacion = st.number_input(
         f"{t(lang,'monthly')} ({'€' if currency=='EUR' else '$'})",
-        1, 10000, 300, step=10, help=t(lang,"monthly_help")
+        1, 10000, DEFAULTS["monthly"], step=10, help=t(lang,"monthly_help")
     )
 
     reb_opts = [2, 4, 6, 8, 10, 12, t(lang, "reb_opt_none")]
     rebalanceo_opt = st.selectbox(t(lang, "rebalance"), reb_opts, index=2)
     rb = 0 if rebalanceo_opt == t(lang, "reb_opt_none") else int(rebalanceo_opt)
+
+    with st.expander(t(lang, "costs_header"), expanded=False):
+        costes_on = st.checkbox(t(lang, "costs_enable"), value=False)
+        comision = st.number_input(t(lang, "commission_pct"), 0.0, 5.0, 0.10, step=0.05, disabled=not costes_on)
+        comision_min = st.number_input(t(lang, "commission_min"), 0.0, 50.0, 1.0, step=0.5, disabled=not costes_on)
+        spread = st.number_input(t(lang, "spread_bps"), 0.0, 200.0, 10.0, step=5.0, disabled=not costes_on)
+        fx_fee = st.number_input(t(lang, "fx_fee"), 0.0, 3.0, 0.25, step=0.05, disabled=not costes_on)
+        impuesto = st.number_input(t(lang, "tax_rate"), 0.0, 50.0, 19.0, step=1.0, disabled=not costes_on)
+        metodo_lotes = st.selectbox(t(lang, "lot_method"), ["fifo", "average"],
+                                    format_func=lambda k: t(lang, f"lot_{k}"), disabled=not costes_on)
+    costes = CostModel(comision / 100, comision_min, spread, fx_fee / 100, impuesto / 100,
+                       metodo_lotes) if costes_on else None
     st.markdown('<div class="sidebar-spacer"></div>', unsafe_allow_html=True)
 
     st.subheader(t(lang, "profiles_header"))
@@ -489,12 +365,36 @@ with st.sidebar:
                           ["Conservador", "Moderado", "Agresivo"],
                           index=["Conservador","Moderado","Agresivo"].index(perfil_sugerido))
 
+    # Pesos optimizados con el histórico de los activos elegidos (modelo cacheado)
+    metodo = st.selectbox(t(lang, "weights_method"), ["profile", "target", "minvar", "rp"],
+                          format_func=lambda k: t(lang, f"weights_{k}"))
+    if metodo != "profile":
+        opt_tickers = [st.session_state["eq_ticker"], st.session_state["bd_ticker"]]
+        if st.session_state.get("include_crypto") and st.session_state.get("cr_ticker"):
+            opt_tickers.append(st.session_state["cr_ticker"])
+        try:
+            model = load_model(opt_tickers, [get_currency_of_ticker(tk) for tk in opt_tickers], currency)
+        except Exception:
+            model = None
+        if model is None:
+            st.caption(t(lang, "weights_unavailable"))
+        else:
+            if metodo == "minvar":
+                w_opt = min_variance(model)
+            elif metodo == "rp":
+                w_opt = risk_parity(model)
+            else:
+                w_opt = tolerance_weights(model, tolerancia)
+            st.caption(t(lang, "weights_note", n=model.n_obs, vol=model.vol(w_opt), ret=model.ret(w_opt)))
+            w_pct = [int(round(100 * x)) for x in w_opt] + [0]
+            w_equity, w_bond, w_crypto = w_pct[0], w_pct[1], w_pct[2]
+
     st.caption(t(lang, "custom_weights"))
     c1, c2, c3 = st.columns(3)
     with c1: w_equity = st.number_input(t(lang, "equity_weight"), 0, 100, w_equity, step=5)
     with c2: w_bond   = st.number_input(t(lang, "bond_weight"),   0, 100, w_bond,   step=5)
     with c3:
-        include_crypto = st.checkbox(t(lang, "crypto_enable"), value=False)
+        include_crypto = st.checkbox(t(lang, "crypto_enable"), value=False, key="include_crypto")
         w_crypto = st.number_input(t(lang, "crypto_weight"), 0, 100, w_crypto, step=5, disabled=not include_crypto)
 
     total_w = max(1, w_equity + w_bond + (w_crypto if include_crypto else 0))
@@ -513,17 +413,68 @@ with st.sidebar:
         colA, colB = st.columns(2)
         with colA:
             eq_sug = st.selectbox(t(lang, "suggest_eq"),
-                                  recommend_tickers("equity", currency), index=0)
+                                  suggest_tickers("equity", currency), index=0, format_func=ticker_label)
             if st.button(t(lang, "fill") + " (Equity)"):
                 st.session_state["eq_ticker"] = eq_sug
                 st.rerun()
         with colB:
             bd_sug = st.selectbox(t(lang, "suggest_bd"),
-                                  recommend_tickers("bond", currency), index=0)
+                                  suggest_tickers("bond", currency), index=0, format_func=ticker_label)
             if st.button(t(lang, "fill") + " (Bond)"):
                 st.session_state["bd_ticker"] = bd_sug
                 st.rerun()
 
+# ──────────────────────── FIGURAS (CACHEADAS) ─────────────────────────
+# La simulación se cachea en results.py; sus figuras, aquí, también en result_cache
+def construir_figuras(res, lang, dark, sym):
+    """Figuras de Plotly de unos resultados (dependen del idioma y del tema)."""
+    df_plot = res["df"].copy()
+    df_plot["date"] = df_plot.index
+
+    value_cols = [c for c in ["equity_value", "bond_value", "crypto_value"] if c in df_plot.columns]
+    seq_light = ["#16A34A", "#0EA5E9", "#F59E0B"]
+    seq_dark  = ["#34D399", "#60A5FA", "#FBBF24"]
+    seq = seq_dark if dark else seq_light
+    template = "plotly_dark" if dark else "plotly"
+    figs = {}
+
+    figs["comp"] = px.line(
+        df_plot, x="date", y=value_cols, template=template,
+        color_discrete_sequence=seq,
+        labels={"value": sym, "date": t(lang,"date"), "variable": t(lang,"component")},
+        title=t(lang, "components_title"),
+    )
+    figs["comp"].update_traces(mode="lines+markers",
+                               hovertemplate="%{x|%Y-%m-%d}<br>%{fullData.name}: "+sym+"%{y:,.2f}")
+
+    figs["total"] = px.line(
+        df_plot, x="date", y="total", template=template,
+        color_discrete_sequence=[seq[0]],
+        labels={"total": sym, "date": t(lang,"date")},
+        title=t(lang, "total_title"),
+    )
+    figs["total"].update_traces(mode="lines+markers",
+                                hovertemplate="%{x|%Y-%m-%d}<br>"+t(lang,"hover_total")+": "+sym+"%{y:,.2f}")
+
+    proj = res["proj"]
+    if not proj.bands.empty:
+        bands = proj.bands.copy()
+        bands["years"] = bands.index / 12
+        band_cols = [c for c in bands.columns if c.startswith("p")] + ["contributed"]
+        figs["proj"] = px.line(
+            bands, x="years", y=band_cols, template=template,
+            color_discrete_sequence=["#94A3B8", seq[1], seq[0], seq[1], "#94A3B8", seq[2]],
+            labels={"value": sym, "years": t(lang, "projection_years"), "variable": ""},
+        )
+
+    if not res["cagr_grid"].empty:
+        figs["entry"] = px.imshow(
+            res["cagr_grid"] * 100, aspect="auto", origin="lower", template=template,
+            color_continuous_scale="RdYlGn", color_continuous_midpoint=0,
+            labels={"x": t(lang, "projection_years"), "y": t(lang, "entry_start"), "color": "CAGR %"},
+        )
+    return figs
+
 run = st.button(t(lang, "simulate"))
 
 # ───────────────────────────── SIMULACIÓN ───────────────────────────
@@ -532,6 +483,7 @@ if run:
 
     # Verificación de histórico
     check_tickers = [eq_ticker, bd_ticker] + ([cr_ticker] if (cr_ticker and include_crypto) else [])
+    prefetch_simulation_data(check_tickers, start, currency)
     missing = [t for t in check_tickers if not has_history(t, start)]
     if missing:
         st.error(t(lang, "cant_simulate"))
@@ -582,19 +534,23 @@ if run:
     if include_crypto and cr_ticker:
         cr_cur = get_currency_of_ticker(cr_ticker)
         assets.append(Asset(cr_ticker, role="crypto", weight=(w_crypto_norm/100.0), currency=cr_cur))
+    remember_kinds({a.ticker: a.role for a in assets})      # para las sugerencias de otras sesiones
 
-    # Ejecutar simulación
+    # Ejecutar simulación (o reutilizar la de otra sesión con las mismas entradas y precios)
+    display_currency = "EUR" if currency == "EUR" else "USD"
     with st.spinner("Descargando datos y simulando..." if lang=="ES" else "Downloading data and simulating..."):
-        df, prices_m = simulate_dca_multi(
-            assets=assets,
-            monthly_contribution=float(aportacion),
-            start=start, end=None,
-            rebalance_months=rb,
-            display_currency=("EUR" if currency=="EUR" else "USD"),
-        )
-        if df is None or df.empty:
+        try:
+            res_key, res = resultados(assets, aportacion, start, rb, display_currency, costes, horizonte)
+        except FXUnavailable as e:
+            st.error(str(e))
+            st.stop()
+        if res is None:
             st.warning(t(lang, "no_data_range", start=start, today=today))
             st.stop()
+    with telemetry.stage("app.plotly"):
+        figs = RESULTS.get_or_compute(make_key("app.figuras", res_key, lang, dark, CURRENCY_SYMBOL),
+                                      lambda: construir_figuras(res, lang, dark, CURRENCY_SYMBOL))
+    df, stats, proj, cagr_grid = res["df"], res["stats"], res["proj"], res["cagr_grid"]
 
     st.success(t(lang, "sim_done"))
 
@@ -606,16 +562,17 @@ if run:
         aportado = float(df.shape[0] * float(aportacion))
         st.metric(t(lang, "final_value"), f"{CURRENCY_SYMBOL}{valor_final:,.2f}")
         st.metric(t(lang, "contributed"), f"{CURRENCY_SYMBOL}{aportado:,.2f}")
+        if costes is not None:
+            st.caption(t(lang, "fees_taxes", sym=CURRENCY_SYMBOL,
+                         fees=float(df["fees"].sum()), taxes=float(df["taxes"].sum())))
     with c2:
         st.subheader(t(lang, "metrics"))
-        stats = perf_stats(df["total"])
         st.write(f"{t(lang,'cagr')}: {stats['CAGR']*100:.2f}%")
         st.write(f"{t(lang,'vol')}: {stats['Vol']*100:.2f}%")
         st.write(f"{t(lang,'maxdd')}: {stats['MaxDD']*100:.2f}%")
         st.write(f"{t(lang,'sharpe')}: {stats['Sharpe']:.2f}")
         # nivel de riesgo
-        lvl = risk_level(stats["Vol"], stats["MaxDD"])
-        st.write(t(lang, "risk_level", level=lvl))
+        st.write(t(lang, "risk_level", level=res["risk"]))
 
     # ───────── Concentración ─────────
     st.subheader(t(lang, "concentration"))
@@ -623,6 +580,12 @@ if run:
     hhi, neff = hhi_and_neff({a.ticker: a.weight for a in assets})
     st.write(t(lang, "hhi", hhi=hhi, neff=neff))
 
+    # El PDF (cacheado por su contenido) se genera en segundo plano mientras se pintan señales y gráficos
+    informe = ReportData(BRAND_NAME, lang, perfil, float(aportacion), rebalanceo_opt, currency,
+                         {k: f"{v:.1f}%" for k, v in weights_pct.items()}, list(weights_pct.keys()),
+                         stats, valor_final, aportado, hhi, neff)
+    pdf_job = prefetch_pdf(informe)
+
     # ───────── Señales MA200 ─────────
     st.subheader(t(lang, "signals"))
     for a in assets:
@@ -636,34 +599,9 @@ if run:
 
     # ───────── Gráficos ─────────
     st.subheader(t(lang, "evolution"))
-    df_plot = df.copy()
-    df_plot["date"] = df_plot.index
-
-    value_cols = [c for c in ["equity_value", "bond_value", "crypto_value"] if c in df_plot.columns]
-    seq_light = ["#16A34A", "#0EA5E9", "#F59E0B"]
-    seq_dark  = ["#34D399", "#60A5FA", "#FBBF24"]
-    seq = seq_dark if dark else seq_light
-    template = "plotly_dark" if dark else "plotly"
-
-    fig_comp = px.line(
-        df_plot, x="date", y=value_cols, template=template,
-        color_discrete_sequence=seq,
-        labels={"value": CURRENCY_SYMBOL, "date": t(lang,"date"), "variable": t(lang,"component")},
-        title=t(lang, "components_title"),
-    )
-    fig_comp.update_traces(mode="lines+markers",
-                           hovertemplate="%{x|%Y-%m-%d}<br>%{fullData.name}: "+CURRENCY_SYMBOL+"%{y:,.2f}")
-    st.plotly_chart(fig_comp, use_container_width=True)
-
-    fig_tot = px.line(
-        df_plot, x="date", y="total", template=template,
-        color_discrete_sequence=[seq[0]],
-        labels={"total": CURRENCY_SYMBOL, "date": t(lang,"date")},
-        title=t(lang, "total_title"),
-    )
-    fig_tot.update_traces(mode="lines+markers",
-                          hovertemplate="%{x|%Y-%m-%d}<br>"+t(lang,"hover_total")+": "+CURRENCY_SYMBOL+"%{y:,.2f}")
-    st.plotly_chart(fig_tot, use_container_width=True)
+    with telemetry.stage("app.plotly"):
+        st.plotly_chart(figs["comp"], use_container_width=True)
+        st.plotly_chart(figs["total"], use_container_width=True)
 
     st.subheader(t(lang, "last12"))
     tail_cols = [c for c in ["equity_value", "bond_value", "crypto_value", "cash", "total"] if c in df.columns]
@@ -671,47 +609,64 @@ if run:
         df[tail_cols].tail(12).style.format({col: (lambda v: f"{CURRENCY_SYMBOL}{v:,.2f}") for col in tail_cols})
     )
 
+    # ───────── Proyección (Monte Carlo) ─────────
+    st.subheader(t(lang, "projection", years=horizonte))
+    if "proj" not in figs:
+        st.caption("No hay datos suficientes" if lang=="ES" else "Insufficient data")
+    else:
+        with telemetry.stage("app.plotly"):
+            st.plotly_chart(figs["proj"], use_container_width=True)
+        st.caption(t(lang, "projection_note", paths=proj.n_paths, sym=CURRENCY_SYMBOL,
+                     p50=proj.final["p50"], p5=proj.final["p5"], p95=proj.final["p95"],
+                     contrib=proj.contributed))
+
+    # ───────── Todas las fechas de entrada ─────────
+    st.subheader(t(lang, "entry_dates"))
+    if "entry" not in figs:
+        st.caption("No hay datos suficientes" if lang=="ES" else "Insufficient data")
+    else:
+        with telemetry.stage("app.plotly"):
+            st.plotly_chart(figs["entry"], use_container_width=True)
+        longest = cagr_grid.columns[-1]
+        st.caption(t(lang, "entry_dates_note", years=longest,
+                     worst=cagr_grid[longest].min(), best=cagr_grid[longest].max()))
+
     # ───────── PDF ─────────
-    def generar_pdf(buffer, brand, lang, perfil, aportacion, rebalanceo_opt, currency,
-                    weights_pct, tickers, stats, valor_final, aportado, hhi, neff):
-        c = canvas.Canvas(buffer, pagesize=A4)
-        W, H = A4; x, y = 2*cm, H - 2*cm
-        c.setFont("Helvetica-Bold", 16)
-        c.drawString(x, y, f"{brand} — {'Informe de Simulación' if lang=='ES' else 'Simulation Report'}")
-        y -= 1.2*cm; c.setFont("Helvetica", 11)
-        c.drawString(x, y, (f"Fecha: {datetime.now():%Y-%m-%d %H:%M}" if lang=='ES' else f"Date: {datetime.now():%Y-%m-%d %H:%M}"))
-        y -= 0.8*cm
-        line1 = (f"Perfil: {perfil}  |  Aportación: {('€' if currency=='EUR' else '$')}{aportacion:,.2f}  |  Rebalanceo: {rebalanceo_opt}"
-                 if lang=='ES' else
-                 f"Profile: {perfil}  |  Monthly: {('€' if currency=='EUR' else '$')}{aportacion:,.2f}  |  Rebalancing: {rebalanceo_opt}")
-        c.drawString(x, y, line1); y -= 0.8*cm
-        c.drawString(x, y, f"Moneda: {currency}  |  Pesos: {weights_pct}"); y -= 0.6*cm
-        c.drawString(x, y, f"Tickers: {tickers}"); y -= 1.0*cm
-        c.setFont("Helvetica-Bold", 12); c.drawString(x, y, ("Resultados" if lang=='ES' else "Results")); y -= 0.8*cm
-        c.setFont("Helvetica", 11)
-        c.drawString(x, y, (f"Valor final: {('€' if currency=='EUR' else '$')}{valor_final:,.2f}" if lang=='ES' else f"Final value: {('€' if currency=='EUR' else '$')}{valor_final:,.2f}")); y -= 0.6*cm
-        c.drawString(x, y, (f"Aportado: {('€' if currency=='EUR' else '$')}{aportado:,.2f}" if lang=='ES' else f"Contributed: {('€' if currency=='EUR' else '$')}{aportado:,.2f}")); y -= 0.6*cm
-        c.drawString(x, y, f"CAGR: {stats['CAGR']*100:.2f}%  |  Vol: {stats['Vol']*100:.2f}%"); y -= 0.6*cm
-        c.drawString(x, y, f"MaxDD: {stats['MaxDD']*100:.2f}%  |  Sharpe: {stats['Sharpe']:.2f}"); y -= 0.6*cm
-        c.drawString(x, y, (f"Concentración (HHI): {hhi:.3f}  |  Nº efectivo: {neff:.2f}" if lang=='ES' else
-                            f"Concentration (HHI): {hhi:.3f}  |  Effective N: {neff:.2f}"))
-        y -= 1.0*cm; c.setFont("Helvetica-Oblique", 9)
-        c.drawString(x, y, ("Nota: Simulación educativa. No es asesoramiento financiero ni mueve dinero real."
-                            if lang=='ES' else
-                            "Note: Educational simulation. Not financial advice and no real money is moved."))
-        c.showPage(); c.save()
-
-    pdf_buffer = io.BytesIO()
-    generar_pdf(pdf_buffer, BRAND_NAME, lang, perfil, float(aportacion), rebalanceo_opt, currency,
-                {k: f"{v:.1f}%" for k, v in weights_pct.items()}, list(weights_pct.keys()),
-                stats, valor_final, aportado, hhi, neff)
+    # Bytes del render lanzado arriba (normalmente ya terminado al llegar aquí)
     st.download_button(
         label=t(lang, "pdf_btn"),
-        data=pdf_buffer.getvalue(),
+        data=pdf_job.result(),
         file_name=f"{BRAND_NAME}_report_{datetime.now():%Y%m%d_%H%M}.pdf",
         mime="application/pdf"
     )
 
+    # ───────── Métricas / depuración ─────────
+    if telemetry.METRICS_FILE:
+        try:
+            telemetry.export(telemetry.METRICS_FILE)
+        except OSError:
+            pass
+    if debug:
+        st.subheader(t(lang, "debug_header"))
+        st.dataframe(pd.DataFrame(run_trace.stages()).set_index("stage").style.format(
+            {"total_ms": "{:,.1f}", "max_ms": "{:,.1f}", "bytes": "{:,.0f}"}))
+        st.caption(t(lang, "debug_note", ms=run_trace.elapsed() * 1e3))
+        cs = RESULTS.stats()
+        st.caption(t(lang, "debug_cache", hits=cs["memory_hits"] + cs["disk_hits"],
+                     lookups=cs["memory_hits"] + cs["disk_hits"] + cs["misses"], rate=cs["hit_rate"],
+                     entries=cs["entries"], mb=cs["bytes"] / 2**20))
+        sched = warmup.current()
+        if sched is not None:
+            st.caption(t(lang, "debug_warmup"))
+            st.dataframe(pd.DataFrame(sched.freshness()).set_index("job"))
+        d1, d2 = st.columns(2)
+        with d1:
+            st.download_button(t(lang, "debug_json"), telemetry.to_json(), "fincontrol_metrics.json",
+                               mime="application/json")
+        with d2:
+            st.download_button(t(lang, "debug_prom"), telemetry.to_prometheus(), "fincontrol_metrics.prom",
+                               mime="text/plain")
+
 # ────────────────────────── GLOSARIO / FEEDBACK ─────────────────────
 st.divider()
 st.subheader(t(lang, "glossary"))
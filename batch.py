@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Valoración por lotes de carteras de clientes (registros tipo
+robo.PortfolioConfig) desde JSONL o CSV.
+
+    python batch.py clientes.jsonl --out resultados/ --workers 8
+    python batch.py clientes.jsonl --out resultados/ --reports      # + un PDF por cliente
+
+1. Primera pasada en streaming: tickers únicos y fecha de inicio mínima.
+2. Cada serie se carga una sola vez (price_store, descarga agrupada) en el
+   panel de precios canónico (price_panel), que los workers abren con mmap:
+   solo lectura y sin copias por proceso, las mismas páginas que la app.
+3. Las simulaciones se reparten en un pool de procesos con una ventana acotada
+   de tareas pendientes, y los resultados se van escribiendo en Parquet
+   (history.parquet y stats.parquet). La memoria no crece con el nº de clientes.
+4. Con `--reports` cada worker genera además el informe PDF de sus clientes
+   (report.render_pdf) y lo escribe directamente en out/reports/: al proceso
+   principal solo vuelve el resumen.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import asdict, fields
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+
+import price_panel
+import robo
+import telemetry
+from core import hhi_and_neff, perf_stats
+from price_store import load_prices_many, read_store
+
+HISTORY_COLUMNS = ["equity_value", "bond_value", "cash", "total"]
+STATS_COLUMNS = ["CAGR", "Vol", "MaxDD", "Sharpe"]
+_FIELD_TYPES = {f.name: f.type for f in fields(robo.PortfolioConfig)}
+
+# ─────────────────────────────────────────────────────────────────────
+# Entrada
+# ─────────────────────────────────────────────────────────────────────
+def _coerce(name, value):
+    if value is None or value == "":
+        return None if name == "end" else robo.PortfolioConfig.__dataclass_fields__[name].default
+    kind = _FIELD_TYPES[name]
+    if kind in (float, "float"):
+        return float(value)
+    if kind in (int, "int"):
+        return int(float(value))
+    return str(value).strip()
+
+def read_configs(path):
+    """
+    Genera (client_id, PortfolioConfig, None) leyendo JSONL o CSV línea a
+    línea; un registro mal formado da (client_id, None, error) en lugar de
+    cortar la lectura.
+    """
+    path = Path(path)
+    with path.open(encoding="utf-8", newline="") as fh:
+        if path.suffix.lower() == ".csv":
+            rows = csv.DictReader(fh)
+        else:
+            rows = (line for line in fh if line.strip())
+        for i, row in enumerate(rows):
+            client_id = str(i)
+            try:
+                row = json.loads(row) if isinstance(row, str) else row
+                client_id = str(row.get("client_id") or row.get("id") or i)
+                kwargs = {k: _coerce(k, v) for k, v in row.items() if k in _FIELD_TYPES}
+                cfg = robo.PortfolioConfig(**kwargs)
+            except (ValueError, TypeError, AttributeError) as e:
+                yield client_id, None, f"registro no válido: {type(e).__name__}: {e}"
+                continue
+            yield client_id, cfg, None
+
+def scan(path):
+    """Primera pasada: tickers únicos, inicio más temprano y nº de clientes (también los no válidos)."""
+    tickers, start, n = set(), None, 0
+    for _, cfg, error in read_configs(path):
+        n += 1
+        if error is not None:
+            continue
+        tickers.update((cfg.equity_ticker, cfg.bond_ticker))
+        start = cfg.start if start is None else min(start, cfg.start)
+    return sorted(tickers), start, n
+
+# ─────────────────────────────────────────────────────────────────────
+# Panel de precios compartido (memoria mapeada, solo lectura)
+# ─────────────────────────────────────────────────────────────────────
+def build_panel(tickers, start):
+    """Carga (o descarga) los tickers en el panel canónico; devuelve su directorio para los workers."""
+    load_prices_many(tickers, start)
+    return price_panel.panel_dir()
+
+_PANEL = {}
+
+def _init_worker(panel_dir, dtype, reports=None):
+    price_panel.configure(panel_dir, dtype)
+    _PANEL["reports"] = reports
+    _PANEL["series"] = {}
+
+def _column(ticker):
+    s = _PANEL["series"].get(ticker)
+    if s is None:
+        # Sin columna en el panel (no se pudo escribir): la serie del almacén, en memoria del worker
+        hit = price_panel.read(ticker)
+        s = _PANEL["series"][ticker] = hit[0] if hit is not None else read_store(ticker)[0]
+    return s
+
+def _panel_slice(tickers, start, end):
+    return price_panel.window([(t, _column(t)) for t in tickers], start, end)
+
+def _summary(client_id, equity_ticker=None, bond_ticker=None, error=None):
+    """Fila de stats.parquet sin resultados (se completa si la simulación sale bien)."""
+    return {"client_id": client_id, "equity_ticker": equity_ticker, "bond_ticker": bond_ticker,
+            "months": 0, "final_value": np.nan, "contributed": np.nan,
+            **{k: np.nan for k in STATS_COLUMNS}, "error": error}
+
+def simulate_client(item):
+    """Se ejecuta en el worker: (client_id, cfg) → (client_id, historial, métricas)."""
+    client_id, cfg_dict = item
+    cfg = robo.PortfolioConfig(**cfg_dict)
+    summary = _summary(client_id, cfg.equity_ticker, cfg.bond_ticker)
+    try:
+        prices = _panel_slice([cfg.equity_ticker, cfg.bond_ticker], cfg.start, cfg.end)
+        df, _ = robo.simulate_dca(cfg, prices=prices)
+    except Exception as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+        return client_id, None, summary
+    first = None if df.empty else df["total"].first_valid_index()
+    if first is None:
+        summary["error"] = "sin datos"
+        return client_id, None, summary
+    # Métricas desde la primera fila con valor (una fila inicial sin precio daría CAGR = NaN)
+    summary.update(perf_stats(df["total"].loc[first:]))
+    summary.update(months=len(df), final_value=float(df["total"].iloc[-1]),
+                   contributed=len(df) * cfg.monthly_contribution)
+    hist = {"date": df.index.values, **{c: df[c].to_numpy() for c in HISTORY_COLUMNS}}
+    if _PANEL.get("reports"):
+        try:
+            write_report(client_id, cfg, summary, **_PANEL["reports"])
+        except Exception as e:
+            summary["error"] = f"informe: {type(e).__name__}: {e}"
+    return client_id, hist, summary
+
+# ─────────────────────────────────────────────────────────────────────
+# Informes PDF
+# ─────────────────────────────────────────────────────────────────────
+def _profile_name(cfg, lang):
+    for name, weights in robo.PROFILE_WEIGHTS.items():
+        if np.allclose(weights, (cfg.equity_weight, cfg.bond_weight)):
+            return name
+    return "Personalizado" if lang == "ES" else "Custom"
+
+def write_report(client_id, cfg, summary, out_dir, lang="ES", currency="EUR", brand="Fincontrol"):
+    """PDF del cliente en out_dir/<client_id>.pdf (escritura atómica, sin pasar por la caché)."""
+    from report import ReportData, render_pdf
+
+    weights = {cfg.equity_ticker: cfg.equity_weight, cfg.bond_ticker: cfg.bond_weight}
+    hhi, neff = hhi_and_neff(weights)
+    total_w = sum(weights.values()) or 1.0
+    reb = cfg.rebalance_months or ("Sin rebalanceo" if lang == "ES" else "No rebalancing")
+    data = ReportData(brand, lang, _profile_name(cfg, lang), cfg.monthly_contribution, reb, currency,
+                      {k: f"{100 * v / total_w:.1f}%" for k, v in weights.items()}, list(weights),
+                      {k: summary[k] for k in STATS_COLUMNS}, summary["final_value"], summary["contributed"],
+                      hhi, neff)
+    path = Path(out_dir) / f"{quote(client_id, safe='')}.pdf"
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(render_pdf(data))
+    os.replace(tmp, path)
+    return path
+
+# ─────────────────────────────────────────────────────────────────────
+# Salida incremental a Parquet
+# ─────────────────────────────────────────────────────────────────────
+class ResultWriter:
+    """Acumula hasta `flush_every` clientes y los escribe como un row group."""
+
+    def __init__(self, out_dir, flush_every=256):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        self.hist_schema = pa.schema([("client_id", pa.string()), ("date", pa.timestamp("ns"))]
+                                     + [(c, pa.float64()) for c in HISTORY_COLUMNS])
+        self.stats_schema = pa.schema(
+            [("client_id", pa.string()), ("equity_ticker", pa.string()), ("bond_ticker", pa.string()),
+             ("months", pa.int64()), ("final_value", pa.float64()), ("contributed", pa.float64())]
+            + [(c, pa.float64()) for c in STATS_COLUMNS] + [("error", pa.string())])
+        self.hist = pq.ParquetWriter(out_dir / "history.parquet", self.hist_schema)
+        self.stats = pq.ParquetWriter(out_dir / "stats.parquet", self.stats_schema)
+        self.flush_every = flush_every
+        self._hist_buf, self._stats_buf = [], []
+
+    def add(self, client_id, hist, summary):
+        if hist is not None:
+            n = len(hist["date"])
+            self._hist_buf.append({"client_id": np.full(n, client_id, dtype=object), **hist})
+        self._stats_buf.append(summary)
+        if len(self._stats_buf) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        pa = self._pa
+        if self._hist_buf:
+            cols = {name: np.concatenate([h[name] for h in self._hist_buf]) for name in self.hist_schema.names}
+            self.hist.write_table(pa.Table.from_pydict(cols, schema=self.hist_schema))
+        if self._stats_buf:
+            cols = {name: [s[name] for s in self._stats_buf] for name in self.stats_schema.names}
+            self.stats.write_table(pa.Table.from_pydict(cols, schema=self.stats_schema))
+        self._hist_buf, self._stats_buf = [], []
+
+    def close(self):
+        self.flush()
+        self.hist.close()
+        self.stats.close()
+
+# ─────────────────────────────────────────────────────────────────────
+# Orquestación
+# ─────────────────────────────────────────────────────────────────────
+def run_batch(path, out_dir, workers=None, max_pending=None, flush_every=256, progress=True,
+              reports=False, lang="ES", currency="EUR"):
+    t0 = time.perf_counter()
+    tickers, start, n = scan(path)
+    if n == 0:
+        return {"clients": 0, "errors": 0, "seconds": 0.0}
+    out_dir = Path(out_dir)
+    panel_dir = build_panel(tickers, start) if tickers else price_panel.panel_dir()
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+    report_cfg = None
+    if reports:
+        (out_dir / "reports").mkdir(parents=True, exist_ok=True)
+        report_cfg = {"out_dir": str(out_dir / "reports"), "lang": lang, "currency": currency}
+
+    writer = ResultWriter(out_dir, flush_every)
+    errors = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(str(panel_dir), price_panel.DTYPE.str, report_cfg)) as pool:
+            pending, finished = set(), 0
+
+            def drain():
+                nonlocal pending, finished, errors
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    client_id, hist, summary = fut.result()
+                    errors += summary["error"] is not None
+                    writer.add(client_id, hist, summary)
+                finished += len(done)
+                if progress:
+                    print(f"\r{finished}/{n} clientes", end="", file=sys.stderr)
+
+            for client_id, cfg, error in read_configs(path):
+                if error is not None:
+                    # Registro mal formado: su fila de stats con el error, sin parar el lote
+                    errors += 1
+                    finished += 1
+                    writer.add(client_id, None, _summary(client_id, error=error))
+                    continue
+                pending.add(pool.submit(simulate_client, (client_id, asdict(cfg))))
+                if len(pending) >= max_pending:
+                    drain()
+            while pending:
+                drain()
+    finally:
+        writer.close()
+    if progress:
+        print(file=sys.stderr)
+    return {"clients": n, "tickers": len(tickers), "errors": errors,
+            "seconds": round(time.perf_counter() - t0, 3)}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("input", help="clientes en .jsonl o .csv (campos de robo.PortfolioConfig + client_id)")
+    ap.add_argument("--out", default="batch_output", help="directorio de salida")
+    ap.add_argument("--workers", type=int, default=None, help="procesos (por defecto, nº de CPUs)")
+    ap.add_argument("--max-pending", type=int, default=None, help="tareas en vuelo como máximo")
+    ap.add_argument("--flush-every", type=int, default=256, help="clientes por row group de Parquet")
+    ap.add_argument("--reports", action="store_true", help="genera además un PDF por cliente en OUT/reports/")
+    ap.add_argument("--lang", choices=["ES", "EN"], default="ES", help="idioma de los informes")
+    ap.add_argument("--report-currency", default="EUR",
+                    help="moneda que figura en los informes (las series no se convierten)")
+    ap.add_argument("--metrics", default=telemetry.METRICS_FILE,
+                    help="exporta tiempos y cachés de la carga de datos (.json o texto Prometheus)")
+    args = ap.parse_args(argv)
+    summary = run_batch(args.input, args.out, args.workers, args.max_pending, args.flush_every,
+                        reports=args.reports, lang=args.lang, currency=args.report_currency)
+    if args.metrics:
+        telemetry.export(args.metrics)
+    print(json.dumps(summary))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
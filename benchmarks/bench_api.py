@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Rendimiento de la API HTTP (api.py) con el mercado sintético y un almacén
+temporal: servidor en un hilo, workers en procesos (heredan el mercado
+sintético por fork) y clientes concurrentes con conexiones persistentes.
+
+    python -m benchmarks.bench_api --clients 16 --requests 2000 --workers 4
+
+1. Carga mixta: 70 % /simulate (unas pocas carteras distintas, como clientes
+   que repiten consultas), 10 % /stats, 10 % /signals y 10 % /sweep. Se mide
+   peticiones/s y p50/p95/p99 por endpoint.
+2. Streaming: el historial de /simulate en NDJSON (una línea de metadatos y
+   una por mes) y en Arrow (mismas filas y metadatos que en JSON).
+3. Contrapresión: ráfaga contra un servidor con 1 worker y cola de 1; deben
+   salir respuestas 503 (con Retry-After) y ningún otro error (tampoco
+   conexiones reseteadas).
+
+Sale con código 1 si alguna comprobación falla (o si no llega a --min-rps).
+"""
+import argparse
+import http.client
+import json
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlparse
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import api  # noqa: E402
+import price_store  # noqa: E402
+import ticker_index  # noqa: E402
+from benchmarks.synthetic import installed  # noqa: E402
+
+EQUITIES = [f"E{i:02d}.SY" for i in range(6)]
+BONDS = [f"B{i:02d}.SY" for i in range(3)]
+
+def _simulate_body(rng):
+    eq, bond = rng.choice(EQUITIES), rng.choice(BONDS)
+    w = rng.choice((0.5, 0.8))
+    return {"assets": [{"ticker": eq, "weight": w}, {"ticker": bond, "role": "bond", "weight": 1 - w}],
+            "monthly": rng.choice((200, 300)), "start": "2010-01-01", "rebalance": rng.choice((0, 6)),
+            "currency": rng.choice(("USD", "EUR"))}
+
+def _workload(rng):
+    """(endpoint, cuerpo) de la carga mixta."""
+    p = rng.random()
+    if p < 0.7:
+        return "simulate", _simulate_body(rng)
+    if p < 0.8:
+        return "stats", {"tickers": rng.sample(EQUITIES + BONDS, 3), "start": "2010-01-01", "currency": "EUR"}
+    if p < 0.9:
+        return "signals", {"tickers": rng.sample(EQUITIES, 4), "start": "2015-01-01", "currency": "USD"}
+    return "sweep", {"equity": rng.choice(EQUITIES), "bond": rng.choice(BONDS), "start": "2010-01-01",
+                     "contributions": [100, 300]}
+
+class Client:
+    """Conexión persistente (keep-alive) con el servidor."""
+
+    def __init__(self, url):
+        u = urlparse(url)
+        self.conn = http.client.HTTPConnection(u.hostname, u.port, timeout=120)
+
+    def post(self, path, body):
+        self.conn.request("POST", path, json.dumps(body), {"Content-Type": "application/json"})
+        r = self.conn.getresponse()
+        return r.status, r.read(), r
+
+    def close(self):
+        self.conn.close()
+
+# ─────────────────────────────────────────────────────────────────────
+# Carga mixta
+# ─────────────────────────────────────────────────────────────────────
+def _load(url, clients, requests, seed):
+    lat = defaultdict(list)
+    errors = []
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def worker(i):
+        rng = random.Random(seed + i)
+        c = Client(url)
+        try:
+            while True:
+                with lock:
+                    if next(counter, None) is None:
+                        return
+                name, body = _workload(rng)
+                t0 = time.perf_counter()
+                status, data, _ = c.post(f"/{name}", body)
+                ms = (time.perf_counter() - t0) * 1000
+                with lock:
+                    lat[name].append(ms)
+                    if status != 200:
+                        errors.append((name, status, data[:200].decode(errors="replace")))
+        finally:
+            c.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    t0 = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    wall = time.perf_counter() - t0
+    per = {name: {"n": len(v), "p50_ms": round(float(np.percentile(v, 50)), 1),
+                  "p95_ms": round(float(np.percentile(v, 95)), 1), "p99_ms": round(float(np.percentile(v, 99)), 1)}
+           for name, v in sorted(lat.items())}
+    return {"requests": requests, "clients": clients, "wall_s": round(wall, 2),
+            "rps": round(requests / wall, 1), "per_endpoint": per, "errors": errors[:5], "n_errors": len(errors)}
+
+# ─────────────────────────────────────────────────────────────────────
+# Streaming y contrapresión
+# ─────────────────────────────────────────────────────────────────────
+def _streaming(url):
+    import pyarrow as pa
+
+    body = _simulate_body(random.Random(0))
+    c = Client(url)
+    try:
+        _, data, _ = c.post("/simulate", body)
+        ref = json.loads(data)
+        _, nd, r_nd = c.post("/simulate?format=ndjson", body)
+        _, arrow, r_arrow = c.post("/simulate?format=arrow", body)
+    finally:
+        c.close()
+    lines = nd.decode().splitlines()
+    table = pa.ipc.open_stream(arrow).read_all()
+    meta = json.loads(table.schema.metadata[b"fincontrol"])
+    ref_meta = {k: v for k, v in ref.items() if k != "table"}
+    return {
+        "months": ref["months"], "ndjson_bytes": len(nd), "arrow_bytes": len(arrow), "json_bytes": len(data),
+        "checks": {
+            "ndjson_rows": len(lines) == ref["months"] + 1 and json.loads(lines[0])["meta"] == ref_meta,
+            "ndjson_chunked": r_nd.getheader("Transfer-Encoding") == "chunked",
+            "arrow_rows": table.num_rows == ref["months"] and meta == ref_meta,
+            "arrow_same_total": np.allclose(table.column("total").to_numpy(),
+                                        np.array(ref["table"]["total"], dtype=float), equal_nan=True),
+        },
+    }
+
+def _backpressure(burst=24):
+    srv = api.make_server(port=0, workers=1, queue_size=1, processes=False)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    statuses, retry_after = [], []
+    lock = threading.Lock()
+    body = {"equity": EQUITIES[0], "bond": BONDS[0], "start": "1990-01-01",
+            "contributions": list(range(100, 1100, 100))}
+
+    def hit():
+        c = Client(srv.url)
+        try:
+            status, _, r = c.post("/sweep", body)
+        except OSError as e:
+            # Conexión reseteada/rechazada: la contrapresión no llegó al handler, cuenta como fallo
+            status, r = type(e).__name__, None
+        finally:
+            c.close()
+        with lock:
+            statuses.append(status)
+            if status == 503:
+                retry_after.append(r.getheader("Retry-After"))
+
+    threads = [threading.Thread(target=hit) for _ in range(burst)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    pool = srv.pool.status()
+    srv.shutdown()
+    srv.server_close()
+    srv.pool.shutdown()
+    counts = {str(s): statuses.count(s) for s in sorted(set(statuses), key=str)}
+    return {"burst": burst, "statuses": counts, "pool": pool,
+            "checks": {"rejects_when_full": bool(counts.get("503", 0) and retry_after and all(retry_after)),
+                       "no_other_errors": set(statuses) <= {200, 503}}}
+
+# ─────────────────────────────────────────────────────────────────────
+# Orquestación
+# ─────────────────────────────────────────────────────────────────────
+def run(clients=16, requests=2000, workers=None, threads=False, seed=0):
+    with tempfile.TemporaryDirectory() as tmp, installed():
+        price_store.STORE_DIR = Path(tmp) / "prices"
+        ticker_index.configure(Path(tmp) / "tickers.sqlite")
+        # Precios en disco antes de arrancar los workers: todos leen el mismo panel
+        price_store.load_prices_many(EQUITIES + BONDS + ["USDEUR=X"], "1990-01-01")
+
+        srv = api.make_server(port=0, workers=workers, processes=not threads)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        try:
+            t0 = time.perf_counter()
+            _load(srv.url, max(1, clients // 2), min(requests, 200), seed + 1000)   # calienta cachés de cada worker
+            warm_s = time.perf_counter() - t0
+            load = _load(srv.url, clients, requests, seed)
+            stream = _streaming(srv.url)
+            pool = srv.pool.status()
+        finally:
+            srv.shutdown()
+            srv.server_close()
+            srv.pool.shutdown()
+        backpressure = _backpressure()
+
+    checks = {"no_errors": load["n_errors"] == 0, **stream["checks"], **backpressure["checks"]}
+    return {"workers": pool["workers"], "processes": pool["processes"], "warmup_s": round(warm_s, 2),
+            "load": load, "streaming": {k: v for k, v in stream.items() if k != "checks"},
+            "backpressure": {k: v for k, v in backpressure.items() if k != "checks"},
+            "checks": checks, "ok": all(checks.values())}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--clients", type=int, default=16, help="clientes concurrentes")
+    ap.add_argument("--requests", type=int, default=2000, help="peticiones en total")
+    ap.add_argument("--workers", type=int, default=None, help="workers de la API (por defecto, nº de CPUs)")
+    ap.add_argument("--threads", action="store_true", help="pool de hilos en vez de procesos")
+    ap.add_argument("--min-rps", type=float, default=0.0, help="falla si no se alcanza")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="guarda el resultado en JSON")
+    args = ap.parse_args(argv)
+
+    res = run(args.clients, args.requests, args.workers, args.threads, args.seed)
+    if args.min_rps:
+        res["checks"]["min_rps"] = res["load"]["rps"] >= args.min_rps
+        res["ok"] = all(res["checks"].values())
+    load = res["load"]
+    print(f"{res['workers']} {'procesos' if res['processes'] else 'hilos'} • {load['clients']} clientes • "
+          f"{load['requests']} peticiones en {load['wall_s']} s → {load['rps']:,.1f} peticiones/s "
+          f"({load['n_errors']} errores)")
+    for name, r in load["per_endpoint"].items():
+        print(f"  {name:9s} n={r['n']:5d}  p50 {r['p50_ms']:7.1f} ms  p95 {r['p95_ms']:7.1f} ms  p99 {r['p99_ms']:7.1f} ms")
+    st = res["streaming"]
+    print(f"  historial de {st['months']} meses: JSON {st['json_bytes']:,} B • NDJSON {st['ndjson_bytes']:,} B • "
+          f"Arrow {st['arrow_bytes']:,} B")
+    print(f"  ráfaga de {res['backpressure']['burst']} con 1 worker y cola 1: {res['backpressure']['statuses']}")
+    for name, ok in res["checks"].items():
+        print(f"  {'ok ' if ok else 'FALLO'} {name}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(res, indent=2), encoding="utf-8")
+    return 0 if res["ok"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
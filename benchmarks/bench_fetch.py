@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Carga concurrente sobre la capa de acceso a Yahoo (fetch) contra el servidor
+local de benchmarks/stub_yahoo.py: muchas sesiones piden a la vez precios,
+moneda y primera fecha de los mismos tickers.
+
+    python -m benchmarks.bench_fetch
+    python -m benchmarks.bench_fetch --sessions 64 --latency 0.2 --fail-first 2
+
+Imprime las peticiones que llegan al servidor por ticker, las resueltas por
+single-flight, los reintentos y el tiempo total. Sale con código 1 si alguna
+sesión falla o si llegan al servidor más peticiones de las esperadas (3 por
+ticker —precios, moneda y primera fecha— más los fallos inyectados).
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import fetch  # noqa: E402
+import telemetry  # noqa: E402
+from benchmarks.stub_yahoo import serving  # noqa: E402
+
+TICKERS = ("VWRA.L", "AGGU.L", "BTC-USD", "EURUSD=X")
+START = "2015-01-01"
+END = "2024-01-01"
+
+def _session(barrier, errors):
+    barrier.wait()
+    try:
+        fetch.download(TICKERS, START, END)
+        for t in TICKERS:
+            fetch.currency(t)
+            fetch.first_date(t)
+    except Exception as e:
+        errors.append(repr(e))
+
+def run(sessions=32, latency=0.1, fail_first=1, connections=fetch.MAX_CONNECTIONS, rate=fetch.RATE):
+    with serving(latency=latency, fail_first=fail_first) as stub:
+        fetch.configure(stub.url, max_connections=connections, rate=rate, backoff=0.05)
+        barrier = threading.Barrier(sessions)
+        errors = []
+        threads = [threading.Thread(target=_session, args=(barrier, errors)) for _ in range(sessions)]
+        t0 = time.perf_counter()
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        wall = time.perf_counter() - t0
+        upstream = stub.counts()
+    stats = dict(fetch.fetcher().stats)
+    fetch.configure(None)
+    limit = 3 + fail_first
+    return {
+        "sessions": sessions, "tickers": len(TICKERS), "latency_s": latency, "fail_first": fail_first,
+        "calls": stats["calls"], "coalesced": stats["coalesced"], "requests": stats["requests"],
+        "retries": stats["retries"], "failures": stats["failures"], "upstream": upstream,
+        "upstream_total": sum(upstream.values()), "wall_s": round(wall, 3),
+        "errors": errors[:5], "ok": not errors and all(n <= limit for n in upstream.values()),
+    }
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sessions", type=int, default=32)
+    ap.add_argument("--latency", type=float, default=0.1, help="segundos por petición en el servidor")
+    ap.add_argument("--fail-first", type=int, default=1, help="429/503 antes de responder, por ticker")
+    ap.add_argument("--connections", type=int, default=fetch.MAX_CONNECTIONS)
+    ap.add_argument("--rate", type=float, default=fetch.RATE, help="peticiones/s al host (0 = sin límite)")
+    ap.add_argument("--out", help="guarda el resultado en JSON")
+    args = ap.parse_args(argv)
+
+    telemetry.reset()
+    res = run(args.sessions, args.latency, args.fail_first, args.connections, args.rate)
+    print(f"{res['sessions']} sesiones × {res['tickers']} tickers: {res['calls']} llamadas, "
+          f"{res['coalesced']} compartidas en vuelo, {res['requests']} ejecutadas "
+          f"({res['retries']} reintentos), {res['upstream_total']} en el servidor, {res['wall_s']:.2f} s")
+    for t, n in sorted(res["upstream"].items()):
+        print(f"  {t:10s} {n}")
+    for e in res["errors"]:
+        print(f"  error: {e}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(res, indent=2), encoding="utf-8")
+    return 0 if res["ok"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
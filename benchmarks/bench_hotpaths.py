@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks de los caminos calientes (simulación, métricas, concentración y
+señales) con datos sintéticos, sin conexión.
+
+    python -m benchmarks.bench_hotpaths --out bench.json
+    python -m benchmarks.bench_hotpaths --out rama.json --compare bench.json
+
+Antes de medir se comprueba que las señales no dependen de llamadas
+anteriores (motor nuevo frente a reutilizado); si falla se sale con código 1.
+Con `--compare` se imprime el cociente tiempo_actual / tiempo_base por caso y
+se sale con código 1 si alguno supera `--threshold` (regresión).
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import price_store  # noqa: E402
+import ticker_index  # noqa: E402
+from benchmarks.synthetic import HISTORY_END, installed  # noqa: E402
+from engine import Calendar  # noqa: E402
+from result_cache import ResultCache, make_key  # noqa: E402
+
+YEARS = (10, 30, 50)
+ASSET_COUNTS = (2, 10, 30, 50)
+FREQS = ("daily", "monthly")
+QUICK = {"years": (10,), "assets": (2, 10), "freqs": FREQS}
+
+def _tickers(n, freq):
+    suffix = ".M" if freq == "monthly" else ".D"
+    return [f"SYN{i:02d}{suffix}" for i in range(n)]
+
+def _start(years):
+    return (pd.Timestamp(HISTORY_END) - pd.DateOffset(years=years)).strftime("%Y-%m-%d")
+
+def _series(years, freq):
+    n = years * (12 if freq == "monthly" else 252)
+    idx = pd.date_range(end=HISTORY_END, periods=n, freq="ME" if freq == "monthly" else "B")
+    rng = np.random.default_rng(years)
+    return pd.Series(1000 * np.exp(np.cumsum(rng.normal(0.004, 0.03, n))), index=idx)
+
+def timeit(fn, repeat):
+    fn()  # calentamiento (descarga sintética + caché de precios)
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return {"repeat": repeat, "min_s": min(times), "median_s": statistics.median(times),
+            "mean_s": statistics.fmean(times)}
+
+def _cached_simulation(core, cache, assets, start):
+    """Simulación repetida: huella de los precios + clave + acierto en la caché de resultados."""
+    version = core.price_version([a.ticker for a in assets], [a.currency for a in assets], start, "EUR")
+    key = make_key("bench.simulate_dca_multi", assets, 300.0, start, 6, "EUR", version)
+    return cache.get_or_compute(key, lambda: core.simulate_dca_multi(assets, 300.0, start, None, 6, "EUR"))
+
+def cases(core, robo, grid):
+    """(nombre, parámetros, función) de cada caso del benchmark."""
+    cache = ResultCache(disk_dir=None)
+    for freq in grid["freqs"]:
+        for years in grid["years"]:
+            start = _start(years)
+            for n in grid["assets"]:
+                tks = _tickers(n, freq)
+                assets = [core.Asset(t, role=("equity", "bond", "crypto")[i % 3], weight=1.0 / n, currency="USD")
+                          for i, t in enumerate(tks)]
+                yield ("core.simulate_dca_multi", {"freq": freq, "years": years, "assets": n},
+                       lambda a=assets, s=start: core.simulate_dca_multi(a, 300.0, s, None, 6, "EUR"))
+                yield ("result_cache.simulate_dca_multi", {"freq": freq, "years": years, "assets": n},
+                       lambda a=assets, s=start: _cached_simulation(core, cache, a, s))
+                if freq == "daily":
+                    yield ("core.simulate_dca_daily", {"freq": freq, "years": years, "assets": n},
+                           lambda a=assets, s=start: core.simulate_dca_daily(
+                               a, 75.0, s, None, "EUR", Calendar("weekly"), Calendar("monthly", day=15)))
+            eq, bd = _tickers(2, freq)
+            cfg = robo.PortfolioConfig(eq, bd, 0.6, 0.4, 300.0, 6, start, None)
+            yield ("robo.simulate_dca", {"freq": freq, "years": years, "assets": 2},
+                   lambda c=cfg: robo.simulate_dca(c))
+            series = _series(years, freq)
+            yield ("core.perf_stats", {"freq": freq, "years": years}, lambda s=series: core.perf_stats(s))
+            yield ("robo.performance_stats", {"freq": freq, "years": years},
+                   lambda s=series: robo.performance_stats(s))
+            yield ("core.trend_is_bearish", {"freq": freq, "years": years},
+                   lambda t=eq, s=start: core.trend_is_bearish(t, s, "EUR"))
+    for n in grid["assets"]:
+        tks = _tickers(n, "daily")
+        yield ("core.screen_watchlist", {"freq": "daily", "assets": n},
+               lambda t=tks: core.screen_watchlist(t, _start(max(grid["years"])), "EUR"))
+    for n in grid["assets"]:
+        weights = {f"SYN{i:02d}": 1.0 / n for i in range(n)}
+        yield ("core.hhi_and_neff", {"assets": n}, lambda w=weights: core.hhi_and_neff(w))
+
+def check_signals(core, tickers, starts):
+    """
+    screen_watchlist con el último inicio debe dar las mismas filas con un motor
+    de señales nuevo que tras llamadas previas con inicios anteriores.
+    """
+    core._SIGNAL_ENGINES.clear()
+    fresh = core.screen_watchlist(tickers, starts[-1], "EUR")
+    core._SIGNAL_ENGINES.clear()
+    for start in starts:
+        core.screen_watchlist(tickers, start, "EUR")
+    reused = core.screen_watchlist(tickers, starts[-1], "EUR")
+    return fresh.equals(reused)
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def run(grid, repeat):
+    warnings.simplefilter("ignore", FutureWarning)
+    with tempfile.TemporaryDirectory() as store, installed() as market:
+        price_store.STORE_DIR = Path(store)
+        ticker_index.configure(Path(store) / "tickers.sqlite")     # no mezclar con el índice real
+        import core
+        import robo
+        starts = [_start(y) for y in sorted(set(grid["years"]) | {1}, reverse=True)]
+        checks = {"signals_fresh_vs_reused": check_signals(core, _tickers(2, "daily"), starts)}
+        for name, ok in checks.items():
+            print(f"{'check ' + name:79s} {'ok' if ok else 'FALLA'}", flush=True)
+        results = []
+        for name, params, fn in cases(core, robo, grid):
+            res = {"name": name, "case": params, **timeit(fn, repeat)}
+            results.append(res)
+            print(f"{name:28s} {json.dumps(params):50s} {res['median_s'] * 1e3:10.2f} ms", flush=True)
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "downloads": len(market.calls),
+        },
+        "checks": checks,
+        "results": results,
+    }
+
+def _key(r):
+    return r["name"], json.dumps(r["case"], sort_keys=True)
+
+def compare(current, baseline, threshold):
+    """Imprime los cocientes contra `baseline`; devuelve los casos que empeoran más de `threshold`."""
+    base = {_key(r): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        b = base.get(_key(r))
+        if b is None or b["median_s"] <= 0:
+            continue
+        ratio = r["median_s"] / b["median_s"]
+        flag = "  ← REGRESIÓN" if ratio > threshold else ""
+        print(f"{r['name']:28s} {_key(r)[1]:50s} x{ratio:6.2f}{flag}")
+        if ratio > threshold:
+            regressions.append((r, ratio))
+    return regressions
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--out", default="bench_output.json", help="fichero JSON de resultados")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--quick", action="store_true", help="solo 10 años y 2/10 activos")
+    ap.add_argument("--compare", help="JSON de referencia (p.ej. de otra rama)")
+    ap.add_argument("--threshold", type=float, default=1.25, help="cociente máximo tolerado frente a la referencia")
+    args = ap.parse_args(argv)
+
+    grid = QUICK if args.quick else {"years": YEARS, "assets": ASSET_COUNTS, "freqs": FREQS}
+    report = run(grid, args.repeat)
+    Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nResultados en {args.out}")
+    failed = [name for name, ok in report["checks"].items() if not ok]
+    if failed:
+        print(f"\nComprobaciones fallidas: {', '.join(failed)}")
+        return 1
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} caso(s) más lentos que x{args.threshold:.2f} frente a {args.compare}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Panel de precios mapeado (price_panel.py) frente a copias por sesión y por
+proceso, con el mercado sintético y un almacén temporal.
+
+    python -m benchmarks.bench_panel --tickers 40 --sessions 1,5,20 --workers 4
+
+1. Sesiones (en un mismo proceso, como en Streamlit): cada una pide los
+   precios de todos los tickers y se los queda; se mide con tracemalloc la
+   memoria nueva por sesión con el panel (vistas) y con una copia por sesión
+   (lo que hacía `_slice` antes).
+2. Workers (procesos a la vez, como el pool de batch.py): cada uno lee todos
+   los tickers, los recorre y espera a los demás; se mide su memoria privada
+   y proporcional (PSS, /proc/self/smaps_rollup, solo Linux) con el panel y
+   con las series leídas del Parquet.
+3. float32: tamaño del panel y error relativo máximo frente a float64.
+
+Sale con código 1 si alguna comprobación falla.
+"""
+import argparse
+import gc
+import json
+import multiprocessing as mp
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import price_panel  # noqa: E402
+import price_store  # noqa: E402
+import ticker_index  # noqa: E402
+from benchmarks.synthetic import installed  # noqa: E402
+
+START = "1990-01-01"
+SMAPS = Path("/proc/self/smaps_rollup")
+
+def _tickers(n):
+    return [f"P{i:03d}.SY" for i in range(n)]
+
+def _smaps_kb():
+    out = {}
+    for line in SMAPS.read_text().splitlines()[1:]:
+        name, value = line.split(":", 1)
+        out[name] = int(value.split()[0])
+    return out
+
+# ─────────────────────────────────────────────────────────────────────
+# Sesiones
+# ─────────────────────────────────────────────────────────────────────
+def _sessions(tickers, n, copy):
+    """Bytes nuevos (tracemalloc) por sesión tras `n` sesiones que guardan sus series."""
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    kept = []
+    for _ in range(n):
+        got = {t: price_store.load_prices(t, START) for t in tickers}
+        kept.append({t: s.copy() for t, s in got.items()} if copy else got)
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return used / n, kept
+
+# ─────────────────────────────────────────────────────────────────────
+# Workers
+# ─────────────────────────────────────────────────────────────────────
+def _worker(mode, panel_dir, tickers, barrier, queue):
+    price_panel.configure(panel_dir)
+    read = (lambda t: price_panel.read(t)[0]) if mode == "panel" else (lambda t: price_store.read_store(t)[0])
+    read(tickers[0])                                                   # imports diferidos y cachés de pandas
+    gc.collect()
+    barrier.wait()                                                     # todos arrancados antes de medir
+    before = _smaps_kb()
+    series = [read(t) for t in tickers]
+    total = sum(float(np.nansum(s.to_numpy())) for s in series)      # toca todas las páginas
+    barrier.wait()                                                     # todos con sus series a la vez
+    after = _smaps_kb()
+    barrier.wait()
+    queue.put({"private_kb": (after["Private_Clean"] + after["Private_Dirty"])
+                             - (before["Private_Clean"] + before["Private_Dirty"]),
+               "pss_kb": after["Pss"] - before["Pss"], "checksum": total})
+
+def _workers(mode, panel_dir, tickers, n):
+    ctx = mp.get_context("fork")
+    barrier, queue = ctx.Barrier(n), ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(mode, str(panel_dir), tickers, barrier, queue)) for _ in range(n)]
+    for p in procs:
+        p.start()
+    rows = [queue.get(timeout=120) for _ in procs]
+    for p in procs:
+        p.join()
+    return {"private_kb": float(np.mean([r["private_kb"] for r in rows])),
+            "pss_kb": float(np.mean([r["pss_kb"] for r in rows])),
+            "checksums": {round(r["checksum"], 6) for r in rows}}
+
+# ─────────────────────────────────────────────────────────────────────
+# Orquestación
+# ─────────────────────────────────────────────────────────────────────
+def run(n_tickers=40, sessions=(1, 5, 20), workers=4):
+    tickers = _tickers(n_tickers)
+    checks = {}
+    with tempfile.TemporaryDirectory() as tmp, installed():
+        price_store.STORE_DIR = Path(tmp) / "prices"
+        ticker_index.configure(Path(tmp) / "tickers.sqlite")
+        price_panel.configure(None, "float64")
+        t0 = time.perf_counter()
+        price_store.load_prices_many(tickers, START)
+        load_s = time.perf_counter() - t0
+        panel_dir = price_panel.panel_dir()
+        data_kb = sum(p.stat().st_size for p in panel_dir.glob("*.f8.npy")) / 1024
+
+        a, b = price_store.load_prices(tickers[0], START), price_store.load_prices(tickers[0], START)
+        checks["zero_copy"] = price_panel.is_mapped(a) and np.shares_memory(a.to_numpy(), b.to_numpy())
+        stored, _ = price_store.read_store(tickers[0])
+        checks["same_values"] = a.index.equals(stored.index) and np.array_equal(a.to_numpy(), stored.to_numpy())
+
+        per_session = {}
+        for n in sessions:
+            shared, kept = _sessions(tickers, n, copy=False)
+            del kept
+            copied, kept = _sessions(tickers, n, copy=True)
+            del kept
+            per_session[n] = {"panel_kb": round(shared / 1024, 1), "copy_kb": round(copied / 1024, 1)}
+        checks["sessions_flat"] = all(r["panel_kb"] < 0.05 * r["copy_kb"] for r in per_session.values())
+
+        per_worker = None
+        if SMAPS.exists() and workers > 1:
+            per_worker = {mode: _workers(mode, panel_dir, tickers, workers) for mode in ("panel", "parquet")}
+            checks["workers_same_data"] = per_worker["panel"]["checksums"] == per_worker["parquet"]["checksums"]
+            checks["workers_shared"] = per_worker["panel"]["private_kb"] < 0.25 * data_kb
+            for r in per_worker.values():
+                r.pop("checksums")
+
+        # float32: otra columna por ticker en el mismo directorio
+        price_panel.configure(None, "float32")
+        for t in tickers:
+            s, meta = price_store.read_store(t)
+            price_panel.publish(t, s, meta)
+        data32_kb = sum(p.stat().st_size for p in panel_dir.glob("*.f4.npy")) / 1024
+        s32 = price_panel.read(tickers[0])[0]
+        rel_err = float(np.max(np.abs(s32.to_numpy(dtype=float) / stored.to_numpy() - 1.0)))
+        checks["float32_smaller"] = data32_kb < 0.8 * data_kb
+        checks["float32_error"] = rel_err < 1e-6
+        price_panel.configure(None, "float64")
+
+    return {
+        "tickers": n_tickers, "bars": len(stored), "load_s": round(load_s, 2),
+        "panel_kb": round(data_kb, 1), "panel_float32_kb": round(data32_kb, 1), "float32_rel_err": rel_err,
+        "per_session": per_session, "per_worker": per_worker, "workers": workers,
+        "checks": checks, "ok": all(checks.values()),
+    }
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tickers", type=int, default=40)
+    ap.add_argument("--sessions", default="1,5,20", help="nº de sesiones a medir, separados por comas")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--out", help="guarda el resultado en JSON")
+    args = ap.parse_args(argv)
+
+    res = run(args.tickers, tuple(int(x) for x in args.sessions.split(",")), args.workers)
+    print(f"{res['tickers']} tickers × {res['bars']} velas • panel {res['panel_kb']:,.0f} KB "
+          f"(float32: {res['panel_float32_kb']:,.0f} KB, error rel. máx. {res['float32_rel_err']:.1e})")
+    for n, r in res["per_session"].items():
+        print(f"  {n:3d} sesiones: {r['panel_kb']:9,.1f} KB/sesión con panel • {r['copy_kb']:9,.1f} KB/sesión copiando")
+    if res["per_worker"]:
+        for mode, r in res["per_worker"].items():
+            print(f"  {res['workers']} workers ({mode:7s}): privada {r['private_kb']:9,.0f} KB • "
+                  f"PSS {r['pss_kb']:9,.0f} KB por worker")
+    for name, ok in res["checks"].items():
+        print(f"  {'ok ' if ok else 'FALLO'} {name}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(res, indent=2), encoding="utf-8")
+    return 0 if res["ok"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Índice de metadatos de tickers (ticker_index.py) frente a preguntar a Yahoo,
+con el mercado sintético y una base y un almacén temporales.
+
+    python -m benchmarks.bench_ticker_index --tickers 500
+
+Mide, por consulta, `has_history`, `first_available_month` y la moneda de un
+ticker en frío (descarga) y con el índice, la búsqueda por prefijo y la
+reconstrucción en bloque desde el almacén. Sale con código 1 si las
+respuestas del índice no coinciden con las de la descarga o si la mediana
+de una consulta indexada supera `--budget-us`.
+"""
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import core  # noqa: E402
+import fetch  # noqa: E402
+import price_store  # noqa: E402
+import ticker_index  # noqa: E402
+from benchmarks.synthetic import installed  # noqa: E402
+
+START = "2010-01-01"
+
+def _tickers(n):
+    return [f"T{i:04d}.SY" for i in range(n)]
+
+def _median_us(fn, items, repeat=3):
+    samples = []
+    for _ in range(repeat):
+        for x in items:
+            t0 = time.perf_counter()
+            fn(x)
+            samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1e6
+
+def _forget():
+    price_store._MEM.clear()
+    price_store._CURRENCIES.clear()
+
+def run(n=500, budget_us=200.0):
+    tickers = _tickers(n)
+    sample = tickers[:: max(1, n // 50)]
+    checks = {}
+    with tempfile.TemporaryDirectory() as tmp, installed() as market:
+        price_store.STORE_DIR = Path(tmp) / "prices"
+        ticker_index.configure(Path(tmp) / "tickers.sqlite")
+        fetch.configure(None, rate=0)      # el mercado sintético no limita: se mide el trabajo, no la espera
+
+        # En frío: sin índice, cada comprobación va a Yahoo (datos del mercado sintético)
+        t0 = time.perf_counter()
+        cold_hist = {t: core.has_history(t, START) for t in sample}
+        cold_hist_us = (time.perf_counter() - t0) / len(sample) * 1e6
+        t0 = time.perf_counter()
+        cold_first = {t: core.first_available_month(t) for t in sample}
+        cold_first_us = (time.perf_counter() - t0) / len(sample) * 1e6
+        t0 = time.perf_counter()
+        cold_cur = {t: price_store.ticker_currency(t) for t in sample}
+        cold_cur_us = (time.perf_counter() - t0) / len(sample) * 1e6
+
+        # El resto, en bloque: una descarga agrupada + monedas en paralelo
+        t0 = time.perf_counter()
+        price_store.load_prices_many(tickers, START)
+        price_store.ticker_currencies(tickers)
+        bulk_s = time.perf_counter() - t0
+        calls = len(market.calls)
+
+        # Otro proceso (nada en memoria): responde el índice
+        _forget()
+        hist_us = _median_us(lambda t: core.has_history(t, START), sample)
+        first_us = _median_us(core.first_available_month, sample)
+        cur_us = _median_us(price_store.ticker_currency, sample)
+        _forget()
+        checks["answers_match"] = (all(core.has_history(t, START) == cold_hist[t] for t in sample)
+                                   and all(core.first_available_month(t) == cold_first[t] for t in sample)
+                                   and all(price_store.ticker_currency(t) == cold_cur[t] for t in sample))
+        checks["no_downloads"] = len(market.calls) == calls
+        checks["future_start_false"] = core.has_history(sample[0], "2099-01-01") is False
+        search_us = _median_us(lambda p: ticker_index.search(p, limit=20), ["T0", "T01", "T04", "X"])
+        checks["prefix_search"] = [i.symbol for i in ticker_index.search("t001", limit=3)] == \
+            ["T0010.SY", "T0011.SY", "T0012.SY"]
+
+        # Reconstrucción en bloque desde el almacén en disco (base nueva)
+        ticker_index.configure(Path(tmp) / "rebuilt.sqlite")
+        t0 = time.perf_counter()
+        rebuilt = ticker_index.index_store()
+        rebuild_s = time.perf_counter() - t0
+        checks["rebuild_all"] = rebuilt == n
+        checks["budget"] = max(hist_us, first_us, cur_us, search_us) <= budget_us
+    fetch.configure(None)
+
+    return {
+        "tickers": n, "sample": len(sample),
+        "cold_us": {"has_history": round(cold_hist_us), "first_available_month": round(cold_first_us),
+                    "currency": round(cold_cur_us)},
+        "indexed_us": {"has_history": round(hist_us, 1), "first_available_month": round(first_us, 1),
+                       "currency": round(cur_us, 1), "search": round(search_us, 1)},
+        "bulk_load_s": round(bulk_s, 2), "rebuild_s": round(rebuild_s, 2),
+        "checks": checks, "ok": all(checks.values()),
+    }
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tickers", type=int, default=500)
+    ap.add_argument("--budget-us", type=float, default=200.0, help="mediana máxima por consulta indexada")
+    ap.add_argument("--out", help="guarda el resultado en JSON")
+    args = ap.parse_args(argv)
+
+    res = run(args.tickers, args.budget_us)
+    for name in res["indexed_us"]:
+        cold = res["cold_us"].get(name)
+        print(f"{name:24s} {res['indexed_us'][name]:>8.1f} µs" + (f"   (sin índice: {cold:,} µs)" if cold else ""))
+    print(f"carga en bloque de {res['tickers']} tickers: {res['bulk_load_s']:.2f} s • "
+          f"reconstrucción desde el almacén: {res['rebuild_s']:.2f} s")
+    for name, ok in res["checks"].items():
+        print(f"  {'ok ' if ok else 'FALLO'} {name}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(res, indent=2), encoding="utf-8")
+    return 0 if res["ok"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
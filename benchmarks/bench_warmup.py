@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Precalentado (warmup.py) sin conexión ni esperas: mercado sintético como
+proveedor y un reloj falso para el planificador.
+
+    python -m benchmarks.bench_warmup
+
+1. Camino de un usuario en frío (descarga + simulación por defecto).
+2. Una pasada del planificador; después, el mismo camino no descarga nada y
+   sale de result_cache.
+3. Se adelanta el reloj: las tareas vencen según su intervalo, y una que
+   falla se reintenta antes (RETRY_DELAY) y queda registrada en la frescura.
+
+Sale con código 1 si alguna comprobación falla.
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import fx  # noqa: E402
+import price_store  # noqa: E402
+import ticker_index  # noqa: E402
+import warmup  # noqa: E402
+from benchmarks.synthetic import installed  # noqa: E402
+from core import Asset  # noqa: E402
+from result_cache import RESULTS  # noqa: E402
+from results import resultados  # noqa: E402
+
+EQUITY, BOND, CRYPTO = "VWRA.L", "AGGU.L", "BTC-USD"
+START = "2018-01-01"
+APORTACION, HORIZONTE, RB = 300, 7, 6
+
+class FakeClock:
+    """Reloj manual: `advance(segundos)` en lugar de esperar."""
+
+    def __init__(self, now=1_700_000_000.0):
+        self.now = float(now)
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+def _reset_caches():
+    price_store._MEM.clear()
+    price_store._CURRENCIES.clear()
+    fx._MATRICES.clear()
+    RESULTS.clear()
+
+def _user_path(display_currency="EUR"):
+    """Lo que hace la app con los valores por defecto (perfil Agresivo, rebalanceo cada 6 meses)."""
+    t0 = time.perf_counter()
+    eq_cur, bd_cur = price_store.ticker_currency(EQUITY), price_store.ticker_currency(BOND)
+    assets = [Asset(EQUITY, role="equity", weight=0.8, currency=eq_cur),
+              Asset(BOND, role="bond", weight=0.2, currency=bd_cur)]
+    _, res = resultados(assets, APORTACION, START, RB, display_currency, None, HORIZONTE)
+    return time.perf_counter() - t0, res
+
+def run(interval=1800.0):
+    checks = {}
+    with tempfile.TemporaryDirectory() as store, installed() as market:
+        price_store.STORE_DIR = Path(store)
+        ticker_index.configure(Path(store) / "tickers.sqlite")     # no mezclar con el índice real
+        _reset_caches()
+        cold_s, _ = _user_path()
+        cold_calls = len(market.calls)
+
+        # Otro proceso recién arrancado: sin nada en memoria, el planificador precalienta
+        _reset_caches()
+        clock = FakeClock()
+        sched = warmup.default_scheduler(EQUITY, BOND, CRYPTO, START, APORTACION, HORIZONTE,
+                                         interval=interval, clock=clock)
+        t0 = time.perf_counter()
+        ran = sched.run_pending()
+        warm_run_s = time.perf_counter() - t0
+        checks["first_pass_runs_all"] = ran == ["currencies", "prices", "simulations"]
+        checks["no_errors"] = all(r["last_error"] is None for r in sched.freshness())
+
+        before_calls, before = len(market.calls), RESULTS.stats()
+        warm_s, res = _user_path()
+        after = RESULTS.stats()
+        checks["user_path_no_download"] = len(market.calls) == before_calls
+        checks["user_path_cache_hit"] = res is not None and after["misses"] == before["misses"]
+
+        clock.advance(interval / 2)
+        checks["nothing_due_early"] = sched.run_pending() == []
+        clock.advance(interval / 2)
+        checks["prices_and_sims_due"] = sched.run_pending() == ["prices", "simulations"]
+        fresh = {r["job"]: r for r in sched.freshness()}
+        checks["currencies_age"] = fresh["currencies"]["age_s"] == interval
+        checks["prices_fresh"] = fresh["prices"]["age_s"] == 0.0
+
+        # Un fallo (p.ej. Yahoo caído) se reintenta a los RETRY_DELAY segundos, no al intervalo
+        sched.add("boom", lambda: 1 / 0, interval)
+        sched.run_pending()
+        boom = {r["job"]: r for r in sched.freshness()}["boom"]
+        checks["failure_recorded"] = boom["failures"] == 1 and "ZeroDivisionError" in boom["last_error"]
+        checks["retry_soon"] = boom["next_in_s"] == min(interval, warmup.RETRY_DELAY)
+        sims = len(warmup.PROFILE_WEIGHTS) * len(warmup.REBALANCE_OPTIONS) * len(warmup.CURRENCIES)
+
+    return {
+        "cold_user_ms": round(cold_s * 1e3, 1), "cold_downloads": cold_calls,
+        "warmup_pass_ms": round(warm_run_s * 1e3, 1), "warm_simulations": sims,
+        "warm_user_ms": round(warm_s * 1e3, 1),
+        "freshness": list(fresh.values()), "checks": checks, "ok": all(checks.values()),
+    }
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--interval", type=float, default=1800.0)
+    ap.add_argument("--out", help="guarda el resultado en JSON")
+    args = ap.parse_args(argv)
+
+    res = run(args.interval)
+    print(f"usuario en frío: {res['cold_user_ms']:,.0f} ms ({res['cold_downloads']} descargas) • "
+          f"precalentado: {res['warmup_pass_ms']:,.0f} ms ({res['warm_simulations']} simulaciones) • "
+          f"usuario tras precalentar: {res['warm_user_ms']:,.1f} ms")
+    for name, ok in res["checks"].items():
+        print(f"  {'ok ' if ok else 'FALLO'} {name}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(res, indent=2), encoding="utf-8")
+    return 0 if res["ok"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
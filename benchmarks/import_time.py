@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Tiempo de importación en frío de `core` (proceso nuevo en cada medición) y
+comprobación de que no arrastra dependencias pesadas de la interfaz.
+
+    python -m benchmarks.import_time                # presupuesto por defecto
+    python -m benchmarks.import_time --budget 0.8 --top 10
+
+Sale con código 1 si la mediana supera `--budget` segundos o si se importa
+alguno de HEAVY_MODULES.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+MODULE = "core"
+BUDGET_S = 1.0
+HEAVY_MODULES = ("streamlit", "plotly", "reportlab", "yfinance")
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module}
+dt = time.perf_counter() - t0
+print(json.dumps({{"seconds": dt, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def measure(module=MODULE, runs=5):
+    code = _PROBE.format(module=module, heavy=HEAVY_MODULES)
+    samples, heavy = [], set()
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True,
+                             text=True, check=True).stdout
+        res = json.loads(out.strip().splitlines()[-1])
+        samples.append(res["seconds"])
+        heavy.update(res["heavy"])
+    return {"module": module, "runs": runs, "median_s": statistics.median(samples),
+            "min_s": min(samples), "heavy_loaded": sorted(heavy)}
+
+def slowest_imports(module=MODULE, top=10):
+    """Módulos con más tiempo acumulado según `python -X importtime`."""
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT,
+                         capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in err.splitlines():
+        parts = line[len("import time:"):].split("|")
+        if not line.startswith("import time:") or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:top]
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--module", default=MODULE)
+    ap.add_argument("--budget", type=float, default=BUDGET_S, help="segundos (mediana)")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=0, help="muestra los N imports más lentos")
+    args = ap.parse_args(argv)
+
+    res = measure(args.module, args.runs)
+    print(f"import {res['module']}: mediana {res['median_s'] * 1e3:.0f} ms "
+          f"(mín {res['min_s'] * 1e3:.0f} ms, presupuesto {args.budget * 1e3:.0f} ms)")
+    if args.top:
+        for cum_us, name in slowest_imports(args.module, args.top):
+            print(f"  {cum_us / 1e3:8.1f} ms  {name}")
+
+    failed = False
+    if res["heavy_loaded"]:
+        print(f"Dependencias pesadas importadas: {', '.join(res['heavy_loaded'])}")
+        failed = True
+    if res["median_s"] > args.budget:
+        print("Fuera de presupuesto")
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Prueba de carga de app.py: N sesiones a la vez recorren el script real con
+AppTest de Streamlit (una por hilo, como las sesiones de un servidor) contra
+un Yahoo simulado y determinista con latencia configurable.
+
+    python -m benchmarks.loadtest --levels 1,2,4,8 --clicks 3 --latency 0.05
+    python -m benchmarks.loadtest --provider http --latency 0.2 --out carga.json
+
+Cada sesión abre la página, y `--clicks` veces cambia la barra lateral al azar
+(moneda, horizonte, tolerancia, aportación, rebalanceo, perfil, método de
+pesos e inicio; semilla fija por sesión) y pulsa "Simular cartera". Por nivel
+de concurrencia imprime p50/p95/p99 de la latencia de cada simulación (la
+reejecución completa del script), simulaciones por segundo, errores y el pico
+de memoria residente del proceso durante el nivel.
+
+- `--provider synthetic` sustituye yfinance en el proceso (benchmarks/synthetic.py);
+  `--provider http` usa el servidor local de benchmarks/stub_yahoo.py y el
+  proveedor HTTP de fetch.
+- Antes de los niveles una sesión descarga los precios (no se mide); al
+  empezar cada nivel se vacía la caché de resultados, así solo aciertan las
+  sesiones que repiten entradas dentro del nivel.
+- El precalentado de la app está desactivado salvo con `--warmup SEGUNDOS`.
+- Todo corre en un proceso con un solo intérprete, como un servidor
+  Streamlit: la memoria incluye además el árbol de elementos que guarda cada
+  AppTest (en producción lo tiene el navegador), así que es una cota superior.
+
+La barra lateral se busca por sus etiquetas en español (idioma por defecto).
+Sale con código 1 si alguna simulación falla.
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import fetch  # noqa: E402
+import price_store  # noqa: E402
+import ticker_index  # noqa: E402
+import warmup  # noqa: E402
+from benchmarks.stub_yahoo import serving  # noqa: E402
+from benchmarks.synthetic import SyntheticMarket, installed  # noqa: E402
+from result_cache import RESULTS  # noqa: E402
+
+APP = str(ROOT / "app.py")
+TIMEOUT = 600              # segundos por ejecución del script (AppTest)
+STATUS = Path("/proc/self/status")
+
+# Etiquetas (o su comienzo) de la barra lateral en español
+LABELS = {
+    "currency": "Moneda", "horizon": "¿Cuántos años", "tolerance": "¿Qué tanto",
+    "monthly": "Aportación mensual", "rebalance": "Rebalanceo", "profile": "Perfil sugerido",
+    "method": "Método de pesos", "start": "Inicio histórico", "simulate": "Simular cartera",
+}
+REBALANCE = [2, 4, 6, 8, 10, 12, "Sin rebalanceo"]
+PROFILES = ["Conservador", "Moderado", "Agresivo"]
+METHODS = ["profile", "target", "minvar", "rp"]
+START_YEARS = range(2010, 2021)
+
+# ─────────────────────────────────────────────────────────────────────
+# AppTest con varias sesiones a la vez
+# ─────────────────────────────────────────────────────────────────────
+@contextmanager
+def concurrent_apptest():
+    """
+    AppTest está pensado para una ejecución cada vez: crea un Runtime simulado
+    global al empezar y lo borra al terminar, parchea y restaura la
+    configuración global en cada ejecución y compila el script en una caché
+    nueva (compilar a la vez desde varios hilos falla en CPython 3.11).
+    Mientras dure el bloque, como en un servidor, hay un solo Runtime, una
+    sola configuración y una sola caché de bytecode.
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+    from streamlit.testing.v1.util import patch_config_options
+
+    shared = ScriptCache()
+    last = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            last["runtime"] = cls._instance
+        if "runtime" not in last:
+            raise RuntimeError("Runtime hasn't been created!")
+        return last["runtime"]
+
+    saved = (local_script_runner.ScriptCache, Runtime.__dict__["instance"], Runtime.__dict__["exists"],
+             app_test.patch_config_options)
+    local_script_runner.ScriptCache = lambda: shared
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or "runtime" in last)
+    # La configuración de prueba se fija una vez para todas (no una por ejecución),
+    # sin los avisos de Streamlit por sesión en la consola
+    app_test.patch_config_options = lambda overrides: nullcontext()
+    try:
+        with patch_config_options({"global.appTest": True, "logger.level": "error"}):
+            yield
+    finally:
+        (local_script_runner.ScriptCache, Runtime.instance, Runtime.exists,
+         app_test.patch_config_options) = saved
+
+def _find(elements, key):
+    label = LABELS[key]
+    for el in elements:
+        if label in str(el.label):
+            return el
+    raise LookupError(f"no se encuentra el control {key!r} ({label!r})")
+
+def randomize(at, rng):
+    """Entradas al azar en la barra lateral (se aplican en la siguiente ejecución)."""
+    _find(at.selectbox, "currency").set_value(rng.choice(["EUR", "USD"]))
+    _find(at.slider, "horizon").set_value(rng.randint(1, 30))
+    _find(at.slider, "tolerance").set_value(rng.randint(1, 10))
+    _find(at.number_input, "monthly").set_value(rng.randrange(50, 2001, 10))
+    _find(at.selectbox, "rebalance").set_value(rng.choice(REBALANCE))
+    _find(at.selectbox, "profile").set_value(rng.choice(PROFILES))
+    _find(at.selectbox, "method").set_value(rng.choice(METHODS))
+    _find(at.text_input, "start").set_value(f"{rng.choice(START_YEARS)}-01-01")
+
+def _failure_load(at):
+    return f"excepción: {at.exception[0].message}" if len(at.exception) else None
+
+def _failure(at):
+    if len(at.exception):
+        return f"excepción: {at.exception[0].message}"
+    if len(at.error):
+        return f"error: {at.error[0].value}"
+    if not len(at.metric):
+        return "sin resultados"
+    return None
+
+# ─────────────────────────────────────────────────────────────────────
+# Sesiones
+# ─────────────────────────────────────────────────────────────────────
+def session(seed, clicks, record, barrier=None):
+    """Abre la app y simula `clicks` veces con entradas al azar; añade filas a `record`."""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed)
+    try:
+        at = AppTest.from_file(APP, default_timeout=TIMEOUT)
+        if barrier is not None:
+            barrier.wait()
+        t0 = time.perf_counter()
+        at.run()
+        record.append({"kind": "load", "seconds": time.perf_counter() - t0, "error": _failure_load(at)})
+        for _ in range(clicks):
+            randomize(at, rng)
+            t0 = time.perf_counter()
+            _find(at.button, "simulate").click().run()
+            record.append({"kind": "simulate", "seconds": time.perf_counter() - t0, "error": _failure(at)})
+    except Exception as e:
+        record.append({"kind": "simulate", "seconds": float("nan"), "error": f"{type(e).__name__}: {e}"})
+
+class RSSSampler:
+    """Pico de memoria residente (VmRSS) del proceso, muestreado en un hilo."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = self.start = rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="rss", daemon=True)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+def rss_mb():
+    if STATUS.exists():
+        for line in STATUS.read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # pico en Linux/BSD, no el actual
+
+def run_level(concurrency, clicks, seed):
+    RESULTS.clear()
+    record = []
+    barrier = threading.Barrier(concurrency)
+    threads = [threading.Thread(target=session, args=(seed * 1000 + i, clicks, record, barrier),
+                                name=f"session-{i}") for i in range(concurrency)]
+    with RSSSampler() as rss:
+        t0 = time.perf_counter()
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        wall = time.perf_counter() - t0
+    sims = [r for r in record if r["kind"] == "simulate"]
+    ok = np.array([r["seconds"] for r in sims if r["error"] is None]) * 1e3
+    loads = np.array([r["seconds"] for r in record if r["kind"] == "load"]) * 1e3
+    pct = (lambda a, q: round(float(np.percentile(a, q)), 1) if a.size else None)
+    errors = [r["error"] for r in record if r["error"] is not None]
+    return {
+        "concurrency": concurrency, "simulations": len(sims), "ok": int(ok.size), "errors": len(errors),
+        "p50_ms": pct(ok, 50), "p95_ms": pct(ok, 95), "p99_ms": pct(ok, 99),
+        "mean_ms": round(float(ok.mean()), 1) if ok.size else None,
+        "load_p50_ms": pct(loads, 50), "throughput_per_s": round(ok.size / wall, 2), "wall_s": round(wall, 2),
+        "rss_start_mb": round(rss.start, 1), "rss_peak_mb": round(rss.peak, 1),
+        "result_cache": RESULTS.stats(), "first_errors": sorted(set(errors))[:3],
+    }
+
+def run(levels=(1, 2, 4, 8), clicks=3, latency=0.05, provider="synthetic", seed=0, warmup_interval=0.0):
+    warnings.simplefilter("ignore")
+    warmup.WARMUP_INTERVAL = warmup_interval
+    out = {"provider": provider, "latency_s": latency, "clicks": clicks, "levels": []}
+    with tempfile.TemporaryDirectory() as tmp, concurrent_apptest():
+        price_store.STORE_DIR = Path(tmp) / "prices"
+        ticker_index.configure(Path(tmp) / "tickers.sqlite")
+        market = installed(SyntheticMarket(latency=latency)) if provider == "synthetic" else nullcontext()
+        stub = serving(latency=latency) if provider == "http" else nullcontext()
+        with market, stub as server:
+            fetch.configure(server.url if server is not None else None)
+            prime = []
+            t0 = time.perf_counter()
+            session(seed - 1, 1, prime)
+            out["prime_s"] = round(time.perf_counter() - t0, 2)
+            out["prime_errors"] = [r["error"] for r in prime if r["error"]]
+            for c in levels:
+                out["levels"].append(run_level(c, clicks, seed + c))
+            fetch.configure(None)
+    out["ok"] = not out["prime_errors"] and all(lv["errors"] == 0 for lv in out["levels"])
+    return out
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--levels", default="1,2,4,8", help="sesiones concurrentes por nivel, separadas por comas")
+    ap.add_argument("--clicks", type=int, default=3, help="simulaciones por sesión")
+    ap.add_argument("--latency", type=float, default=0.05, help="segundos por petición al Yahoo simulado")
+    ap.add_argument("--provider", choices=["synthetic", "http"], default="synthetic")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--warmup", type=float, default=0.0, help="intervalo del precalentado (0 = desactivado)")
+    ap.add_argument("--out", help="guarda el resultado en JSON")
+    args = ap.parse_args(argv)
+
+    res = run(tuple(int(x) for x in args.levels.split(",")), args.clicks, args.latency, args.provider,
+              args.seed, args.warmup)
+    print(f"proveedor {res['provider']} • latencia {res['latency_s']} s • primera sesión (descargas) "
+          f"{res['prime_s']} s")
+    print(f"{'sesiones':>8} {'sims':>5} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'sims/s':>7} {'carga ms':>9} {'RSS pico MB':>12}")
+    for lv in res["levels"]:
+        print(f"{lv['concurrency']:8d} {lv['simulations']:5d} {lv['errors']:4d} {lv['p50_ms'] or 0:8.0f} "
+              f"{lv['p95_ms'] or 0:8.0f} {lv['p99_ms'] or 0:8.0f} {lv['throughput_per_s']:7.2f} "
+              f"{lv['load_p50_ms'] or 0:9.0f} {lv['rss_peak_mb']:12.0f}")
+        for err in lv["first_errors"]:
+            print(f"         {err}")
+    for err in res["prime_errors"]:
+        print(f"  primera sesión: {err}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(res, indent=2), encoding="utf-8")
+    return 0 if res["ok"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Servidor HTTP local que imita la API `v8/finance/chart` de Yahoo con los
+precios del mercado sintético, para probar fetch.HTTPProvider sin conexión:
+latencia por petición, fallos inyectados (429/503 con Retry-After) y
+contadores de lo que llega al "upstream".
+
+    with serving(latency=0.1, fail_first=1) as stub:
+        fetch.configure(stub.url)
+        ...
+        stub.counts()      # {ticker: peticiones recibidas}
+"""
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import SyntheticMarket
+
+PREFIX = "/v8/finance/chart/"
+OPEN_SECONDS = 9 * 3600 + 30 * 60      # las velas llevan la hora de apertura (UTC)
+_RANGES = {"1d": 1, "5d": 5, "1mo": 31, "1y": 366}
+
+class StubYahoo(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, market=None, latency=0.0, fail_first=0, port=0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.market = market or SyntheticMarket()
+        self.latency = float(latency)
+        self.fail_first = int(fail_first)      # fallos (429, 503, 429...) antes de responder bien, por ticker
+        self.requests = []                     # (ticker, query) en orden de llegada
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def counts(self):
+        with self._lock:
+            return dict(Counter(t for t, _ in self.requests))
+
+    def _record(self, ticker, query):
+        with self._lock:
+            self.requests.append((ticker, query))
+            return sum(1 for t, _ in self.requests if t == ticker)
+
+    def chart(self, ticker, query):
+        """Cuerpo JSON de la respuesta de `ticker` con los parámetros de la petición."""
+        s = self.market.history(ticker)
+        if "period1" in query:
+            lo = pd.Timestamp(int(query["period1"]), unit="s")
+            hi = pd.Timestamp(int(query.get("period2", 2**31)), unit="s")
+        else:
+            hi = s.index[-1] + pd.Timedelta(days=1)
+            lo = hi - pd.Timedelta(days=_RANGES.get(query.get("range", "5d"), 5))
+        part = s[(s.index >= lo.normalize()) & (s.index < hi)]
+        stamps = (part.index.asi8 // 10**9 + OPEN_SECONDS).tolist()
+        closes = np.round(part.to_numpy(), 6).tolist()
+        cur = ticker[3:6] if ticker.endswith("=X") else self.market.currency
+        meta = {"currency": cur, "symbol": ticker, "exchangeName": "SYN", "gmtoffset": 0,
+                "firstTradeDate": int(s.index[0].value // 10**9 + OPEN_SECONDS)}
+        return {"chart": {"result": [{"meta": meta, "timestamp": stamps,
+                                      "indicators": {"quote": [{"close": closes}],
+                                                     "adjclose": [{"adjclose": closes}]}}],
+                          "error": None}}
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if not url.path.startswith(PREFIX):
+            return self._send(404, {"chart": {"result": None, "error": {"code": "Not Found"}}})
+        ticker = unquote(url.path[len(PREFIX):])
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        stub = self.server
+        n = stub._record(ticker, query)
+        if stub.latency:
+            time.sleep(stub.latency)
+        if n <= stub.fail_first:
+            code = 429 if n % 2 else 503
+            return self._send(code, {"chart": {"result": None, "error": {"code": str(code)}}},
+                              headers=[("Retry-After", "0")])
+        self._send(200, stub.chart(ticker, query))
+
+@contextmanager
+def serving(**kwargs):
+    """Arranca el servidor en un hilo mientras dure el bloque `with`."""
+    stub = StubYahoo(**kwargs)
+    thread = threading.Thread(target=stub.serve_forever, name="stub-yahoo", daemon=True)
+    thread.start()
+    try:
+        yield stub
+    finally:
+        stub.shutdown()
+        stub.server_close()
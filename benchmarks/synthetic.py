@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Proveedor de mercado sintético y determinista para trabajar sin conexión.
+Sustituye `yf.download` y `yf.Ticker` por precios generados (paseo aleatorio
+geométrico con semilla fija por ticker), con el mismo formato de columnas que
+yfinance (MultiIndex Price × Ticker).
+
+Convención de tickers: un sufijo `.M` devuelve solo velas de fin de mes
+(datos "mensuales"); cualquier otro ticker, velas diarias hábiles.
+"""
+import threading
+import time
+import types
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+HISTORY_START = "1970-01-01"
+HISTORY_END = "2024-12-31"
+
+class SyntheticMarket:
+    def __init__(self, start=HISTORY_START, end=HISTORY_END, latency=0.0, currency="USD"):
+        self.start = pd.Timestamp(start)
+        self.end = pd.Timestamp(end)
+        self.latency = float(latency)      # segundos por llamada (simula la red)
+        self.currency = currency
+        self.calls = []                    # (tickers, start, end) de cada download
+        self._cache = {}
+        self._bdays = None
+        self._lock = threading.Lock()
+
+    def _business_days(self):
+        # Un solo calendario para todos los tickers (bdate_range es lento)
+        with self._lock:
+            if self._bdays is None:
+                self._bdays = pd.bdate_range(self.start, self.end)
+            return self._bdays
+
+    def history(self, ticker):
+        """Serie completa de cierres para `ticker` (determinista)."""
+        with self._lock:
+            hit = self._cache.get(ticker)
+        if hit is not None:
+            return hit
+        rng = np.random.default_rng(zlib.crc32(ticker.encode()))
+        idx = self._business_days()
+        if ticker.endswith("=X"):
+            rets = rng.normal(0.0, 0.004, len(idx))
+            level = 0.9
+        else:
+            rets = rng.normal(0.0003, 0.011, len(idx))
+            level = 100.0
+        s = pd.Series(level * np.exp(np.cumsum(rets)), index=idx)
+        if ticker.endswith(".M"):
+            s = s.groupby(s.index.to_period("M")).tail(1)
+        with self._lock:
+            self._cache[ticker] = s
+        return s
+
+    def download(self, tickers, start=None, end=None, period=None, interval="1d", **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        names = [tickers] if isinstance(tickers, str) else list(tickers)
+        self.calls.append((tuple(names), start, end))
+        cols = {}
+        for t in names:
+            s = self.history(t.strip())
+            if start is not None and period != "max":
+                s = s[s.index >= pd.Timestamp(start)]
+            if end is not None:
+                s = s[s.index < pd.Timestamp(end)]
+            if interval == "1mo":
+                s = s.groupby(s.index.to_period("M")).head(1)
+            cols[("Close", t.strip())] = s
+        if not cols or all(s.empty for s in cols.values()):
+            return pd.DataFrame()
+        df = pd.DataFrame(cols)
+        df.columns = pd.MultiIndex.from_tuples(df.columns, names=["Price", "Ticker"])
+        return df
+
+    def ticker(self, symbol):
+        cur = symbol[3:6] if symbol.endswith("=X") else self.currency
+        info = types.SimpleNamespace(currency=cur, exchange="SYN")
+        return types.SimpleNamespace(fast_info=info, info={"currency": cur, "exchange": "SYN"})
+
+@contextmanager
+def installed(market=None):
+    """Activa el mercado sintético mientras dure el bloque `with`."""
+    market = market or SyntheticMarket()
+    saved = yf.download, yf.Ticker
+    yf.download, yf.Ticker = market.download, market.ticker
+    try:
+        yield market
+    finally:
+        yf.download, yf.Ticker = saved
@@ -0,0 +1,421 @@
+# -*- coding: utf-8 -*-
+"""
+Núcleo sin interfaz: modelo de activos, acceso a datos, FX, motor de
+simulación, métricas y señales. Se importa sin Streamlit, Plotly ni ReportLab
+(yfinance y pyarrow se cargan solo al descargar o leer del disco), así lo
+comparten la app y las herramientas por lotes.
+"""
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+import telemetry
+import ticker_index
+from costs import simulate_with_costs
+from engine import Calendar, calendar_engine, dca_engine
+from fetch import first_date
+from fx import FXUnavailable, convert_prices, fx_matrix, normalize_currency, pairs_for
+from price_store import load_prices, load_prices_many, ticker_currencies, ticker_currency
+from result_cache import fingerprint, make_key
+from signals import SignalEngine
+
+# ────────────────────────── DATOS ──────────────────────────
+def yahoo_prices(ticker, start, end=None):
+    # Sin st.cache_data: price_store guarda la serie más amplia por ticker y recorta
+    # cualquier subrango, así cambiar `start` no provoca otra descarga
+    return load_prices(ticker, start, end)
+
+@telemetry.timed("core.get_currency_of_ticker")
+def get_currency_of_ticker(ticker):
+    # Cacheado 24 h dentro de price_store (compartido con la precarga en paralelo)
+    return ticker_currency(ticker)
+
+def convert_series_to(series, src_cur, dst_cur, start):
+    # Lanza FXUnavailable si no hay par directo, inverso ni triangulación vía USD
+    if src_cur == dst_cur:
+        return series
+    return convert_prices({"_": series}, {"_": src_cur}, dst_cur, start)["_"]
+
+@telemetry.timed("core.prefetch_simulation_data")
+def prefetch_simulation_data(tickers, start, display_currency):
+    """
+    Planificador de datos: reúne de antemano todos los tickers y pares FX que va
+    a pedir una simulación (verificación, precios, conversión y señales) y los
+    descarga agrupados. Después cada consumidor lee de la caché de price_store.
+    """
+    tickers = [t for t in tickers if t]
+    try:
+        currencies = ticker_currencies(tickers)
+        load_prices_many(tickers + pairs_for(currencies.values(), display_currency), start)
+    except Exception:
+        # Si falla la descarga agrupada, cada consumidor lo reintenta por su cuenta
+        pass
+
+@telemetry.timed("core.price_version")
+def price_version(tickers, currencies, start, display_currency, end=None):
+    """
+    Huella del contenido de los precios y tipos de cambio que leería una
+    simulación de estos activos (para claves de result_cache): cambia si llega
+    una vela nueva o hay un reajuste, no por volver a consultar a Yahoo. Se
+    sirve de la caché de price_store (lo caducado se refresca aquí).
+    """
+    native = load_prices_many(tickers, start, end)
+    parts = [(t, fingerprint(s)) for t, s in sorted(native.items())]
+    try:
+        parts.append(("fx", display_currency, fingerprint(fx_matrix(set(currencies), display_currency, start, end))))
+    except FXUnavailable:
+        parts.append(("fx", display_currency, None))
+    return make_key("prices", parts)
+
+@telemetry.timed("core.has_history")
+def has_history(ticker, start):
+    # Primero el índice de metadatos (microsegundos); si no lo sabe, se descarga
+    try:
+        known = ticker_index.has_history(ticker, start)
+    except ValueError:
+        return False
+    telemetry.cache_event("ticker_index", known is not None)
+    if known is not None:
+        return known
+    try:
+        return not yahoo_prices(ticker, start).empty
+    except Exception:
+        return False
+
+def first_available_month(ticker):
+    """Devuelve 'YYYY-MM-01' de la primera vela mensual disponible para el ticker (o None)."""
+    d0 = ticker_index.first_date(ticker)
+    if d0 is None:
+        try:
+            d0 = first_date(ticker)
+        except Exception:
+            return None
+        if d0 is None:
+            return None
+        ticker_index.upsert([{"symbol": ticker, "first_date": d0.strftime("%Y-%m-%d")}])
+    return f"{d0.year:04d}-{d0.month:02d}-01"
+
+def recommend_tickers(kind, currency):
+    """kind: 'equity' | 'bond' | 'crypto'"""
+    if kind == "equity":
+        return ["VWRA.L", "VWCE.DE", "IWDA.AS", "VT", "ACWI"]
+    if kind == "bond":
+        return ["AGGU.L", "AGGH.MI", "BNDW", "IGLO.L", "IGLA.L"]
+    if kind == "crypto":
+        return ["BTC-USD", "ETH-USD"]
+    return []
+
+def suggest_tickers(kind, currency, limit=12):
+    """recommend_tickers + los del índice de ese tipo que ya tienen histórico (los que ha usado alguien)."""
+    known = [i.symbol for i in ticker_index.search(kind=kind, limit=limit) if i.bars]
+    return list(dict.fromkeys(recommend_tickers(kind, currency) + known))[:limit]
+
+def ticker_label(ticker):
+    """'VWRA.L — USD · LSE' con lo que sepa el índice (sin ir a Yahoo)."""
+    info = ticker_index.lookup(ticker)
+    extra = [x for x in (info.currency, info.exchange) if x] if info is not None else []
+    return f"{ticker} — {' · '.join(extra)}" if extra else ticker
+
+def remember_kinds(kinds):
+    """Anota en el índice el tipo ({ticker: 'equity'|'bond'|'crypto'}) de los que aún no lo tienen."""
+    new = {}
+    for t, k in kinds.items():
+        info = ticker_index.lookup(t) if t else None
+        if t and (info is None or info.kind != k):
+            new[t] = k
+    if new:
+        ticker_index.seed_kinds(new)
+
+# ────────────────────────── MODELO / MOTOR ──────────────────────────
+ROLES = ("equity", "bond", "crypto")   # siempre presentes como columnas `<rol>_value`
+
+@dataclass
+class Asset:
+    ticker: str
+    role: str   # 'equity' | 'bond' | 'crypto' | cualquier otra etiqueta
+    weight: float
+    currency: str
+
+@dataclass
+class Portfolio:
+    """
+    Cartera de N activos como arrays paralelos (struct of arrays): el motor
+    trabaja con `weights` y `shares` directamente, sin recorrer objetos Asset.
+    Un mismo ticker o rol puede repetirse; cada activo tiene su columna `label`.
+    """
+    tickers: np.ndarray                 # (N,) str
+    roles: np.ndarray                   # (N,) str
+    weights: np.ndarray                 # (N,) float
+    currencies: np.ndarray              # (N,) str
+    shares: np.ndarray | None = None    # (N,) participaciones al final de la simulación
+
+    @classmethod
+    def from_assets(cls, assets):
+        if isinstance(assets, Portfolio):
+            return assets
+        assets = list(assets)
+        return cls(
+            tickers=np.array([a.ticker for a in assets], dtype=object),
+            roles=np.array([a.role for a in assets], dtype=object),
+            weights=np.array([a.weight for a in assets], dtype=float),
+            currencies=np.array([a.currency for a in assets], dtype=object),
+        )
+
+    def __len__(self):
+        return len(self.tickers)
+
+    @property
+    def labels(self):
+        """Nombre de columna por activo: el ticker, con sufijo #2, #3... si se repite."""
+        seen, out = {}, []
+        for t in self.tickers:
+            seen[t] = seen.get(t, 0) + 1
+            out.append(t if seen[t] == 1 else f"{t}#{seen[t]}")
+        return out
+
+    def unique_tickers(self):
+        return list(dict.fromkeys(self.tickers))
+
+    def currency_map(self):
+        return dict(zip(self.tickers, self.currencies))
+
+    def assets(self):
+        return [Asset(t, r, float(w), c) for t, r, w, c in zip(self.tickers, self.roles, self.weights, self.currencies)]
+
+    def role_groups(self):
+        """{rol: índices de sus activos}; los roles de ROLES siempre aparecen (quizá vacíos)."""
+        roles = list(ROLES) + [r for r in dict.fromkeys(self.roles) if r not in ROLES]
+        return {r: np.flatnonzero(self.roles == r) for r in roles}
+
+    def price_matrix(self, prices):
+        """Matriz fechas × activos (una columna por activo, en el orden de la cartera)."""
+        return np.column_stack([prices[t].to_numpy(dtype=float) for t in self.tickers])
+
+    def price_frame(self, prices):
+        """Como `price_matrix` pero DataFrame con `labels` por columnas."""
+        first = prices[self.tickers[0]]
+        return pd.DataFrame(self.price_matrix(prices), index=first.index, columns=self.labels)
+
+def monthly_index_union(series_list):
+    # Mismas etiquetas que s.resample("M") (fin de mes de cada mes entre la primera
+    # y la última vela) sin remuestrear cada serie; rangos repetidos se calculan una vez
+    spans = {(s.index.min(), s.index.max()) for s in series_list if s is not None and not s.empty}
+    idx = None
+    for first, last in spans:
+        m = pd.period_range(first, last, freq="M").to_timestamp(how="end").normalize()
+        idx = m if idx is None else idx.union(m)
+    return pd.DatetimeIndex([]) if idx is None else idx.sort_values()
+
+def month_end_prices(prices, m_idx=None):
+    """
+    Muestreo mensual común (robo, core, API): en cada fecha de `m_idx` (por
+    defecto, los fines de mes del rango de `prices`) la última vela disponible
+    hasta esa fecha, aunque el último día del mes sea festivo o fin de semana.
+    Acepta una serie o un DataFrame de cierres diarios con NaN donde no hay vela.
+    """
+    if m_idx is None:
+        m_idx = monthly_index_union([prices.dropna(how="all")] if isinstance(prices, pd.DataFrame)
+                                    else [prices.dropna()])
+    if prices.empty:
+        return prices.reindex(m_idx)
+    return prices.sort_index().ffill().reindex(m_idx, method="ffill")
+
+def _converted_prices(pf, start, end, display_currency):
+    native_prices = {t: yahoo_prices(t, start, end) for t in pf.unique_tickers()}
+    # Una matriz FX por moneda destino (cacheada) y una multiplicación por activo
+    return convert_prices(native_prices, pf.currency_map(), display_currency, start, end)
+
+def _result_frame(index, pf, values, cash, total):
+    """cash, total, `<rol>_value` (suma de los activos de cada rol) y `<ticker>_value` por activo."""
+    data = {"cash": cash, "total": total}
+    for role, cols in pf.role_groups().items():
+        data[f"{role}_value"] = values[:, cols].sum(axis=1) if cols.size else np.zeros(len(total))
+    data.update({f"{label}_value": values[:, i] for i, label in enumerate(pf.labels)})
+    return pd.DataFrame(data, index=pd.DatetimeIndex(index, name="date", freq=None))
+
+def _run_engine(P, pf, amounts, rebalance, display_currency, costs):
+    """Motor sin fricciones o, con `costs` (costs.CostModel), con costes e impuestos."""
+    if costs is None:
+        shares, values, cash, total = calendar_engine(P, pf.weights, amounts, rebalance)
+        return shares, values, cash, total, {}
+    foreign = np.array([normalize_currency(c)[0] != display_currency for c in pf.currencies], dtype=bool)
+    res = simulate_with_costs(P, pf.weights, amounts, rebalance, costs, foreign)
+    extra = {"fees": res.commissions + res.spread + res.fx_fees, "taxes": res.taxes}
+    return res.shares, res.values, res.cash, res.total, extra
+
+@telemetry.timed("core.simulate_portfolio")
+def simulate_portfolio(portfolio, monthly_contribution, start, end, rebalance_months, display_currency,
+                       costs=None):
+    """
+    Simulación mensual de una cartera de N activos. Devuelve (df, prices_m,
+    cartera con `shares` finales). Con `costs` (costs.CostModel) se añaden las
+    columnas `fees` y `taxes` (importe de cada mes).
+    """
+    pf = Portfolio.from_assets(portfolio)
+    conv_prices = _converted_prices(pf, start, end, display_currency)
+    if all(s.empty for s in conv_prices.values()):
+        return pd.DataFrame(), conv_prices, pf
+
+    m_idx = monthly_index_union([s for s in conv_prices.values()])
+    if len(m_idx) == 0:
+        return pd.DataFrame(), conv_prices, pf
+
+    prices_m = {t: month_end_prices(s.dropna(), m_idx) for t, s in conv_prices.items()}
+    # Matriz alineada meses × activos y motor vectorizado (engine.dca_engine)
+    with telemetry.stage("core.engine"):
+        if costs is None:
+            shares, values, cash, total = dca_engine(pf.price_matrix(prices_m), pf.weights,
+                                                     monthly_contribution, rebalance_months)
+            extra = {}
+        else:
+            amounts = np.full(len(m_idx), float(monthly_contribution))
+            shares, values, cash, total, extra = _run_engine(pf.price_matrix(prices_m), pf, amounts,
+                                                             int(rebalance_months or 0), display_currency, costs)
+        df = _result_frame(m_idx, pf, values, cash, total)
+    for col, v in extra.items():
+        df[col] = v
+    return df, prices_m, replace(pf, shares=shares[-1].copy())
+
+def simulate_dca_multi(assets, monthly_contribution, start, end, rebalance_months, display_currency,
+                       costs=None):
+    df, prices_m, _ = simulate_portfolio(assets, monthly_contribution, start, end,
+                                         rebalance_months, display_currency, costs)
+    return df, prices_m
+
+@telemetry.timed("core.simulate_dca_daily")
+def simulate_dca_daily(assets, contribution, start, end, display_currency,
+                       contribution_calendar=Calendar("monthly"), rebalance_calendar=Calendar(None),
+                       costs=None):
+    """
+    Igual que simulate_dca_multi pero sobre el panel diario completo: se aporta
+    `contribution` en cada fecha de `contribution_calendar` (semanal, quincenal,
+    un día concreto del mes o fechas sueltas) y se rebalancea en las fechas de
+    `rebalance_calendar` (Calendar(None) = nunca). Añade la columna `contributed`
+    y, con `costs`, `fees` y `taxes`.
+    """
+    pf = Portfolio.from_assets(assets)
+    conv_prices = _converted_prices(pf, start, end, display_currency)
+    idx = pd.DatetimeIndex([])
+    for s in conv_prices.values():
+        if s is not None and not s.empty:
+            idx = idx.union(s.index)
+    if len(idx) == 0:
+        return pd.DataFrame(), conv_prices
+
+    prices_d = {t: s.reindex(idx).ffill() for t, s in conv_prices.items()}
+    amounts = contribution_calendar.mask(idx) * float(contribution)
+    with telemetry.stage("core.engine"):
+        _, values, cash, total, extra = _run_engine(pf.price_matrix(prices_d), pf, amounts,
+                                                    rebalance_calendar.mask(idx), display_currency, costs)
+        df = _result_frame(idx, pf, values, cash, total)
+
+    df["contributed"] = np.cumsum(amounts)
+    for col, v in extra.items():
+        df[col] = v
+    return df, prices_d
+
+# ────────────────────────── MÉTRICAS ──────────────────────────
+def perf_stats(series):
+    r = series.pct_change().dropna()
+    if r.empty:
+        return {"CAGR": 0.0, "Vol": 0.0, "MaxDD": 0.0, "Sharpe": 0.0}
+    years = (series.index[-1] - series.index[0]).days / 365.25
+    cagr = (series.iloc[-1] / series.iloc[0]) ** (1 / years) - 1 if years > 0 else 0.0
+    vol = r.std() * np.sqrt(12)
+    maxdd = (series / series.cummax() - 1.0).min()
+    sharpe = (r.mean() * 12) / vol if vol > 0 else 0.0
+    return {"CAGR": cagr, "Vol": vol, "MaxDD": maxdd, "Sharpe": sharpe}
+
+def risk_level(vol, maxdd):
+    if vol < 0.08 and maxdd > -0.15: return "Bajo / Low"
+    if vol <= 0.15 or maxdd >= -0.30: return "Medio / Medium"
+    return "Alto / High"
+
+def hhi_and_neff(weights):
+    w = np.array([max(0.0, v) for v in weights.values()], dtype=float)
+    if w.sum() <= 0:
+        return 0.0, 0.0
+    w = w / w.sum()
+    hhi = float(np.sum(w ** 2))
+    neff = float(1.0 / hhi) if hhi > 0 else 0.0
+    return hhi, neff
+
+# ────────────────────────── SEÑALES ──────────────────────────
+MAX_SIGNAL_ENGINES = 32    # motores en memoria como mucho (LRU)
+
+# (moneda destino, inicio) -> SignalEngine (estado incremental por ticker). El inicio
+# forma parte de la clave: las medias dependen de la primera vela pedida, así la
+# respuesta no depende de qué inicios se pidieron antes ni de qué proceso la atiende
+_SIGNAL_ENGINES = OrderedDict()
+_SIGNAL_ENGINES_LOCK = threading.Lock()
+
+def signal_engine(display_currency, start=None):
+    key = (display_currency, None if start is None else pd.Timestamp(start).strftime("%Y-%m-%d"))
+    with _SIGNAL_ENGINES_LOCK:
+        eng = _SIGNAL_ENGINES.get(key)
+        if eng is None:
+            eng = _SIGNAL_ENGINES[key] = SignalEngine()
+            while len(_SIGNAL_ENGINES) > MAX_SIGNAL_ENGINES:
+                _SIGNAL_ENGINES.popitem(last=False)
+        _SIGNAL_ENGINES.move_to_end(key)
+    return eng
+
+@telemetry.timed("core.screen_watchlist")
+def screen_watchlist(tickers, start, display_currency):
+    """
+    Señales (medias 50/100/200, precio bajo cada media, último cruce 50/200) de
+    una lista de tickers: descarga agrupada, una matriz FX por moneda y
+    actualización incremental del motor de señales. Una fila por ticker.
+    """
+    tickers = list(dict.fromkeys(t for t in tickers if t))
+    currencies = ticker_currencies(tickers)
+    prices = load_prices_many(tickers + pairs_for(currencies.values(), display_currency), start)
+    native = {t: prices.get(t, pd.Series(dtype=float)) for t in tickers}
+    try:
+        converted = convert_prices(native, currencies, display_currency, start)
+    except FXUnavailable:
+        # Una moneda sin conversión no debe tumbar el resto de la lista
+        converted = {}
+        for t in tickers:
+            try:
+                converted[t] = convert_series_to(native[t], currencies[t], display_currency, start)
+            except FXUnavailable:
+                pass
+    eng = signal_engine(display_currency, start)
+    for t, s in converted.items():
+        eng.update(t, s)
+    return eng.latest([t for t in tickers if t in converted])
+
+@telemetry.timed("core.trend_is_bearish")
+def trend_is_bearish(ticker: str, start: str, display_currency: str) -> bool | None:
+    """
+    Devuelve:
+      True  -> bajista (precio < MA200)
+      False -> no bajista
+      None  -> datos insuficientes o NaN
+    """
+    s = yahoo_prices(ticker, start)
+    if s is None or s.empty:
+        return None
+
+    # Convertir a moneda objetivo
+    src_cur = get_currency_of_ticker(ticker)
+    try:
+        s = convert_series_to(s, src_cur, display_currency, start)
+    except FXUnavailable:
+        return None
+
+    # Necesitamos al menos 200 datos para MA200
+    if s is None or len(s.dropna()) < 200:
+        return None
+
+    # Solo se procesan las velas nuevas desde la última llamada
+    eng = signal_engine(display_currency, start)
+    eng.update(ticker, s)
+    last = eng.latest([ticker])
+    if last.empty or last.loc[ticker, "below_ma200"] is None:
+        return None
+    return bool(last.loc[ticker, "below_ma200"])
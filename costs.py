@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Costes de transacción e impuestos sobre el motor DCA + rebalanceo: comisión
+(porcentaje con mínimo por operación), diferencial compra/venta, comisión de
+cambio de divisa y tributación de plusvalías en las ventas (FIFO o coste
+medio), con compensación de pérdidas en ventas posteriores.
+
+Los lotes viven en un array estructurado preasignado (filas × activos): como
+mucho hay un lote por fila y activo (la compra periódica y la del rebalanceo
+de esa fila se funden al mismo precio). Las sumas acumuladas de cantidad y
+coste permiten calcular el coste FIFO de cualquier venta buscando solo desde
+el primer lote aún abierto de cada activo, sin recorrer lotes en Python.
+
+Con `CostModel()` (todo a 0) los resultados coinciden con engine.calendar_engine.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+LOT_DTYPE = np.dtype([
+    ("qty", "f8"),          # participaciones compradas en la fila
+    ("basis", "f8"),        # coste total (precio + costes de compra)
+    ("cum_qty", "f8"),      # suma acumulada de qty por activo hasta la fila
+    ("cum_basis", "f8"),    # suma acumulada de basis por activo hasta la fila
+])
+
+@dataclass(frozen=True)
+class CostModel:
+    commission_pct: float = 0.0     # fracción del importe de cada operación
+    commission_min: float = 0.0     # mínimo por operación (moneda de la cartera)
+    spread_bps: float = 0.0         # diferencial completo compra/venta en puntos básicos
+    fx_fee_pct: float = 0.0         # comisión de cambio en activos en otra moneda
+    tax_rate: float = 0.0           # impuesto sobre la plusvalía neta realizada
+    lot_method: str = "fifo"        # 'fifo' | 'average'
+
+    def __post_init__(self):
+        if self.lot_method not in ("fifo", "average"):
+            raise ValueError(f"lot_method debe ser 'fifo' o 'average', no {self.lot_method!r}")
+
+    @property
+    def half_spread(self):
+        return self.spread_bps / 2e4
+
+    def trade_fees(self, amount, foreign):
+        """Comisión + cambio de divisa de operaciones por `amount` (0 donde no se opera)."""
+        amount = np.asarray(amount, dtype=float)
+        traded = amount > 0
+        commission = np.where(traded, np.maximum(amount * self.commission_pct, self.commission_min), 0.0)
+        fx = np.where(traded & foreign, amount * self.fx_fee_pct, 0.0)
+        return commission, fx
+
+class LotLedger:
+    """Lotes (filas × activos) en un array estructurado y lo ya vendido por activo."""
+
+    def __init__(self, rows, assets):
+        self.lots = np.zeros((rows, assets), dtype=LOT_DTYPE)
+        self.sold_qty = np.zeros(assets)        # posición acumulada vendida (cola FIFO)
+        self.sold_basis = np.zeros(assets)      # coste ya dado de baja
+        self.head = np.zeros(assets, dtype=np.intp)  # primer lote aún abierto (FIFO)
+        self.last_row = -1
+
+    def add_rows(self, lo, qty, basis):
+        """Registra las compras de las filas [lo, lo + len(qty))."""
+        lots = self.lots
+        hi = lo + len(qty)
+        prev_q = lots["cum_qty"][lo - 1] if lo > 0 else 0.0
+        prev_b = lots["cum_basis"][lo - 1] if lo > 0 else 0.0
+        lots["qty"][lo:hi] = qty
+        lots["basis"][lo:hi] = basis
+        lots["cum_qty"][lo:hi] = prev_q + np.cumsum(qty, axis=0)
+        lots["cum_basis"][lo:hi] = prev_b + np.cumsum(basis, axis=0)
+        self.last_row = hi - 1
+
+    def add_to_row(self, row, qty, basis):
+        """Compra adicional en la última fila registrada (p.ej. la del rebalanceo)."""
+        lot = self.lots[row]
+        lot["qty"] += qty
+        lot["basis"] += basis
+        lot["cum_qty"] += qty
+        lot["cum_basis"] += basis
+
+    def held(self, row):
+        return self.lots["cum_qty"][row] - self.sold_qty, self.lots["cum_basis"][row] - self.sold_basis
+
+    def _fifo_cut(self, x, row):
+        """
+        Primer lote (por activo) cuya cantidad acumulada alcanza `x`. Como lo
+        vendido solo crece, se busca desde `head` en ventanas que se doblan: una
+        venta recorre los lotes que consume, no todo el histórico.
+        """
+        cq = self.lots["cum_qty"]
+        cols = np.arange(cq.shape[1])
+        width = 16
+        while True:
+            idx = np.minimum(self.head + np.arange(width)[:, None], row)
+            below = np.count_nonzero(cq[idx, cols] < x - 1e-12, axis=0)
+            k = np.minimum(self.head + below, row)
+            if np.all((below < width) | (k >= row)):
+                return k
+            width *= 2
+
+    def _fifo_position_basis(self, x, row):
+        """Coste acumulado de las primeras `x` participaciones compradas (por activo) y su lote de corte."""
+        k = self._fifo_cut(x, row)
+        cols = np.arange(len(k))
+        lots = self.lots
+        qty_k = lots["qty"][k, cols]
+        unit = np.divide(lots["basis"][k, cols], qty_k, out=np.zeros_like(x), where=qty_k > 0)
+        out = lots["cum_basis"][k, cols] - (lots["cum_qty"][k, cols] - x) * unit
+        return np.where(x > 0, out, 0.0), k
+
+    def sell(self, row, qty, method):
+        """Da de baja `qty` (≥ 0) participaciones por activo; devuelve su coste fiscal."""
+        held_q, held_b = self.held(row)
+        qty = np.minimum(qty, held_q)
+        if method == "average":
+            basis = np.divide(held_b * qty, held_q, out=np.zeros_like(qty), where=held_q > 0)
+        else:
+            # `sold_basis` ya es el coste de las primeras `sold_qty` participaciones
+            after, self.head = self._fifo_position_basis(self.sold_qty + qty, row)
+            basis = np.where(qty > 0, after - self.sold_basis, 0.0)
+        self.sold_qty = self.sold_qty + qty
+        self.sold_basis = self.sold_basis + basis
+        return basis
+
+    def open_lots(self, row=None):
+        """(fila, activo, qty, coste) de las participaciones que siguen en cartera (FIFO)."""
+        row = self.last_row if row is None else row
+        cq = self.lots["cum_qty"][:row + 1]
+        q = self.lots["qty"][:row + 1]
+        remaining = np.clip(cq - self.sold_qty, 0.0, q)
+        unit = np.divide(self.lots["basis"][:row + 1], q, out=np.zeros_like(q), where=q > 0)
+        r, a = np.nonzero(remaining > 1e-12)
+        return r, a, remaining[r, a], remaining[r, a] * unit[r, a]
+
+@dataclass
+class CostResult:
+    shares: np.ndarray      # (T, N)
+    values: np.ndarray      # (T, N) a precio medio
+    cash: np.ndarray        # (T,)
+    total: np.ndarray       # (T,)
+    commissions: np.ndarray  # (T,) por fila
+    spread: np.ndarray      # (T,)
+    fx_fees: np.ndarray     # (T,)
+    taxes: np.ndarray       # (T,)
+    realized: np.ndarray    # (T,) plusvalía neta realizada
+    ledger: LotLedger
+
+def simulate_with_costs(prices, weights, amounts, rebalance, costs, foreign=None):
+    """
+    Mismas reglas que engine.calendar_engine (aportación `amounts[t]` repartida
+    por pesos en cada fila y rebalanceo cada `rebalance` filas o en las filas
+    marcadas), pero cada compra y venta paga comisión, medio diferencial y, en
+    activos con `foreign` = True, comisión de cambio; las ventas del rebalanceo
+    tributan por la plusvalía neta realizada. Lo que se pierde en costes e
+    impuestos se descuenta de las compras del rebalanceo (a prorrata).
+    """
+    px = np.asarray(prices, dtype=float)
+    T, N = px.shape
+    w = np.asarray(weights, dtype=float)
+    amounts = np.asarray(amounts, dtype=float)
+    foreign = np.zeros(N, dtype=bool) if foreign is None else np.asarray(foreign, dtype=bool)
+    hs = costs.half_spread
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        valid = px > 0
+        gross = np.where(valid, amounts[:, None] * w, 0.0)
+        commission, fx = costs.trade_fees(gross, foreign)
+        net = np.maximum(gross - commission - fx, 0.0)
+        buy_qty = np.where(valid, net / (px * (1.0 + hs)), 0.0)
+
+    ledger = LotLedger(T, N)
+    shares = np.zeros((T, N))
+    cash = np.zeros(T)
+    out = {k: np.zeros(T) for k in ("commissions", "spread", "fx_fees", "taxes", "realized")}
+    out["commissions"][:] = commission.sum(axis=1)
+    out["fx_fees"][:] = fx.sum(axis=1)
+    out["spread"][:] = (buy_qty * px * hs).sum(axis=1, where=valid)
+
+    if np.ndim(rebalance) == 0:
+        R = int(rebalance or 0)
+        next_candidate = (lambda pos: pos + R - 1) if R > 0 else (lambda pos: T)
+    else:
+        scheduled = np.append(np.flatnonzero(np.asarray(rebalance, dtype=bool)), T)
+        next_candidate = lambda pos: int(scheduled[np.searchsorted(scheduled, pos)])
+
+    base = np.zeros(N)
+    carry_loss = 0.0
+    pos = 0
+    while pos < T:
+        reb = None
+        cand = next_candidate(pos)
+        if cand < T:
+            sh_c = base + buy_qty[pos:cand + 1].sum(axis=0)
+            if (sh_c * px[cand]).sum() + amounts[pos:cand + 1].sum() > 0:
+                reb = cand
+            else:
+                # Valor no positivo (falta algún precio): primera fila posterior con valor > 0
+                sh = base + np.cumsum(buy_qty[pos:], axis=0)
+                pv = (sh[cand - pos:] * px[cand:]).sum(axis=1) + np.cumsum(amounts[pos:])[cand - pos:]
+                hits = np.flatnonzero(pv > 0)
+                if hits.size:
+                    reb = cand + int(hits[0])
+        end = T if reb is None else reb + 1
+        shares[pos:end] = base + np.cumsum(buy_qty[pos:end], axis=0)
+        cash[pos:end] = np.cumsum(amounts[pos:end])
+        ledger.add_rows(pos, buy_qty[pos:end], gross[pos:end])
+        if reb is not None:
+            new, tax, realized, fees = _rebalance(reb, shares[reb], cash[reb], px[reb], valid[reb], w,
+                                                  costs, foreign, ledger, carry_loss)
+            carry_loss = min(carry_loss + realized, 0.0)
+            shares[reb] = new
+            cash[reb] = 0.0
+            out["taxes"][reb] += tax
+            out["realized"][reb] += realized
+            out["commissions"][reb] += fees[0]
+            out["spread"][reb] += fees[1]
+            out["fx_fees"][reb] += fees[2]
+        base = shares[end - 1].copy()
+        pos = end
+
+    values = shares * px
+    total = values.sum(axis=1) + cash
+    return CostResult(shares, values, cash, total, ledger=ledger, **out)
+
+def _rebalance(row, s, cash, p, valid, w, costs, foreign, ledger, carry_loss):
+    """Una fila de rebalanceo: ventas (con impuestos) y después compras con lo disponible."""
+    hs = costs.half_spread
+    vals = np.where(valid, s * p, 0.0)
+    pv = vals.sum() + cash
+    delta = np.where(valid, w * pv - vals, 0.0)
+
+    # Ventas
+    sell_qty = np.where(delta < 0, -delta / np.where(valid, p, 1.0), 0.0)
+    sell_gross = sell_qty * p * (1.0 - hs)
+    s_comm, s_fx = costs.trade_fees(sell_gross, foreign)
+    proceeds = sell_gross - s_comm - s_fx
+    basis = ledger.sell(row, sell_qty, costs.lot_method)
+    realized = float((proceeds - basis)[sell_qty > 0].sum())
+    taxable = realized + carry_loss
+    tax = costs.tax_rate * taxable if taxable > 0 else 0.0
+
+    # Compras: lo vendido neto + la caja − impuestos, repartido según lo que falte
+    budget = proceeds.sum() + cash - tax
+    want = np.where(delta > 0, delta, 0.0)
+    spend = want * (budget / want.sum()) if want.sum() > 0 else want
+    b_comm, b_fx = costs.trade_fees(spend, foreign)
+    net = np.maximum(spend - b_comm - b_fx, 0.0)
+    buy_qty = np.where(valid, net / np.where(valid, p * (1.0 + hs), 1.0), 0.0)
+    ledger.add_to_row(row, buy_qty, spend)
+
+    new = s - sell_qty + buy_qty
+    fees = (float(s_comm.sum() + b_comm.sum()),
+            float(((sell_qty + buy_qty) * p * hs)[valid].sum()),
+            float(s_fx.sum() + b_fx.sum()))
+    return new, tax, realized, fees
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Motor DCA + rebalanceo vectorizado sobre una matriz de precios alineada
+(fechas × activos). Entre dos rebalanceos las participaciones son una suma
+acumulada de las compras, así que el único bucle en Python recorre
+rebalanceos, no fechas × activos. Funciona sobre cualquier rejilla: diaria con
+calendarios de aportación/rebalanceo (`calendar_engine`) o mensual (`dca_engine`).
+"""
+import warnings
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+def _accumulate(base, buys):
+    """Participaciones de un tramo: `base` + suma acumulada de las compras."""
+    seg = buys.copy()
+    seg[0] += base
+    return np.cumsum(seg, axis=0)
+
+def calendar_engine(prices, weights, amounts, rebalance):
+    """
+    Motor general sobre cualquier rejilla de fechas (diaria, mensual...).
+
+    prices: array (T, N) en la moneda de la cartera (NaN = sin precio).
+    weights: array (N,) con los pesos objetivo.
+    amounts: array (T,) con la aportación de cada fila (0 = ese día no se aporta).
+    rebalance: int R → rebalancear cuando han pasado R filas desde el último
+        rebalanceo (0 = nunca); o array bool (T,) con las fechas programadas.
+    Devuelve (shares, values, cash, total) con formas (T, N), (T, N), (T,), (T,).
+
+    Reglas:
+      - cada fila se suma su aportación a `cash` y se compra
+        `aportación * w / px` de cada activo con precio > 0;
+      - en la fila de rebalanceo, si el valor de la cartera es > 0, se lleva
+        cada activo con precio > 0 a su peso objetivo y `cash` vuelve a 0; si
+        no lo es (p.ej. NaN antes de que cotice un activo), se aplaza a la
+        primera fila posterior con valor > 0.
+    """
+    px = np.asarray(prices, dtype=float)
+    if px.ndim != 2:
+        raise ValueError("prices debe ser una matriz (periodos × activos)")
+    T, N = px.shape
+    w = np.asarray(weights, dtype=float)
+    amounts = np.asarray(amounts, dtype=float)
+    shares = np.zeros((T, N))
+    cash = np.zeros(T)
+    if T == 0:
+        return shares, shares.copy(), cash, cash.copy()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        valid = px > 0
+        buys = np.where(valid, (amounts[:, None] * w) / px, 0.0)
+    if np.ndim(rebalance) == 0:
+        R = int(rebalance or 0)
+        next_candidate = (lambda pos: pos + R - 1) if R > 0 else (lambda pos: T)
+    else:
+        scheduled = np.flatnonzero(np.asarray(rebalance, dtype=bool))
+        scheduled = np.append(scheduled, T)
+        next_candidate = lambda pos: int(scheduled[np.searchsorted(scheduled, pos)])
+    base = np.zeros(N)
+    pos = 0
+
+    while pos < T:
+        reb = None
+        cand = next_candidate(pos)
+        if cand < T:
+            sh = _accumulate(base, buys[pos:cand + 1])
+            cs = np.cumsum(amounts[pos:cand + 1])
+            if (sh[-1] * px[cand]).sum() + cs[-1] > 0:
+                reb = cand
+            else:
+                # Valor no positivo: se rebalancea en la primera fila posterior con valor > 0
+                sh = _accumulate(base, buys[pos:])
+                cs = np.cumsum(amounts[pos:])
+                k = cand - pos
+                pv = (sh[k:] * px[cand:]).sum(axis=1) + cs[k:]
+                hits = np.flatnonzero(pv > 0)
+                if hits.size:
+                    reb = cand + int(hits[0])
+                    sh, cs = sh[:reb - pos + 1], cs[:reb - pos + 1]
+        else:
+            sh = _accumulate(base, buys[pos:])
+            cs = np.cumsum(amounts[pos:])
+
+        end = pos + len(sh)
+        shares[pos:end] = sh
+        cash[pos:end] = cs
+        if reb is not None:
+            p, s = px[reb], shares[reb]
+            vals = s * p
+            target = w * (vals.sum() + cash[reb])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                shares[reb] = np.where(valid[reb], s + (target - vals) / p, s)
+            cash[reb] = 0.0
+            base = shares[reb].copy()
+        pos = end
+
+    values = shares * px
+    total = values.sum(axis=1) + cash
+    return shares, values, cash, total
+
+def dca_engine(prices, weights, contribution, rebalance_months):
+    """
+    DCA mensual: caso particular de `calendar_engine` con la misma aportación
+    en cada fila y rebalanceo cada `rebalance_months` filas (0 = sin rebalanceo).
+    Devuelve (shares, values, cash, total) con formas (T, N), (T, N), (T,), (T,).
+    """
+    px = np.asarray(prices, dtype=float)
+    amounts = np.full(px.shape[0] if px.ndim == 2 else 0, float(contribution))
+    return calendar_engine(px, weights, amounts, int(rebalance_months or 0))
+
+# ─────────────────────────────────────────────────────────────────────
+# Calendarios de aportación / rebalanceo
+# ─────────────────────────────────────────────────────────────────────
+CALENDAR_FREQS = ("daily", "weekly", "biweekly", "monthly", "month_end", "custom")
+
+@dataclass(frozen=True)
+class Calendar:
+    """Calendario de aportaciones o de rebalanceos (ver `schedule_mask`)."""
+    freq: str | None = "monthly"
+    day: int = 1
+    weekday: int = 0
+    every: int = 1
+    dates: tuple = ()
+
+    def mask(self, index):
+        return schedule_mask(index, self.freq, self.day, self.weekday, self.every, self.dates)
+
+def schedule_mask(index, freq, day=1, weekday=0, every=1, dates=None):
+    """
+    Filas de `index` (fechas hábiles) en las que toca aportar/rebalancear.
+
+    freq: 'daily' | 'weekly' | 'biweekly' | 'monthly' | 'month_end' | 'custom' | None
+      - weekly/biweekly: cada `weekday` (0 = lunes) / cada dos semanas;
+      - monthly: el día `day` de cada mes (acotado al último día del mes);
+      - month_end: última fila de cada mes;
+      - custom: las fechas de `dates`.
+    `every` espacia las fechas (p.ej. monthly con every=6 = semestral).
+    Una fecha que cae en festivo pasa a la siguiente fila disponible.
+    """
+    index = pd.DatetimeIndex(index)
+    T = len(index)
+    mask = np.zeros(T, dtype=bool)
+    if T == 0 or not freq:
+        return mask
+    if freq == "daily":
+        mask[::max(1, int(every))] = True
+        return mask
+    if freq == "month_end":
+        periods = index.to_period("M")
+        last = np.flatnonzero(np.append(periods[1:] != periods[:-1], True))
+        mask[last[::max(1, int(every))]] = True
+        return mask
+
+    first, last = index[0].normalize(), index[-1]
+    if freq in ("weekly", "biweekly"):
+        step = (2 if freq == "biweekly" else 1) * max(1, int(every))
+        wanted = pd.date_range(first, last, freq=f"W-{['MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT', 'SUN'][weekday]}")[::step]
+    elif freq == "monthly":
+        months = pd.period_range(first, last, freq="M")[::max(1, int(every))]
+        starts = months.to_timestamp(how="start")
+        wanted = starts + pd.to_timedelta(np.minimum(int(day), months.days_in_month) - 1, unit="D")
+        wanted = wanted[wanted >= first]
+    elif freq == "custom":
+        wanted = pd.DatetimeIndex(sorted(pd.to_datetime(list(dates or []))))
+    else:
+        raise ValueError(f"Frecuencia desconocida: {freq!r} (opciones: {', '.join(CALENDAR_FREQS)})")
+    rows = index.searchsorted(wanted, side="left")
+    mask[np.unique(rows[rows < T])] = True
+    return mask
+
+# ─────────────────────────────────────────────────────────────────────
+# Métricas por columnas (una columna = una simulación)
+# ─────────────────────────────────────────────────────────────────────
+def perf_stats_matrix(totals, dates):
+    """
+    CAGR/Vol/MaxDD/Sharpe de cada columna de `totals` (T, B), con la misma
+    definición que `perf_stats` (rentabilidades mensuales, rf≈0).
+    Devuelve un dict de arrays (B,).
+    """
+    x = np.asarray(totals, dtype=float)
+    if x.ndim == 1:
+        x = x[:, None]
+    T, B = x.shape
+    zeros = np.zeros(B)
+    if T < 2:
+        return {"CAGR": zeros, "Vol": zeros.copy(), "MaxDD": zeros.copy(), "Sharpe": zeros.copy()}
+
+    # pct_change() de pandas rellena hacia delante antes de dividir
+    filled = pd.DataFrame(x).ffill().to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = filled[1:] / filled[:-1] - 1.0
+    n = np.isfinite(r).sum(axis=0)
+    r = np.where(np.isfinite(r), r, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(r, axis=0)
+        vol = np.nanstd(r, axis=0, ddof=1) * np.sqrt(12)
+        years = (pd.Timestamp(dates[-1]) - pd.Timestamp(dates[0])).days / 365.25
+        cagr = (x[-1] / x[0]) ** (1 / years) - 1 if years > 0 else zeros.copy()
+        peak = np.fmax.accumulate(x, axis=0)
+        maxdd = np.nanmin(x / peak - 1.0, axis=0)
+    sharpe = np.where(vol > 0, mean * 12 / np.where(vol > 0, vol, 1.0), 0.0)
+
+    empty = n == 0
+    return {
+        "CAGR": np.where(empty, 0.0, cagr),
+        "Vol": np.where(empty, 0.0, vol),
+        "MaxDD": np.where(empty, 0.0, maxdd),
+        "Sharpe": np.where(empty, 0.0, sharpe),
+    }
+
+# ─────────────────────────────────────────────────────────────────────
+# Barrido de parámetros (pesos × rebalanceo × aportación)
+# ─────────────────────────────────────────────────────────────────────
+def rebalance_schedule(valid_rows, rebalance_months):
+    """
+    Filas en las que se rebalancea. Con aportación > 0 y pesos ≥ 0 el valor de
+    la cartera solo deja de ser > 0 cuando falta algún precio, así que el
+    calendario depende únicamente de `rebalance_months` y de `valid_rows`.
+    """
+    T = len(valid_rows)
+    R = int(rebalance_months or 0)
+    if R <= 0 or T == 0:
+        return []
+    # next_ok[i] = primera fila ≥ i con todos los precios disponibles (T si no hay)
+    ok_rows = np.flatnonzero(valid_rows)
+    next_ok = np.append(ok_rows, T)[np.searchsorted(ok_rows, np.arange(T))]
+    rebs, pos = [], 0
+    while pos + R - 1 < T:
+        reb = int(next_ok[pos + R - 1])
+        if reb >= T:
+            break
+        rebs.append(reb)
+        pos = reb + 1
+    return rebs
+
+def _unit_totals(px, weights, rebs):
+    """Valor total (T, B) con aportación 1 para un bloque de pesos (B, N)."""
+    T, N = px.shape
+    B = weights.shape[0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        valid = px > 0
+        inv = np.where(valid, 1.0 / px, 0.0)
+    totals = np.empty((T, B))
+    base = np.zeros((B, N))
+    bounds = [(r + 1, True) for r in rebs]
+    if not rebs or rebs[-1] + 1 < T:
+        bounds.append((T, False))
+    pos = 0
+    for end, is_reb in bounds:
+        seg_px = px[pos:end]
+        cu = np.cumsum(inv[pos:end], axis=0)
+        cash = np.arange(1, end - pos + 1, dtype=float)
+        totals[pos:end] = seg_px @ base.T + (cu * seg_px) @ weights.T + cash[:, None]
+        if is_reb:
+            p = px[end - 1]
+            s = base + weights * cu[-1]
+            vals = s * p
+            pv = vals.sum(axis=1) + cash[-1]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                base = np.where(valid[end - 1], s + (weights * pv[:, None] - vals) / p, s)
+            totals[end - 1] = (base * p).sum(axis=1)
+        pos = end
+    return totals
+
+def sweep(prices, weights, rebalance_options, contributions, chunk_size=256):
+    """
+    Evalúa todas las combinaciones pesos × rebalanceo × aportación sobre un
+    panel de precios ya alineado (DataFrame meses × activos).
+
+    weights: dict {nombre: pesos} (p.ej. robo.PROFILE_WEIGHTS) o array (K, N).
+    rebalance_options: meses entre rebalanceos (0/None = sin rebalanceo).
+    contributions: aportaciones mensuales (> 0).
+
+    El motor es lineal en la aportación y las métricas no dependen de la
+    escala, así que cada (pesos, rebalanceo) se simula una sola vez con
+    aportación 1; los pesos se procesan en bloques de `chunk_size` para
+    acotar la memoria a O(T × chunk_size).
+    Devuelve una tabla con una fila por combinación.
+    """
+    if isinstance(weights, dict):
+        names = list(weights)
+        W = np.array([weights[k] for k in names], dtype=float)
+    else:
+        W = np.atleast_2d(np.asarray(weights, dtype=float))
+        names = list(range(len(W)))
+    px = prices.to_numpy(dtype=float)
+    if W.shape[1] != px.shape[1]:
+        raise ValueError("Cada vector de pesos debe tener un valor por activo")
+    contributions = np.asarray(list(contributions), dtype=float)
+    if (contributions <= 0).any() or (W < 0).any():
+        raise ValueError("Las aportaciones deben ser > 0 y los pesos ≥ 0")
+
+    T = px.shape[0]
+    valid_rows = np.isfinite(px).all(axis=1)
+    frames = []
+    for R in rebalance_options:
+        rebs = rebalance_schedule(valid_rows, R)
+        for lo in range(0, len(W), chunk_size):
+            Wc = W[lo:lo + chunk_size]
+            unit = _unit_totals(px, Wc, rebs)
+            stats = perf_stats_matrix(unit, prices.index)
+            k = len(Wc)
+            frames.append(pd.DataFrame({
+                "profile": np.repeat(np.array(names[lo:lo + chunk_size], dtype=object), len(contributions)),
+                "rebalance_months": int(R or 0),
+                "contribution": np.tile(contributions, k),
+                "final_value": (unit[-1][:, None] * contributions[None, :]).ravel(),
+                "contributed": np.tile(contributions * T, k),
+                **{m: np.repeat(v, len(contributions)) for m, v in stats.items()},
+            }))
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
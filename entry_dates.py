@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Análisis de todas las fechas de entrada: valor final, CAGR, Vol, MaxDD y
+Sharpe de la misma cartera DCA empezando en cada mes posible y manteniéndola
+durante varios horizontes, en una sola pasada vectorizada.
+
+- Las participaciones salen de la suma acumulada global de 1/precio
+  (Q[t] − Q[s−1] = compras desde el mes s), así que el valor de todas las
+  entradas a la vez es un producto de matrices por tramo.
+- Las entradas con el mismo resto s mod R rebalancean en las mismas fechas
+  absolutas; se simulan juntas y el bucle en Python recorre rebalanceos.
+- Las métricas por horizonte salen de sumas acumuladas (rentabilidades y sus
+  cuadrados) y del drawdown mínimo acumulado: O(1) por (entrada, horizonte).
+
+Mismas reglas y definiciones que engine.dca_engine y core.perf_stats, sobre
+el panel recortado a los meses en que todos los activos cotizan.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_HORIZONS = tuple(range(12, 361, 12))    # 1..30 años, en meses
+METRICS = ("final_value", "contributed", "CAGR", "Vol", "MaxDD", "Sharpe")
+
+def _entry_totals(px, weights, rebalance_months):
+    """
+    Valor total (T, S) con aportación 1 de cada entrada s (columna) en cada mes t
+    (fila); NaN para t < s. `px` no debe tener huecos (precios > 0).
+    """
+    T, N = px.shape
+    w = np.asarray(weights, dtype=float)
+    Q = np.cumsum(1.0 / px, axis=0)
+    Qprev = np.vstack([np.zeros((1, N)), Q[:-1]])          # Q[s−1]
+    pw = px * w
+    own = (pw * Q).sum(axis=1)                               # valor de comprar desde el mes 0
+    totals = np.full((T, T), np.nan)
+    R = int(rebalance_months or 0)
+
+    for phase in range(max(R, 1)):
+        starts = np.arange(phase, T, R) if R > 0 else np.arange(T)
+        rebs = list(range(phase + R - 1, T, R)) if R > 0 else []
+        bounds = [(r + 1, True) for r in rebs]
+        if not rebs or rebs[-1] + 1 < T:
+            bounds.append((T, False))
+        base = np.zeros((len(starts), N))
+        pos = 0
+        for end, is_reb in bounds:
+            live = starts < end
+            if not live.any():
+                pos = end
+                continue
+            cols = starts[live]
+            first = np.maximum(cols, pos)                    # primer mes de compras en el tramo
+            seg = slice(pos, end)
+            rows = np.arange(pos, end)
+            vals = (px[seg] @ base[live].T + own[seg][:, None] - pw[seg] @ Qprev[first].T
+                    + (rows[:, None] - first[None, :] + 1))
+            vals[rows[:, None] < cols[None, :]] = np.nan
+            totals[seg, cols] = vals
+            if is_reb:
+                # Rebalanceo: todo el valor (incluida la caja) a pesos objetivo
+                base[live] = w * vals[-1][:, None] / px[end - 1]
+            else:
+                base[live] += w * (Q[end - 1] - Qprev[first])
+            pos = end
+    return totals
+
+def all_start_dates(monthly_prices, weights, contribution, rebalance_months, horizons=DEFAULT_HORIZONS):
+    """
+    Métricas de cada (mes de entrada × horizonte en meses).
+
+    monthly_prices: DataFrame mensual (meses × activos) en la moneda de la cartera.
+    Devuelve {métrica: DataFrame entradas × horizontes} listo para un mapa de
+    calor; NaN donde el horizonte se sale del histórico.
+    """
+    panel = monthly_prices.ffill().dropna(how="any")
+    horizons = np.array(sorted({int(h) for h in horizons if int(h) >= 1}), dtype=int)
+    dates = pd.DatetimeIndex(panel.index)
+    T = len(panel)
+    empty = {m: pd.DataFrame(index=dates, columns=horizons, dtype=float) for m in METRICS}
+    if T == 0 or horizons.size == 0:
+        return empty
+
+    V = _entry_totals(panel.to_numpy(dtype=float), weights, rebalance_months)
+
+    # Rentabilidades de cada entrada y sus sumas acumuladas (fila t = rentabilidad de t−1 a t)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = np.vstack([np.full((1, T), np.nan), V[1:] / V[:-1] - 1.0])
+    r0 = np.nan_to_num(r, nan=0.0)
+    S1 = np.cumsum(r0, axis=0)
+    S2 = np.cumsum(r0 * r0, axis=0)
+    with np.errstate(invalid="ignore"):
+        dd = np.fmin.accumulate(V / np.fmax.accumulate(V, axis=0) - 1.0, axis=0)
+
+    s = np.arange(T)[:, None]
+    e = s + horizons[None, :] - 1                              # último mes de cada ventana
+    ok = e < T
+    ec = np.where(ok, e, s)
+    n = (horizons - 1)[None, :].astype(float)                  # nº de rentabilidades
+    days = (dates.values[ec] - dates.values[s]).astype("timedelta64[D]").astype(float)
+    years = days / 365.25
+
+    v0, v1 = V[s, s], V[ec, s]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cagr = np.where(years > 0, (v1 / v0) ** (1 / np.where(years > 0, years, 1.0)) - 1, 0.0)
+        mean = (S1[ec, s] - S1[s, s]) / n
+        var = ((S2[ec, s] - S2[s, s]) - n * mean * mean) / (n - 1)
+        vol = np.sqrt(np.maximum(var, 0.0)) * np.sqrt(12)
+        sharpe = np.where(vol > 0, mean * 12 / np.where(vol > 0, vol, 1.0), 0.0)
+    single = n < 1                                           # sin rentabilidades: todo a 0
+    short = n < 2                                            # una sola rentabilidad: Vol NaN
+    out = {
+        "final_value": v1 * float(contribution),
+        "contributed": np.broadcast_to(horizons * float(contribution), ok.shape).astype(float),
+        "CAGR": np.where(single, 0.0, cagr),
+        "Vol": np.where(single, 0.0, np.where(short, np.nan, vol)),
+        "MaxDD": np.where(single, 0.0, dd[ec, s]),
+        "Sharpe": np.where(single | short, 0.0, sharpe),
+    }
+    return {m: pd.DataFrame(np.where(ok, out[m], np.nan), index=pd.Index(dates, name="start"),
+                            columns=pd.Index(horizons, name="horizon_months"))
+            for m in METRICS}
@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+"""
+Acceso a Yahoo a través de un bucle asyncio propio (en un hilo en segundo
+plano) que comparten todas las sesiones del proceso:
+
+- Single-flight: peticiones idénticas en vuelo (mismos tickers y rango, la
+  moneda de un ticker...) se resuelven con una sola llamada a Yahoo; las demás
+  sesiones esperan ese mismo resultado.
+- Pool acotado: como mucho `MAX_CONNECTIONS` llamadas a la vez (las
+  bloqueantes van a un ThreadPoolExecutor del mismo tamaño y, con HTTP
+  directo, al pool de conexiones de `requests`).
+- Límite por host: cubo de fichas de `RATE` peticiones/s con ráfagas de `BURST`.
+- Reintentos con espera exponencial y jitter ante 429, 5xx y errores de red,
+  respetando Retry-After.
+
+Proveedores: yfinance (por defecto) o, con `FINCONTROL_YAHOO_URL`, HTTP
+directo contra la API `v8/finance/chart` (la que usa yfinance por debajo),
+lo que permite probarlo contra un servidor local (benchmarks/stub_yahoo.py).
+El resto del código usa las funciones síncronas `download`, `info` (moneda,
+bolsa...) y `first_date`.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from urllib.parse import quote, urlparse
+
+import numpy as np
+import pandas as pd
+
+import telemetry
+
+YAHOO_URL = os.environ.get("FINCONTROL_YAHOO_URL")             # sin definir = yfinance
+MAX_CONNECTIONS = int(os.environ.get("FINCONTROL_FETCH_CONNECTIONS", 8))
+RATE = float(os.environ.get("FINCONTROL_FETCH_RATE", 5.0))     # peticiones/s por host (0 = sin límite)
+BURST = 10
+RETRIES = 4
+BACKOFF = 0.5              # segundos antes del primer reintento (se duplica en cada uno)
+MAX_BACKOFF = 30.0
+TIMEOUT = 20.0
+# Espera máxima de una sesión por un resultado: todos los intentos y esperas y algo de margen
+CALL_TIMEOUT = float(os.environ.get("FINCONTROL_FETCH_CALL_TIMEOUT",
+                                    (RETRIES + 1) * TIMEOUT + RETRIES * MAX_BACKOFF + 30))
+_RETRYABLE_NAMES = {"YFRateLimitError", "ConnectionError", "Timeout", "ConnectTimeout", "ReadTimeout",
+                    "ChunkedEncodingError", "CurlError"}
+
+class FetchError(IOError):
+    """Yahoo respondió con un error que no se arregla reintentando."""
+
+class RetryableError(FetchError):
+    """Error transitorio (429, 5xx): se reintenta tras `retry_after` segundos o la espera exponencial."""
+
+    def __init__(self, msg, retry_after=None):
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+def _retryable(exc):
+    # Por nombre: los errores de red de requests/curl_cffi/yfinance no heredan de los de Python
+    return isinstance(exc, (RetryableError, ConnectionError, TimeoutError)) or type(exc).__name__ in _RETRYABLE_NAMES
+
+def _day(ts):
+    return None if ts is None else pd.Timestamp(ts).strftime("%Y-%m-%d")
+
+# ─────────────────────────────────────────────────────────────────────
+# Bucle asíncrono: single-flight, pool, límite por host y reintentos
+# ─────────────────────────────────────────────────────────────────────
+class TokenBucket:
+    """`rate` fichas por segundo hasta un máximo de `burst` (solo se usa desde el bucle)."""
+
+    def __init__(self, rate, burst):
+        self.rate, self.burst = float(rate), float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+class Fetcher:
+    """Ejecuta llamadas bloqueantes a Yahoo desde un bucle asyncio compartido."""
+
+    def __init__(self, max_connections=MAX_CONNECTIONS, rate=RATE, burst=BURST, retries=RETRIES, backoff=BACKOFF):
+        self.max_connections = int(max_connections)
+        self.rate, self.burst = rate, burst
+        self.retries, self.backoff = int(retries), float(backoff)
+        self._loop = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._inflight = {}        # clave -> asyncio.Future (solo desde el bucle)
+        self._buckets = {}         # host -> TokenBucket
+        self.stats = {"calls": 0, "coalesced": 0, "requests": 0, "retries": 0, "failures": 0}
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            # Tras un fork el hilo del bucle no existe en el hijo: se crea otro
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                loop.set_default_executor(ThreadPoolExecutor(self.max_connections, thread_name_prefix="fetch"))
+                threading.Thread(target=loop.run_forever, name="fetch-loop", daemon=True).start()
+                self._loop, self._pid = loop, os.getpid()
+                self._sem = asyncio.Semaphore(self.max_connections)
+                self._inflight, self._buckets = {}, {}
+            return self._loop
+
+    def submit(self, key, host, fn, *args):
+        """Lanza `fn(*args)` (single-flight por `key`) desde cualquier hilo; devuelve un Future."""
+        loop = self._ensure_loop()
+        ctx = contextvars.copy_context()       # la traza de telemetry de quien pide
+        out = Future()
+
+        def done(task):
+            if out.done():                     # la sesión ya dejó de esperar (wait con timeout)
+                return
+            if task.cancelled():
+                out.cancel()
+            elif task.exception() is not None:
+                out.set_exception(task.exception())
+            else:
+                out.set_result(task.result())
+
+        def start():
+            coro = self.fetch(key, host, fn, *args)
+            try:
+                # La tarea copia el contexto actual al crearse (create_task(context=...) es de 3.11)
+                ctx.run(loop.create_task, coro).add_done_callback(done)
+            except BaseException as e:
+                coro.close()
+                out.set_exception(e)
+
+        loop.call_soon_threadsafe(start)
+        return out
+
+    def call(self, key, host, fn, *args, timeout=CALL_TIMEOUT):
+        return wait(self.submit(key, host, fn, *args), timeout)
+
+    async def fetch(self, key, host, fn, *args):
+        self.stats["calls"] += 1
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.stats["coalesced"] += 1
+            telemetry.cache_event("fetch.inflight", True)
+            return await asyncio.shield(pending)
+        telemetry.cache_event("fetch.inflight", False)
+        pending = asyncio.get_running_loop().create_future()
+        self._inflight[key] = pending
+        try:
+            result = await self._attempts(host, fn, args)
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except BaseException as e:
+            pending.set_exception(e)
+            pending.exception()                # marcada como leída aunque nadie más espere
+            raise
+        else:
+            pending.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _attempts(self, host, fn, args):
+        loop = asyncio.get_running_loop()
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+        for attempt in range(self.retries + 1):
+            await bucket.acquire()
+            async with self._sem:
+                self.stats["requests"] += 1
+                try:
+                    with telemetry.stage("fetch.request"):
+                        call = functools.partial(contextvars.copy_context().run, fn, *args)
+                        return await loop.run_in_executor(None, call)
+                except Exception as e:
+                    if attempt == self.retries or not _retryable(e):
+                        self.stats["failures"] += 1
+                        raise
+                    delay = getattr(e, "retry_after", None)
+                    if delay is None:
+                        delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            self.stats["retries"] += 1
+            await asyncio.sleep(min(float(delay), MAX_BACKOFF))
+
+def wait(future, timeout=CALL_TIMEOUT):
+    """Resultado de un Future del Fetcher; FetchError si no llega en `timeout` s (nunca se cuelga una sesión)."""
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        future.cancel()
+        raise FetchError(f"Yahoo sin respuesta en {timeout:g} s") from None
+
+# ─────────────────────────────────────────────────────────────────────
+# Proveedores (llamadas bloqueantes; se ejecutan en el pool del Fetcher)
+# ─────────────────────────────────────────────────────────────────────
+def close_series(df, ticker):
+    """Extrae el cierre como Series aunque yfinance devuelva columnas MultiIndex."""
+    if df is None or df.empty:
+        return pd.Series(dtype=float)
+    close = df["Close"] if "Close" in df.columns else df
+    if isinstance(close, pd.DataFrame):
+        close = close[ticker] if ticker in close.columns else close.iloc[:, 0]
+    s = close.dropna().astype(float)
+    idx = pd.to_datetime(s.index)
+    s.index = idx.tz_localize(None) if idx.tz is not None else idx
+    s = s[~s.index.duplicated(keep="last")].sort_index()
+    s.name = ticker
+    return s
+
+class YFinanceProvider:
+    """yfinance: una `yf.download` para varios tickers (las peticiones se agrupan por lista)."""
+    host = "finance.yahoo.com"
+    batched = True
+
+    @staticmethod
+    def _yf():
+        # yfinance tarda en importarse y solo hace falta al descargar
+        import yfinance as yf
+        return yf
+
+    def download(self, tickers, start, end=None):
+        if len(tickers) == 1:
+            df = self._yf().download(tickers[0], start=start, end=end, progress=False, auto_adjust=True)
+        else:
+            df = self._yf().download(list(tickers), start=start, end=end, progress=False, auto_adjust=True,
+                                     group_by="column")
+        if df is None or df.empty:
+            return {t: pd.Series(dtype=float) for t in tickers}
+        # yfinance no expone el tamaño de la respuesta: se cuenta lo recibido ya decodificado
+        telemetry.add_bytes("yahoo", df.memory_usage(index=True, deep=True).sum())
+        if len(tickers) == 1:
+            return {tickers[0]: close_series(df, tickers[0])}
+        close = df["Close"]
+        return {t: close_series(close[[t]], t) if t in close.columns else pd.Series(dtype=float)
+                for t in tickers}
+
+    def info(self, ticker):
+        out = {}
+        try:
+            fi = self._yf().Ticker(ticker).fast_info
+            out = {"currency": getattr(fi, "currency", None), "exchange": getattr(fi, "exchange", None)}
+        except Exception:
+            pass
+        if not out.get("currency"):
+            try:
+                info = self._yf().Ticker(ticker).info
+                out = {"currency": info.get("currency"), "exchange": out.get("exchange") or info.get("exchange"),
+                       "name": info.get("shortName")}
+            except Exception:
+                pass
+        return {k: v for k, v in out.items() if v}
+
+    def first_date(self, ticker):
+        df = self._yf().download(ticker, period="max", interval="1mo", progress=False, auto_adjust=True)
+        if df is None or df.empty:
+            return None
+        return pd.Timestamp(pd.to_datetime(df.index.min())).tz_localize(None)
+
+def _retry_after(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+class HTTPProvider:
+    """API `v8/finance/chart` por HTTP con `requests` (una petición por ticker)."""
+    batched = False
+
+    def __init__(self, base_url, timeout=TIMEOUT, pool_size=MAX_CONNECTIONS):
+        self.base = base_url.rstrip("/")
+        self.host = urlparse(self.base).netloc
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._meta = {}            # ticker -> meta del último gráfico (moneda, primera fecha)
+
+    def session(self):
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                s.headers["User-Agent"] = "Mozilla/5.0 (fincontrol)"
+                self._session = s
+            return self._session
+
+    def chart(self, ticker, **params):
+        """`result[0]` del gráfico de `ticker`, o None si Yahoo no lo conoce."""
+        r = self.session().get(f"{self.base}/v8/finance/chart/{quote(ticker, safe='')}",
+                               params=params, timeout=self.timeout)
+        if r.status_code == 429 or r.status_code >= 500:
+            raise RetryableError(f"HTTP {r.status_code} en {ticker}", _retry_after(r.headers.get("Retry-After")))
+        if r.status_code == 404:
+            return None
+        if r.status_code >= 400:
+            raise FetchError(f"HTTP {r.status_code} en {ticker}")
+        telemetry.add_bytes("yahoo", len(r.content))
+        chart = r.json().get("chart") or {}
+        if chart.get("error") or not chart.get("result"):
+            return None
+        res = chart["result"][0]
+        self._meta[ticker] = res.get("meta") or {}
+        return res
+
+    def download(self, tickers, start, end=None):
+        out = {}
+        p1 = int(pd.Timestamp(start).timestamp())
+        p2 = int(pd.Timestamp(end).timestamp()) if end is not None else int(time.time()) + 86400
+        for t in tickers:
+            res = self.chart(t, period1=p1, period2=p2, interval="1d", events="div,split",
+                             includeAdjustedClose="true")
+            s = _chart_series(res, t)
+            lo = s.index.searchsorted(pd.Timestamp(start), side="left")
+            hi = s.index.searchsorted(pd.Timestamp(end), side="left") if end is not None else len(s)
+            out[t] = s.iloc[lo:hi]
+        return out
+
+    def _meta_for(self, ticker):
+        meta = self._meta.get(ticker)
+        if meta is None:
+            self.chart(ticker, range="5d", interval="1d")
+            meta = self._meta.get(ticker, {})
+        return meta
+
+    def info(self, ticker):
+        meta = self._meta_for(ticker)
+        out = {"currency": meta.get("currency"), "exchange": meta.get("exchangeName"),
+               "name": meta.get("longName") or meta.get("shortName"), "first_date": self.first_date(ticker)}
+        return {k: v for k, v in out.items() if v is not None}
+
+    def first_date(self, ticker):
+        meta = self._meta_for(ticker)
+        if meta.get("firstTradeDate") is None:
+            return None
+        return pd.Timestamp(int(meta["firstTradeDate"]) + int(meta.get("gmtoffset") or 0), unit="s").normalize()
+
+def _chart_series(res, ticker):
+    """Cierre ajustado diario de un `result` de la API chart (fecha local de la bolsa)."""
+    if not res or not res.get("timestamp"):
+        return pd.Series(dtype=float, name=ticker)
+    ind = res.get("indicators") or {}
+    values = ((ind.get("adjclose") or [{}])[0].get("adjclose")
+              or (ind.get("quote") or [{}])[0].get("close") or [])
+    offset = int((res.get("meta") or {}).get("gmtoffset") or 0)
+    idx = pd.to_datetime(np.asarray(res["timestamp"], dtype="int64") + offset, unit="s").normalize()
+    s = pd.Series(np.asarray(values, dtype=float), index=idx).dropna()
+    s = s[~s.index.duplicated(keep="last")].sort_index()
+    s.name = ticker
+    return s
+
+# ─────────────────────────────────────────────────────────────────────
+# API síncrona
+# ─────────────────────────────────────────────────────────────────────
+_STATE = {"fetcher": None, "provider": None}
+_STATE_LOCK = threading.Lock()
+
+def configure(yahoo_url=None, **fetcher_kwargs):
+    """Cambia de proveedor (URL = HTTP directo, None = yfinance) y/o de límites del Fetcher."""
+    with _STATE_LOCK:
+        _STATE["provider"] = HTTPProvider(yahoo_url) if yahoo_url else YFinanceProvider()
+        _STATE["fetcher"] = Fetcher(**fetcher_kwargs)
+
+def _state():
+    with _STATE_LOCK:
+        if _STATE["fetcher"] is None:
+            _STATE["provider"] = HTTPProvider(YAHOO_URL) if YAHOO_URL else YFinanceProvider()
+            _STATE["fetcher"] = Fetcher()
+        return _STATE["fetcher"], _STATE["provider"]
+
+def fetcher():
+    return _state()[0]
+
+def download(tickers, start, end=None):
+    """{ticker: cierre ajustado diario en [start, end)}; peticiones idénticas en vuelo se comparten."""
+    tickers = list(dict.fromkeys(t.strip() for t in tickers))
+    f, p = _state()
+    start_key, end_key = _day(start), _day(end)
+    if p.batched:
+        return f.call(("download", tuple(tickers), start_key, end_key), p.host, p.download, tickers, start, end)
+    futures = [f.submit(("download", (t,), start_key, end_key), p.host, p.download, [t], start, end)
+               for t in tickers]
+    out = {}
+    for fut in futures:
+        out.update(wait(fut))
+    return out
+
+def info(ticker):
+    """{currency, exchange, name, first_date} que dé Yahoo del ticker (solo las claves conocidas)."""
+    f, p = _state()
+    return f.call(("info", ticker.strip()), p.host, p.info, ticker.strip())
+
+def currency(ticker):
+    """Moneda de cotización según Yahoo, o None si no la da."""
+    return info(ticker).get("currency")
+
+def first_date(ticker):
+    """Fecha de la primera vela disponible (Timestamp) o None."""
+    f, p = _state()
+    return f.call(("first_date", ticker.strip()), p.host, p.first_date, ticker.strip())
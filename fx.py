@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Tipos de cambio: una matriz (fecha × moneda origen) por moneda destino, con
+todas las monedas de una petición. Si Yahoo no tiene el par directo
+`XXXYYY=X` se prueba el inverso y, si tampoco, se triangula vía USD.
+La matriz se cachea, así varios activos en la misma moneda (p.ej. VWRA.L y
+AGGU.L, ambos en USD) comparten una sola descarga y un solo alineado.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+import price_store
+import telemetry
+
+# Cotizaciones en subunidades (p.ej. peniques en Londres) → (moneda, factor)
+SUBUNITS = {"GBp": ("GBP", 0.01), "GBX": ("GBP", 0.01), "ZAc": ("ZAR", 0.01), "ILA": ("ILS", 0.01)}
+PIVOT = "USD"
+
+MAX_MATRICES = 256         # matrices en caché como mucho (LRU; las caducadas se descartan antes)
+
+_MATRICES = OrderedDict()  # (dst, monedas, start, end) -> (instante, matriz)
+_MATRICES_LOCK = threading.Lock()
+
+class FXUnavailable(LookupError):
+    """No hay forma de convertir alguna moneda (ni directo, ni inverso, ni vía USD)."""
+
+def fx_pair(src, dst):
+    return None if src == dst else f"{src}{dst}=X"
+
+def normalize_currency(cur):
+    """('GBp') -> ('GBP', 0.01); el resto, factor 1."""
+    return SUBUNITS.get(cur, (cur, 1.0))
+
+def pairs_for(currencies, dst):
+    """Pares directos que hará falta descargar (para precargarlos en bloque)."""
+    out = set()
+    for cur in currencies:
+        base, _ = normalize_currency(cur)
+        if base != dst:
+            out.add(fx_pair(base, dst))
+    return sorted(out)
+
+def _leg(src, dst, start, end):
+    """src→dst con el par directo o, si no existe, el inverso."""
+    if src == dst:
+        return None
+    direct = price_store.load_prices(fx_pair(src, dst), start, end)
+    if not direct.empty:
+        return direct
+    inverse = price_store.load_prices(fx_pair(dst, src), start, end)
+    if not inverse.empty:
+        return 1.0 / inverse
+    return pd.Series(dtype=float)
+
+def fx_series(src, dst, start, end=None):
+    """Serie diaria de src→dst (cuántas unidades de dst vale 1 de src)."""
+    base, factor = normalize_currency(src)
+    if base == dst:
+        return None if factor == 1.0 else factor
+    rate = _leg(base, dst, start, end)
+    if rate is not None and rate.empty and PIVOT not in (base, dst):
+        a = _leg(base, PIVOT, start, end)
+        b = _leg(PIVOT, dst, start, end)
+        if not a.empty and not b.empty:
+            idx = a.index.union(b.index)
+            rate = (a.reindex(idx).ffill() * b.reindex(idx).ffill()).dropna()
+    if rate is None or rate.empty:
+        raise FXUnavailable(f"FX no disponible para {src}->{dst} ({fx_pair(base, dst)})")
+    return rate * factor
+
+def fx_matrix(currencies, dst, start, end=None, max_age=None):
+    """
+    Matriz fecha × moneda origen con el tipo hacia `dst` (columna constante 1.0
+    si ya está en `dst`), sobre el calendario unión de los pares y rellenada
+    hacia delante. Se cachea durante `max_age` segundos (por defecto
+    `price_store.REFRESH_TTL`; con 0 se rehace).
+    """
+    currencies = tuple(sorted(set(currencies)))
+    key = (dst, currencies, str(start), None if end is None else str(end))
+    now = time.time()
+    with _MATRICES_LOCK:
+        hit = _MATRICES.get(key)
+        if hit is not None:
+            _MATRICES.move_to_end(key)
+    max_age = price_store.REFRESH_TTL if max_age is None else max_age
+    if hit and now - hit[0] <= max_age:
+        telemetry.cache_event("fx_matrix", True)
+        return hit[1]
+    telemetry.cache_event("fx_matrix", False)
+
+    cols = {cur: fx_series(cur, dst, start, end) for cur in currencies}
+    series = {c: s for c, s in cols.items() if isinstance(s, pd.Series)}
+    idx = pd.DatetimeIndex([])
+    for s in series.values():
+        idx = idx.union(s.index)
+    # Misma moneda o subunidad de `dst` (GBp→GBP): factor constante, no depende del calendario
+    scalars = {c: 1.0 if v is None else v for c, v in cols.items() if not isinstance(v, pd.Series)}
+    rates = pd.DataFrame({c: s.reindex(idx) for c, s in series.items()}, index=idx).ffill()
+    for c, v in scalars.items():
+        rates[c] = v
+    rates = rates[list(currencies)]
+    rates.attrs["scalars"] = scalars
+    with _MATRICES_LOCK:
+        _MATRICES[key] = (now, rates)
+        _MATRICES.move_to_end(key)
+        _evict(now, max_age)
+    return rates
+
+def _evict(now, max_age):
+    """Quita las matrices caducadas y, si aún sobran, las menos usadas (con el lock tomado)."""
+    for k in [k for k, (t, _) in _MATRICES.items() if now - t > max(max_age, price_store.REFRESH_TTL)]:
+        del _MATRICES[k]
+    while len(_MATRICES) > MAX_MATRICES:
+        _MATRICES.popitem(last=False)
+
+def align_rates(rates, index):
+    """
+    Tipos vigentes en cada fecha de `index` (último tipo conocido; antes del
+    primero, el primero). Las columnas constantes de `fx_matrix` (misma moneda
+    o subunidad) llevan su factor aunque la matriz no tenga filas.
+    """
+    if rates.empty:
+        out = pd.DataFrame(1.0, index=index, columns=rates.columns)
+    else:
+        out = rates.reindex(rates.index.union(index)).ffill().bfill().reindex(index)
+    for c, v in rates.attrs.get("scalars", {}).items():
+        out[c] = v
+    return out
+
+@telemetry.timed("fx.convert_prices")
+def convert_prices(prices, currencies, dst, start, end=None):
+    """
+    Convierte {ticker: serie} a `dst` dado {ticker: moneda}. Un alineado por
+    moneda (no por activo) y una multiplicación vectorizada por activo.
+    """
+    rates = fx_matrix(set(currencies.values()), dst, start, end)
+    idx = pd.DatetimeIndex([])
+    for s in prices.values():
+        idx = idx.union(s.index)
+    aligned = align_rates(rates, idx)
+    out = {}
+    for t, s in prices.items():
+        if s.empty or normalize_currency(currencies[t]) == (dst, 1.0):
+            # Ya en `dst`: la serie tal cual (sigue siendo una vista del panel, sin copia)
+            out[t] = s
+            continue
+        out[t] = s * aligned[currencies[t]].reindex(s.index).to_numpy()
+    return out
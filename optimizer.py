@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Optimizador de pesos (solo largos, suman 1) a partir del histórico mensual de
+los activos elegidos: mínima varianza, paridad de riesgo y frontera eficiente
+por volatilidad objetivo.
+
+- Covarianza con contracción de Ledoit-Wolf hacia la identidad escalada, para
+  que sea estable con pocas observaciones o muchos activos.
+- El modelo (medias, covarianza, Cholesky y la frontera ya calculada) se
+  cachea por (tickers, monedas, moneda destino, ventana): mover el control de
+  tolerancia solo recalcula un punto de la frontera (milisegundos).
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+import price_store
+import telemetry
+from fx import convert_prices
+from price_store import load_prices_many
+
+WINDOW_MONTHS = 60
+FRONTIER_POINTS = 25
+_MODELS = {}               # (tickers, monedas, destino, ventana) -> (instante, CovModel)
+_MODELS_LOCK = threading.Lock()
+
+# ─────────────────────────────────────────────────────────────────────
+# Estimación
+# ─────────────────────────────────────────────────────────────────────
+def shrunk_covariance(returns):
+    """
+    Covarianza de Ledoit-Wolf: delta·mu·I + (1−delta)·S con la intensidad
+    óptima delta ∈ [0, 1]. `returns` (T, N). Devuelve (covarianza, delta).
+    """
+    X = np.asarray(returns, dtype=float)
+    T, N = X.shape
+    X = X - X.mean(axis=0)
+    S = X.T @ X / T
+    mu = np.trace(S) / N
+    d2 = ((S - mu * np.eye(N)) ** 2).sum()
+    if d2 <= 0:
+        return S, 0.0
+    b2 = ((X ** 2).sum(axis=1) ** 2).sum() / T ** 2 - (S ** 2).sum() / T
+    delta = float(np.clip(b2 / d2, 0.0, 1.0))
+    return delta * mu * np.eye(N) + (1.0 - delta) * S, delta
+
+@dataclass
+class CovModel:
+    tickers: tuple
+    mu: np.ndarray          # rentabilidad esperada anual (N,)
+    cov: np.ndarray         # covarianza anual (N, N)
+    chol: np.ndarray        # Cholesky de `cov`
+    shrinkage: float
+    n_obs: int
+    _segments: list | None = field(default=None, repr=False)
+    _frontier: pd.DataFrame | None = field(default=None, repr=False)
+
+    @classmethod
+    def from_returns(cls, returns, periods_per_year=12):
+        """Modelo a partir de un DataFrame de rentabilidades (periodos × activos) sin huecos."""
+        R = returns.to_numpy(dtype=float)
+        cov, delta = shrunk_covariance(R)
+        cov = cov * periods_per_year
+        # Un pequeño suelo en la diagonal evita fallos de Cholesky con activos casi idénticos
+        cov = cov + np.eye(len(cov)) * 1e-12 * max(np.trace(cov), 1e-12)
+        return cls(tuple(returns.columns), R.mean(axis=0) * periods_per_year, cov,
+                   np.linalg.cholesky(cov), delta, R.shape[0])
+
+    def vol(self, w):
+        return float(np.linalg.norm(self.chol.T @ w))
+
+    def ret(self, w):
+        return float(self.mu @ w)
+
+# ─────────────────────────────────────────────────────────────────────
+# Datos (precios cacheados → rentabilidades mensuales en la moneda destino)
+# ─────────────────────────────────────────────────────────────────────
+def monthly_returns(tickers, currencies, display_currency, window_months=WINDOW_MONTHS, end=None):
+    end_ts = pd.Timestamp(end) if end is not None else pd.Timestamp.today().normalize()
+    start = (end_ts - pd.DateOffset(months=window_months + 1)).strftime("%Y-%m-%d")
+    native = load_prices_many(list(dict.fromkeys(tickers)), start, end)
+    native = {t: native.get(t, pd.Series(dtype=float)) for t in tickers}
+    conv = convert_prices(native, dict(zip(tickers, currencies)), display_currency, start, end)
+    px = pd.DataFrame({t: s for t, s in conv.items()})
+    if px.empty:
+        return px
+    monthly = px.groupby(px.index.to_period("M")).last()
+    return monthly.pct_change(fill_method=None).dropna(how="any").tail(window_months)
+
+@telemetry.timed("optimizer.load_model")
+def load_model(tickers, currencies, display_currency, window_months=WINDOW_MONTHS):
+    """CovModel cacheado durante `price_store.REFRESH_TTL` segundos; None si no hay datos suficientes."""
+    key = (tuple(tickers), tuple(currencies), display_currency, int(window_months))
+    now = time.time()
+    with _MODELS_LOCK:
+        hit = _MODELS.get(key)
+    if hit and now - hit[0] <= price_store.REFRESH_TTL:
+        telemetry.cache_event("cov_model", True)
+        return hit[1]
+    telemetry.cache_event("cov_model", False)
+    rets = monthly_returns(tickers, currencies, display_currency, window_months)
+    if rets.shape[0] < max(12, len(tickers) + 2):
+        return None
+    model = CovModel.from_returns(rets)
+    with _MODELS_LOCK:
+        _MODELS[key] = (now, model)
+    return model
+
+# ─────────────────────────────────────────────────────────────────────
+# Carteras
+# ─────────────────────────────────────────────────────────────────────
+def mean_variance(model, risk_aversion_inv):
+    """
+    min ½·w'Σw − λ·μ'w con w ≥ 0 y Σw = 1 (λ = risk_aversion_inv; 0 = mínima
+    varianza). Conjunto activo: se resuelve el sistema KKT sobre los activos
+    libres, se fija a 0 el más negativo o se libera el que tenga gradiente < 0.
+    """
+    cov, mu, N = model.cov, model.mu, len(model.mu)
+    lam = float(risk_aversion_inv)
+    free = np.ones(N, dtype=bool)
+    w = np.full(N, 1.0 / N)
+    for _ in range(4 * N + 10):
+        F = np.flatnonzero(free)
+        L = np.linalg.cholesky(cov[np.ix_(F, F)])
+        a = _cho_solve(L, np.ones(len(F)))
+        b = _cho_solve(L, mu[F])
+        nu = (1.0 - lam * b.sum()) / a.sum()
+        wF = lam * b + nu * a
+        if wF.min() < -1e-12:
+            free[F[np.argmin(wF)]] = False
+            continue
+        w = np.zeros(N)
+        w[F] = np.maximum(wF, 0.0)
+        grad = cov @ w - lam * mu - nu
+        bound = np.flatnonzero(~free)
+        if bound.size and grad[bound].min() < -1e-12:
+            free[bound[np.argmin(grad[bound])]] = True
+            continue
+        break
+    return w / w.sum()
+
+def _cho_solve(L, b):
+    return np.linalg.solve(L.T, np.linalg.solve(L, b))
+
+def min_variance(model):
+    return mean_variance(model, 0.0)
+
+def max_return(model):
+    w = np.zeros(len(model.mu))
+    w[int(np.argmax(model.mu))] = 1.0
+    return w
+
+def risk_parity(model, budgets=None, tol=1e-10, max_iter=100):
+    """
+    Contribuciones al riesgo proporcionales a `budgets` (iguales por defecto):
+    Newton sobre f(y) = ½·y'Σy − Σ b·ln(y), cuyo mínimo normalizado es la solución.
+    """
+    cov = model.cov
+    N = len(cov)
+    b = np.full(N, 1.0 / N) if budgets is None else np.asarray(budgets, dtype=float) / np.sum(budgets)
+    y = 1.0 / np.sqrt(np.diag(cov))
+    for _ in range(max_iter):
+        g = cov @ y - b / y
+        if np.abs(g).max() < tol:
+            break
+        step = np.linalg.solve(cov + np.diag(b / y ** 2), g)
+        t = 1.0
+        while np.any(y - t * step <= 0):
+            t *= 0.5
+        y = y - t * step
+    return y / y.sum()
+
+def _critical_lines(model):
+    """
+    Frontera exacta por tramos: sobre un conjunto fijo de activos libres la
+    solución de `mean_variance` es lineal en λ, w(λ) = w0 + λ·d. Se recorre λ
+    desde 0 (mínima varianza) cambiando el conjunto en cada punto en que un peso
+    llega a 0 o un activo fijado pasa a mejorar la cartera. Devuelve una lista
+    de (λ_inicio, λ_fin, w0, d).
+    """
+    cov, mu, N = model.cov, model.mu, len(model.mu)
+    free = min_variance(model) > 1e-12
+    lam, segments = 0.0, []
+    for _ in range(4 * N + 10):
+        F = np.flatnonzero(free)
+        L = np.linalg.cholesky(cov[np.ix_(F, F)])
+        a = _cho_solve(L, np.ones(len(F)))
+        b = _cho_solve(L, mu[F])
+        sa, sb = a.sum(), b.sum()
+        w0, d = np.zeros(N), np.zeros(N)
+        w0[F] = a / sa
+        if len(F) > 1:
+            d[F] = b - (sb / sa) * a
+        # Con un solo activo libre w es constante (d = 0 exacto, no ruido de redondeo);
+        # si es el de mayor rentabilidad, es la esquina de máxima rentabilidad: fin
+        if len(F) == 1 and mu[F[0]] >= mu.max():
+            segments.append((lam, np.inf, w0, d))
+            break
+        # Gradiente de los activos fijados a 0: g0 + λ·gd (deben seguir ≥ 0)
+        g0 = cov @ w0 - 1.0 / sa
+        cd = cov @ d
+        gd = cd - mu + sb / sa
+        # Tolerancias relativas a la magnitud de los términos que se restan
+        d_tol = 1e-10 * (np.abs(b).max() + abs(sb / sa) * np.abs(a).max())
+        g_tol = 1e-10 * (np.abs(cd) + np.abs(mu) + abs(sb / sa))
+        events = []
+        for i in F:
+            if d[i] < -d_tol:
+                events.append((-w0[i] / d[i], i, False))
+        for i in np.flatnonzero(~free):
+            if gd[i] < -g_tol[i]:
+                events.append((-g0[i] / gd[i], i, True))
+        events = [e for e in events if e[0] > lam + 1e-12]
+        if not events:
+            segments.append((lam, np.inf, w0, d))
+            break
+        nxt, i, enters = min(events, key=lambda e: e[0])
+        segments.append((lam, nxt, w0, d))
+        free[i] = enters
+        lam = nxt
+    return segments
+
+def _segments(model):
+    if model._segments is None:
+        model._segments = _critical_lines(model)
+    return model._segments
+
+def target_volatility(model, target_vol):
+    """Máxima rentabilidad esperada con volatilidad ≤ `target_vol` (sobre la frontera cacheada)."""
+    cov, t2 = model.cov, float(target_vol) ** 2
+    w = None
+    for lo, hi, w0, d in _segments(model):
+        if not (np.isfinite(w0).all() and np.isfinite(d).all()):
+            break       # se queda en el final del último tramo finito
+        # vol²(λ) = A + 2Bλ + Cλ² dentro del tramo (creciente en λ)
+        A, B, C = w0 @ cov @ w0, w0 @ cov @ d, d @ cov @ d
+        if np.isfinite(hi) and A + 2 * B * hi + C * hi * hi < t2:
+            w = w0 + hi * d
+            continue
+        if C <= 1e-18:
+            w = w0 + lo * d
+        else:
+            lam = (-B + np.sqrt(max(B * B - C * (A - t2), 0.0))) / C
+            w = w0 + float(np.clip(lam, lo, hi)) * d
+        break
+    if w is None or not np.isfinite(w).all():
+        return max_return(model)
+    w = np.maximum(w, 0.0)
+    return w / w.sum()
+
+def frontier(model, n_points=FRONTIER_POINTS):
+    """Frontera (vol, rentabilidad, pesos) entre mínima varianza y máxima rentabilidad; cacheada en el modelo."""
+    if model._frontier is not None and len(model._frontier) == n_points:
+        return model._frontier
+    v_lo, v_hi = model.vol(min_variance(model)), model.vol(max_return(model))
+    rows = []
+    for v in np.linspace(v_lo, max(v_lo, v_hi), n_points):
+        w = target_volatility(model, v)
+        rows.append({"vol": model.vol(w), "ret": model.ret(w), **dict(zip(model.tickers, w))})
+    model._frontier = pd.DataFrame(rows)
+    return model._frontier
+
+def tolerance_weights(model, tolerance, scale=(1, 10)):
+    """Control de tolerancia (1..10) → cartera de la frontera con la volatilidad correspondiente."""
+    lo, hi = scale
+    x = (float(tolerance) - lo) / (hi - lo)
+    segments = _segments(model)
+    v_lo = model.vol(segments[0][2])
+    v_hi = model.vol(max_return(model))
+    return target_volatility(model, v_lo + np.clip(x, 0.0, 1.0) * (v_hi - v_lo))
+
+def profile_weights(model, levels=None):
+    """Pesos por perfil (mismo formato que robo.PROFILE_WEIGHTS) sacados de la frontera."""
+    levels = levels or {"Conservador": 2, "Moderado": 5, "Agresivo": 8}
+    return {name: tuple(tolerance_weights(model, lvl)) for name, lvl in levels.items()}
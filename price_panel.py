@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Panel de precios canónico en ficheros mapeados en memoria (solo lectura),
+compartido por todas las sesiones de la app y todos los procesos/workers.
+
+Cada ticker se guarda con su propio calendario (las fechas de sus velas, en
+datetime64[ns]; no hay un calendario común): un .npy con el bloque de fechas
+seguido del bloque de cierres (float64 o, con `FINCONTROL_PANEL_DTYPE=float32`,
+la mitad de memoria a cambio de ~7 cifras significativas), y al lado un .json
+con los metadatos del almacén (covered_from, fetched_at). Ambos llevan el tipo
+en el nombre. Solo `window` alinea varios tickers sobre la unión de sus
+fechas, y eso sí copia la ventana.
+
+`read` devuelve una pd.Series cuyos valores e índice son vistas del fichero
+mapeado: recortarla no copia, y como las páginas son del sistema operativo
+todas las sesiones y procesos que leen el mismo ticker comparten una sola
+copia en RAM. price_store la usa como capa en memoria, así la memoria
+residente no crece con el nº de sesiones. Las series son de solo lectura.
+
+Lo escribe price_store (cada serie que guarda) con `os.replace`: quien ya
+tenga mapeada la versión anterior la sigue leyendo entera hasta soltarla. Si
+no se puede escribir o mapear, se devuelve la serie en memoria normal.
+"""
+import json
+import os
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+import telemetry
+
+PANEL_DIR = Path(os.environ["FINCONTROL_PRICE_PANEL"]) if os.environ.get("FINCONTROL_PRICE_PANEL") else None
+DTYPE = np.dtype(os.environ.get("FINCONTROL_PANEL_DTYPE", "float64"))
+_DATE = np.dtype("datetime64[ns]")
+
+def configure(path=None, dtype=None):
+    """Cambia de directorio (None = `<price_store.STORE_DIR>/_panel`) y/o de tipo de las columnas."""
+    global PANEL_DIR, DTYPE
+    PANEL_DIR = Path(path) if path is not None else None
+    if dtype is not None:
+        DTYPE = np.dtype(dtype)
+    if DTYPE not in (np.dtype("float64"), np.dtype("float32")):
+        raise ValueError(f"dtype no soportado para el panel: {DTYPE}")
+
+def panel_dir():
+    if PANEL_DIR is not None:
+        return PANEL_DIR
+    import price_store  # diferido: price_store importa este módulo
+
+    return price_store.STORE_DIR / "_panel"
+
+def _paths(ticker):
+    # El tipo va en los dos nombres: paneles float32 y float64 no comparten calendario ni metadatos
+    stem = f"{quote(ticker.strip().upper(), safe='')}.{DTYPE.str[1:]}"
+    root = panel_dir()
+    return root / f"{stem}.npy", root / f"{stem}.json"
+
+# ─────────────────────────────────────────────────────────────────────
+# Formato: [fechas (n × 8 bytes) | cierres (n × itemsize)] en un .npy de bytes
+# ─────────────────────────────────────────────────────────────────────
+def _pack(series):
+    dates = np.ascontiguousarray(pd.DatetimeIndex(series.index).values, dtype=_DATE)
+    values = np.ascontiguousarray(series.to_numpy(dtype=DTYPE))
+    return np.concatenate([dates.view(np.uint8), values.view(np.uint8)])
+
+def _unpack(blob):
+    n = blob.size // (_DATE.itemsize + DTYPE.itemsize)
+    split = n * _DATE.itemsize
+    # El bloque de datos de un .npy empieza alineado a 64 bytes: las vistas no copian
+    dates = blob[:split].view(_DATE)
+    values = blob[split:split + n * DTYPE.itemsize].view(DTYPE)
+    index = pd.DatetimeIndex(dates, name="date", copy=False)
+    return pd.Series(values, index=index, name="close", copy=False)
+
+# ─────────────────────────────────────────────────────────────────────
+# API
+# ─────────────────────────────────────────────────────────────────────
+def publish(ticker, series, meta):
+    """Escribe la columna del ticker (atómico) y devuelve la serie ya mapeada (o `series` si falla)."""
+    path, meta_path = _paths(ticker)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as fh:
+            np.save(fh, _pack(series))
+        os.replace(tmp, path)
+        tmp = meta_path.with_suffix(f".json.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, meta_path)
+        mapped = np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        return series
+    return _unpack(mapped)
+
+def read(ticker):
+    """(serie mapeada, meta) del ticker, o None si no está en el panel."""
+    path, meta_path = _paths(ticker)
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        mapped = np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        telemetry.cache_event("prices.panel", False)
+        return None
+    telemetry.cache_event("prices.panel", True)
+    return _unpack(mapped), meta
+
+def is_mapped(series):
+    """True si los valores de la serie son una vista de un fichero del panel."""
+    base = series.to_numpy()
+    while base is not None and not isinstance(base, np.memmap):
+        base = base.base
+    return base is not None
+
+def window(series, start=None, end=None):
+    """
+    Panel alineado fechas × tickers en [start, end) a partir de {ticker: serie}
+    (o una lista de pares, para admitir tickers repetidos), con NaN donde un
+    ticker no tiene vela. Solo se copia la ventana pedida.
+    """
+    items = list(series.items()) if isinstance(series, dict) else list(series)
+    lo = pd.Timestamp(start) if start is not None else None
+    hi = pd.Timestamp(end) if end is not None else None
+    cols = []
+    for _, s in items:
+        a = s.index.searchsorted(lo, side="left") if lo is not None else 0
+        b = s.index.searchsorted(hi, side="left") if hi is not None else len(s)
+        cols.append(s.iloc[a:b])
+    if not cols:
+        return pd.DataFrame()
+    return pd.concat(cols, axis=1, keys=[t for t, _ in items])
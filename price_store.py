@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Almacén de precios en disco: un fichero Parquet por ticker con el cierre
+ajustado diario. Se lee antes de ir a Yahoo y solo se descargan las velas
+que faltan (antes de la primera o después de la última guardada). Lo comparten
+todos los procesos/workers (escritura atómica con `os.replace`) y sobrevive a
+reinicios. En memoria se guarda además la serie más amplia de cada ticker,
+mapeada desde el panel compartido (price_panel): los recortes que devuelve
+`load_prices` son vistas de solo lectura, sin copia por sesión ni por proceso.
+Las descargas pasan por fetch (peticiones compartidas, límites y reintentos).
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+import fetch
+import price_panel
+import telemetry
+import ticker_index
+
+STORE_DIR = Path(os.environ.get("FINCONTROL_PRICE_STORE", ".cache/prices"))
+REFRESH_TTL = 3600          # segundos antes de volver a pedir velas nuevas
+ADJ_TOLERANCE = 1e-4        # diferencia relativa admitida en la vela solapada
+FETCH_WORKERS = 4           # descargas agrupadas en paralelo como máximo
+_META_KEY = b"fincontrol"
+
+# ─────────────────────────────────────────────────────────────────────
+# Lectura / escritura
+# ─────────────────────────────────────────────────────────────────────
+def _path(ticker):
+    return STORE_DIR / f"{quote(ticker.strip().upper(), safe='')}.parquet"
+
+def read_store(ticker):
+    """Devuelve (serie, meta) guardados para el ticker; serie vacía si no hay."""
+    import pyarrow.parquet as pq  # diferido: solo al tocar disco
+
+    path = _path(ticker)
+    if not path.exists():
+        telemetry.cache_event("prices.disk", False)
+        return pd.Series(dtype=float), {}
+    try:
+        table = pq.read_table(path)
+    except Exception:
+        telemetry.cache_event("prices.disk", False)
+        return pd.Series(dtype=float), {}
+    telemetry.cache_event("prices.disk", True)
+    telemetry.add_bytes("disk", path.stat().st_size)
+    raw = (table.schema.metadata or {}).get(_META_KEY)
+    meta = json.loads(raw) if raw else {}
+    df = table.to_pandas()
+    s = df["close"].astype(float)
+    s.index = pd.to_datetime(df.index)
+    return s, meta
+
+def read_disk(ticker):
+    """Como `read_store`, pero desde el panel mapeado si está (y, si no, lo publica)."""
+    hit = price_panel.read(ticker)
+    if hit is not None:
+        return hit
+    s, meta = read_store(ticker)
+    if meta.get("covered_from"):
+        s = price_panel.publish(ticker, s, meta)
+    return s, meta
+
+def write_store(ticker, series, meta):
+    """Escritura atómica: fichero temporal en el mismo directorio + `os.replace`."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = _path(ticker)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df = pd.DataFrame({"close": series.astype(float).values},
+                      index=pd.DatetimeIndex(series.index, name="date"))
+    table = pa.Table.from_pandas(df)
+    table = table.replace_schema_metadata(
+        {**(table.schema.metadata or {}), _META_KEY: json.dumps(meta).encode()})
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    pq.write_table(table, tmp)
+    os.replace(tmp, path)
+
+# ─────────────────────────────────────────────────────────────────────
+# Descarga
+# ─────────────────────────────────────────────────────────────────────
+@telemetry.timed("price_store.download")
+def fetch_yahoo(ticker, start, end=None):
+    return fetch.download([ticker.strip()], start, end)[ticker.strip()]
+
+def fetch_yahoo_many(tickers, start, end=None):
+    """Una sola descarga para varios tickers → {ticker: serie} (agrupada y compartida en fetch)."""
+    tickers = list(dict.fromkeys(t.strip() for t in tickers))
+    with telemetry.stage("price_store.download"):
+        return fetch.download(tickers, start, end)
+
+def _merge(old, new):
+    if old.empty:
+        return new
+    if new.empty:
+        return old
+    return pd.concat([old[~old.index.isin(new.index)], new]).sort_index()
+
+def _iso(ts):
+    return pd.Timestamp(ts).strftime("%Y-%m-%d")
+
+# ─────────────────────────────────────────────────────────────────────
+# Caché por rangos: una serie (la más amplia) por ticker
+# ─────────────────────────────────────────────────────────────────────
+_MEM = {}                  # ticker -> (serie, meta) ya cargados en este proceso
+_LOCKS = {}
+_LOCKS_GUARD = threading.Lock()
+
+def _lock_for(ticker):
+    with _LOCKS_GUARD:
+        return _LOCKS.setdefault(ticker, threading.Lock())
+
+def _is_fresh(meta, now, max_age=REFRESH_TTL):
+    return now - float(meta.get("fetched_at", 0)) <= max_age
+
+def _same_adjustment(old, new):
+    """True si las velas que se solapan coinciden (no hubo reajuste por dividendo/split)."""
+    common = old.index.intersection(new.index)
+    a = old.loc[common].to_numpy(dtype=float)
+    b = new.loc[common].to_numpy(dtype=float)
+    # Solo son comparables los días con ambos cierres finitos y el guardado ≠ 0
+    ok = np.flatnonzero(np.isfinite(a) & np.isfinite(b) & (a != 0))
+    if ok.size == 0:
+        return True
+    i = ok[-1]
+    return abs(b[i] / a[i] - 1.0) <= ADJ_TOLERANCE
+
+def _plan(ticker, start_ts, end_ts, now, max_age=REFRESH_TTL):
+    """
+    Qué falta para cubrir [start_ts, end_ts). Devuelve (serie, meta, jobs) con
+    jobs = {"full"|"head"|"tail": (desde, hasta)} a pedir a Yahoo.
+    """
+    cached = _MEM.get(ticker)
+    fresh = cached is not None and _is_fresh(cached[1], now, max_age)
+    telemetry.cache_event("prices.memory", fresh)
+    if not fresh:
+        cached = read_disk(ticker)
+    s, meta = cached
+    jobs = {}
+    covered_from = pd.Timestamp(meta["covered_from"]) if meta.get("covered_from") else None
+    if covered_from is None:
+        jobs["full"] = (start_ts, None)
+        return s, meta, jobs
+    if start_ts < covered_from:
+        # Solo el tramo anterior a lo guardado (+ la primera vela para comprobar ajuste)
+        head_end = s.index[0] + pd.Timedelta(days=1) if not s.empty else covered_from
+        jobs["head"] = (start_ts, head_end)
+    last = s.index[-1] if not s.empty else None
+    needs_tail = end_ts is None or last is None or end_ts > last + pd.Timedelta(days=1)
+    if needs_tail and not _is_fresh(meta, now, max_age):
+        # Desde la última vela (inclusive) para detectar reajustes
+        jobs["tail"] = (last if last is not None else covered_from, None)
+    return s, meta, jobs
+
+def _apply(ticker, s, meta, start_ts, fetched, now):
+    """Incorpora lo descargado (`fetched` = {job: serie}), persiste y devuelve la serie."""
+    if "full" in fetched:
+        s = fetched["full"]
+        meta = {"covered_from": _iso(start_ts), "fetched_at": now}
+    else:
+        if "head" in fetched:
+            head = fetched["head"]
+            if _same_adjustment(s, head):
+                s = _merge(s, head)
+            else:
+                s = fetch_yahoo(ticker, _iso(start_ts))
+                meta = {**meta, "fetched_at": now}
+            meta = {**meta, "covered_from": _iso(start_ts)}
+        if "tail" in fetched:
+            new = fetched["tail"]
+            if _same_adjustment(s, new):
+                s = _merge(s, new)
+            else:
+                # Dividendo/split: el histórico ajustado cambió, se rehace entero
+                s = fetch_yahoo(ticker, meta["covered_from"])
+            meta = {**meta, "fetched_at": now}
+    if fetched:
+        write_store(ticker, s, meta)
+        ticker_index.record_series(ticker, s, meta.get("covered_from"), now)
+        s = price_panel.publish(ticker, s, meta)
+    _MEM[ticker] = (s, meta)
+    return s
+
+def _ensure_range(ticker, start_ts, end_ts):
+    """Amplía la serie guardada para cubrir [start_ts, end_ts) y la devuelve entera."""
+    now = time.time()
+    s, meta, jobs = _plan(ticker, start_ts, end_ts, now)
+    fetched = {kind: fetch_yahoo(ticker, _iso(lo), _iso(hi) if hi is not None else None)
+               for kind, (lo, hi) in jobs.items()}
+    return _apply(ticker, s, meta, start_ts, fetched, now)
+
+def _slice(s, ticker, start_ts, end_ts):
+    lo = s.index.searchsorted(start_ts, side="left")
+    hi = s.index.searchsorted(end_ts, side="left") if end_ts is not None else len(s)
+    out = s.iloc[lo:hi]                # vista: el panel mapeado es de solo lectura
+    out.name = ticker
+    return out
+
+# ─────────────────────────────────────────────────────────────────────
+# Metadatos (moneda de cotización)
+# ─────────────────────────────────────────────────────────────────────
+CURRENCY_TTL = 86400
+_CURRENCIES = {}           # ticker -> (moneda, instante de consulta)
+
+def ticker_currency(ticker, max_age=CURRENCY_TTL):
+    """Moneda de cotización según Yahoo (fast_info y, si no, .info); 'USD' por defecto."""
+    ticker = ticker.strip()
+    hit = _CURRENCIES.get(ticker)
+    if hit and time.time() - hit[1] <= max_age:
+        telemetry.cache_event("currency", True)
+        return hit[0]
+    telemetry.cache_event("currency", False)
+    # Índice persistente (la consulta de otro proceso o de antes de reiniciar)
+    known = ticker_index.lookup(ticker)
+    fresh = (known is not None and known.currency and known.currency_at is not None
+             and time.time() - known.currency_at <= max_age)
+    telemetry.cache_event("ticker_index", bool(fresh))
+    if fresh:
+        _CURRENCIES[ticker] = (known.currency, known.currency_at)
+        return known.currency
+    cur = None
+    with telemetry.stage("price_store.currency_lookup"):
+        try:
+            info = fetch.info(ticker)
+            cur = info.get("currency")
+            ticker_index.record_info(ticker, info)
+        except Exception:
+            pass
+    cur = cur or "USD"
+    _CURRENCIES[ticker] = (cur, time.time())
+    return cur
+
+def ticker_currencies(tickers, max_age=CURRENCY_TTL):
+    """{ticker: moneda} consultando en paralelo (como mucho FETCH_WORKERS a la vez)."""
+    tickers = list(dict.fromkeys(t.strip() for t in tickers if t and t.strip()))
+    if not tickers:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(tickers))) as pool:
+        lookup = telemetry.propagate(ticker_currency)
+        return dict(zip(tickers, pool.map(lambda t: lookup(t, max_age), tickers)))
+
+# ─────────────────────────────────────────────────────────────────────
+# API
+# ─────────────────────────────────────────────────────────────────────
+def load_prices(ticker, start, end=None):
+    """
+    Cierre ajustado diario de `ticker` en [start, end) (end exclusivo, como yfinance).
+    Cualquier subrango se sirve recortando la serie más amplia ya cargada; solo se
+    va a Yahoo si el rango pedido se sale de lo cubierto o la cola está caducada.
+    """
+    ticker = ticker.strip()
+    start_ts = pd.Timestamp(start.strip() if isinstance(start, str) else start)
+    end_ts = pd.Timestamp(end) if end is not None else None
+    with _lock_for(ticker):
+        s = _ensure_range(ticker, start_ts, end_ts)
+    return _slice(s, ticker, start_ts, end_ts)
+
+def load_prices_many(tickers, start, end=None, max_age=REFRESH_TTL):
+    """
+    Igual que `load_prices` para varios tickers (activos y pares FX), pero lo que
+    falta se pide agrupado: una `yf.download` por tipo de tramo (completo, cabeza,
+    cola) y los grupos en paralelo, así el tiempo es ~1 ida y vuelta a Yahoo.
+    `max_age` (segundos) sustituye a REFRESH_TTL; con 0 se piden siempre las
+    velas nuevas (lo usa warmup.py). Devuelve {ticker: serie}.
+    """
+    tickers = list(dict.fromkeys(t.strip() for t in tickers if t and t.strip()))
+    start_ts = pd.Timestamp(start.strip() if isinstance(start, str) else start)
+    end_ts = pd.Timestamp(end) if end is not None else None
+    locks = [_lock_for(t) for t in sorted(tickers)]
+    for lock in locks:
+        lock.acquire()
+    try:
+        now = time.time()
+        plans = {t: _plan(t, start_ts, end_ts, now, max_age) for t in tickers}
+        # Agrupa por tipo de tramo; el rango del grupo cubre el de todos sus tickers
+        groups = {}
+        for t, (_, _, jobs) in plans.items():
+            for kind, (lo, hi) in jobs.items():
+                g = groups.setdefault(kind, {"tickers": [], "lo": lo, "hi": hi})
+                g["tickers"].append(t)
+                g["lo"] = min(g["lo"], lo)
+                g["hi"] = None if g["hi"] is None or hi is None else max(g["hi"], hi)
+        fetched = {t: {} for t in tickers}
+        if groups:
+            with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(groups))) as pool:
+                futures = {kind: pool.submit(telemetry.propagate(fetch_yahoo_many), g["tickers"], _iso(g["lo"]),
+                                             _iso(g["hi"]) if g["hi"] is not None else None)
+                           for kind, g in groups.items()}
+                for kind, fut in futures.items():
+                    for t, series in fut.result().items():
+                        fetched[t][kind] = series
+        full = {t: _apply(t, s, meta, start_ts, fetched[t], now) for t, (s, meta, _) in plans.items()}
+    finally:
+        for lock in locks:
+            lock.release()
+
+    return {t: _slice(s, t, start_ts, end_ts) for t, s in full.items()}
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Proyección Monte Carlo hacia el futuro: remuestreo por bloques (block
+bootstrap) de las rentabilidades mensuales históricas de los activos elegidos.
+Se remuestrean filas completas (todos los activos del mismo mes), de modo que
+se conserva la correlación entre activos, y los bloques mantienen parte de la
+autocorrelación. Cada camino se simula con las mismas reglas DCA + rebalanceo
+que engine.dca_engine.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+@dataclass
+class Projection:
+    bands: pd.DataFrame      # meses × percentiles del valor total
+    final: pd.Series         # percentiles del valor final
+    contributed: float       # total aportado en el horizonte
+    n_paths: int
+
+def bootstrap_paths(returns, horizon_months, n_paths, block_len, rng):
+    """
+    Rentabilidades simuladas (horizon_months, n_paths, N) por block bootstrap
+    circular sobre `returns` (M, N). El tiempo va en el primer eje para que
+    cada tramo entre rebalanceos sea un bloque contiguo de memoria.
+    """
+    M = returns.shape[0]
+    L = max(1, min(int(block_len), M))
+    n_blocks = -(-horizon_months // L)
+    starts = rng.integers(0, M, size=(n_paths, n_blocks))
+    idx = (starts[:, :, None] + np.arange(L)) % M
+    idx = idx.reshape(n_paths, n_blocks * L)[:, :horizon_months]
+    return returns[idx.T]
+
+def _paths_totals(px, weights, contribution, rebs):
+    """Valor total (H, P) de cada camino con precios (H, P, N); mismas reglas que dca_engine."""
+    H, P, N = px.shape
+    buys = contribution * weights / px
+    totals = np.empty((H, P))
+    base = np.zeros((P, N))
+    bounds = [(r + 1, True) for r in rebs]
+    if not rebs or rebs[-1] + 1 < H:
+        bounds.append((H, False))
+    pos = 0
+    for end, is_reb in bounds:
+        seg_px = px[pos:end]
+        shares = np.cumsum(buys[pos:end], axis=0)
+        shares += base
+        cash = contribution * np.arange(1, end - pos + 1, dtype=float)
+        totals[pos:end] = np.einsum("tpn,tpn->tp", shares, seg_px) + cash[:, None]
+        if is_reb:
+            s, p = shares[-1], px[end - 1]
+            vals = s * p
+            pv = vals.sum(axis=1) + cash[-1]
+            base = s + (weights * pv[:, None] - vals) / p
+            totals[end - 1] = (base * p).sum(axis=1)
+        else:
+            base = shares[-1]
+        pos = end
+    return totals
+
+def project_dca(monthly_prices, weights, monthly_contribution, horizon_years, rebalance_months,
+                n_paths=10_000, block_len=12, seed=None, chunk_size=5_000, band_step=12,
+                percentiles=PERCENTILES):
+    """
+    Proyecta `n_paths` caminos de aportaciones mensuales durante `horizon_years`.
+
+    monthly_prices: DataFrame mensual (meses × activos) en la moneda de la cartera.
+    Las bandas se guardan cada `band_step` meses (y en el último), así la memoria
+    es O(chunk_size × meses × activos) para simular + O(n_paths × puntos) para
+    los percentiles. Con el mismo `seed` y `chunk_size` el resultado es idéntico.
+    """
+    rets = monthly_prices.pct_change(fill_method=None).dropna(how="any").to_numpy(dtype=float)
+    H = int(round(horizon_years * 12))
+    if rets.shape[0] == 0 or H <= 0:
+        return Projection(pd.DataFrame(), pd.Series(dtype=float), 0.0, 0)
+    w = np.asarray(weights, dtype=float)
+    R = int(rebalance_months or 0)
+    rebs = list(range(R - 1, H, R)) if R > 0 else []
+    checkpoints = np.unique(np.append(np.arange(band_step - 1, H, band_step), H - 1))
+
+    rng = np.random.default_rng(seed)
+    sampled = np.empty((n_paths, len(checkpoints)))
+    for lo in range(0, n_paths, chunk_size):
+        n = min(chunk_size, n_paths - lo)
+        r = bootstrap_paths(rets, H, n, block_len, rng)
+        px = np.cumprod(1.0 + r, axis=0)
+        sampled[lo:lo + n] = _paths_totals(px, w, float(monthly_contribution), rebs)[checkpoints].T
+
+    q = np.percentile(sampled, percentiles, axis=0)
+    bands = pd.DataFrame(q.T, index=pd.Index(checkpoints + 1, name="month"),
+                         columns=[f"p{p}" for p in percentiles])
+    bands["contributed"] = (checkpoints + 1) * float(monthly_contribution)
+    final = pd.Series(q[:, -1], index=[f"p{p}" for p in percentiles])
+    return Projection(bands, final, float(H * monthly_contribution), n_paths)
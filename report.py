@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Informe PDF de una simulación, fuera del camino de la página.
+
+- `ReportData` reúne todo lo que sale en el informe (también la fecha, al
+  día); el PDF se cachea en result_cache con esa clave, así repetir una
+  simulación no vuelve a pasar por ReportLab.
+- `prefetch_pdf` lo genera en un hilo en segundo plano mientras la página se
+  pinta; la app recoge sus bytes al llegar al botón de descarga, y
+  `report_pdf` espera a ese mismo cálculo si aún no ha terminado en lugar de
+  repetirlo.
+- ReportLab se importa al generar el primer informe, no al importar el módulo.
+
+Para miles de clientes, `batch.py --reports` genera un PDF por cliente en los
+procesos del lote.
+"""
+import io
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+
+import telemetry
+from result_cache import RESULTS, make_key
+
+_WORKER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report")
+
+@dataclass
+class ReportData:
+    brand: str
+    lang: str                       # 'ES' | 'EN'
+    perfil: str
+    aportacion: float
+    rebalanceo: object              # texto u opción del selector, tal cual se muestra
+    currency: str
+    weights_pct: dict = field(default_factory=dict)    # {ticker: '60.0%'}
+    tickers: list = field(default_factory=list)
+    stats: dict = field(default_factory=dict)          # CAGR, Vol, MaxDD, Sharpe
+    valor_final: float = 0.0
+    aportado: float = 0.0
+    hhi: float = 0.0
+    neff: float = 0.0
+    # Fecha impresa en el informe: forma parte de la clave, así un PDF cacheado no sale con la de otro día
+    fecha: str = field(default_factory=lambda: date.today().isoformat())
+
+    def key(self):
+        return make_key("report.pdf", self)
+
+# ─────────────────────────────────────────────────────────────────────
+# Render
+# ─────────────────────────────────────────────────────────────────────
+def generar_pdf(buffer, brand, lang, perfil, aportacion, rebalanceo_opt, currency,
+                weights_pct, tickers, stats, valor_final, aportado, hhi, neff, fecha=None):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(buffer, pagesize=A4)
+    W, H = A4; x, y = 2*cm, H - 2*cm
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(x, y, f"{brand} — {'Informe de Simulación' if lang=='ES' else 'Simulation Report'}")
+    y -= 1.2*cm; c.setFont("Helvetica", 11)
+    fecha = fecha or date.today().isoformat()
+    c.drawString(x, y, (f"Fecha: {fecha}" if lang=='ES' else f"Date: {fecha}"))
+    y -= 0.8*cm
+    line1 = (f"Perfil: {perfil}  |  Aportación: {('€' if currency=='EUR' else '$')}{aportacion:,.2f}  |  Rebalanceo: {rebalanceo_opt}"
+             if lang=='ES' else
+             f"Profile: {perfil}  |  Monthly: {('€' if currency=='EUR' else '$')}{aportacion:,.2f}  |  Rebalancing: {rebalanceo_opt}")
+    c.drawString(x, y, line1); y -= 0.8*cm
+    c.drawString(x, y, f"Moneda: {currency}  |  Pesos: {weights_pct}"); y -= 0.6*cm
+    c.drawString(x, y, f"Tickers: {tickers}"); y -= 1.0*cm
+    c.setFont("Helvetica-Bold", 12); c.drawString(x, y, ("Resultados" if lang=='ES' else "Results")); y -= 0.8*cm
+    c.setFont("Helvetica", 11)
+    c.drawString(x, y, (f"Valor final: {('€' if currency=='EUR' else '$')}{valor_final:,.2f}" if lang=='ES' else f"Final value: {('€' if currency=='EUR' else '$')}{valor_final:,.2f}")); y -= 0.6*cm
+    c.drawString(x, y, (f"Aportado: {('€' if currency=='EUR' else '$')}{aportado:,.2f}" if lang=='ES' else f"Contributed: {('€' if currency=='EUR' else '$')}{aportado:,.2f}")); y -= 0.6*cm
+    c.drawString(x, y, f"CAGR: {stats['CAGR']*100:.2f}%  |  Vol: {stats['Vol']*100:.2f}%"); y -= 0.6*cm
+    c.drawString(x, y, f"MaxDD: {stats['MaxDD']*100:.2f}%  |  Sharpe: {stats['Sharpe']:.2f}"); y -= 0.6*cm
+    c.drawString(x, y, (f"Concentración (HHI): {hhi:.3f}  |  Nº efectivo: {neff:.2f}" if lang=='ES' else
+                        f"Concentration (HHI): {hhi:.3f}  |  Effective N: {neff:.2f}"))
+    y -= 1.0*cm; c.setFont("Helvetica-Oblique", 9)
+    c.drawString(x, y, ("Nota: Simulación educativa. No es asesoramiento financiero ni mueve dinero real."
+                        if lang=='ES' else
+                        "Note: Educational simulation. Not financial advice and no real money is moved."))
+    c.showPage(); c.save()
+
+@telemetry.timed("report.render_pdf")
+def render_pdf(data):
+    """Bytes del PDF de `data` (sin caché)."""
+    buffer = io.BytesIO()
+    generar_pdf(buffer, data.brand, data.lang, data.perfil, data.aportacion, data.rebalanceo, data.currency,
+                data.weights_pct, data.tickers, data.stats, data.valor_final, data.aportado, data.hhi, data.neff,
+                data.fecha)
+    return buffer.getvalue()
+
+# ─────────────────────────────────────────────────────────────────────
+# Caché y segundo plano
+# ─────────────────────────────────────────────────────────────────────
+def report_pdf(data):
+    """PDF de `data` desde la caché; si no está (o se está generando) lo genera o espera."""
+    return RESULTS.get_or_compute(data.key(), lambda: render_pdf(data))
+
+def prefetch_pdf(data):
+    """Encola la generación en segundo plano (la página no espera); devuelve el Future."""
+    return _WORKER.submit(telemetry.propagate(report_pdf), data)
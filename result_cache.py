@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Caché de resultados direccionada por contenido: la clave es un hash de las
+entradas normalizadas (activos, pesos, aportación, fechas, costes...) y de la
+huella de los precios usados, así dos sesiones con los mismos parámetros
+comparten el resultado y un precio nuevo invalida solo lo que depende de él.
+
+- Memoria: LRU acotada en bytes (tamaño medido con pickle al guardar) de
+  objetos vivos; un acierto no copia ni deserializa nada, así que quien lea
+  un resultado no debe modificarlo.
+- Disco (opcional, `FINCONTROL_RESULT_CACHE`): un pickle por clave con
+  escritura atómica; lo comparten los workers y sobrevive a reinicios. LRU por
+  último acceso, acotada también en bytes: el total se cuenta una vez y se
+  lleva al día en cada escritura, y el directorio solo se recorre al pasarse
+  del límite. Solo para un directorio propio: pickle ejecuta código al cargar.
+- Una sola sesión calcula cada clave; las demás esperan su resultado.
+"""
+import dataclasses
+import datetime as dt
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import telemetry
+
+MEMORY_MB = float(os.environ.get("FINCONTROL_RESULT_CACHE_MB", 128))
+DISK_DIR = os.environ.get("FINCONTROL_RESULT_CACHE")        # sin definir = solo memoria
+DISK_MB = float(os.environ.get("FINCONTROL_RESULT_CACHE_DISK_MB", 1024))
+STALE_TMP_SECONDS = 3600    # temporales más viejos: restos de un proceso que murió escribiendo
+
+# ─────────────────────────────────────────────────────────────────────
+# Claves
+# ─────────────────────────────────────────────────────────────────────
+def fingerprint(obj):
+    """Huella corta del contenido de un array, serie o DataFrame (índice incluido)."""
+    h = hashlib.blake2b(digest_size=12)
+    if isinstance(obj, (pd.Series, pd.DataFrame)):
+        h.update(repr(obj.shape).encode())
+        if isinstance(obj, pd.DataFrame):
+            h.update(json.dumps([str(c) for c in obj.columns]).encode())
+        idx = obj.index
+        h.update(idx.asi8.tobytes() if isinstance(idx, pd.DatetimeIndex) else
+                 pd.util.hash_pandas_object(idx).to_numpy().tobytes())
+        h.update(np.ascontiguousarray(obj.to_numpy(dtype=float)).tobytes())
+    else:
+        a = np.ascontiguousarray(obj)
+        h.update(f"{a.dtype.str}{a.shape}".encode())
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+def _normalize(obj):
+    """Forma canónica serializable en JSON: 300 y 300.0 dan la misma clave."""
+    if obj is None or isinstance(obj, (bool, str)):
+        return obj
+    if isinstance(obj, (int, float, np.integer, np.floating)):
+        return repr(float(obj))
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {"__type__": type(obj).__name__,
+                **{f.name: _normalize(getattr(obj, f.name)) for f in dataclasses.fields(obj)}}
+    if isinstance(obj, dict):
+        return {str(k): _normalize(v) for k, v in sorted(obj.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(obj, (list, tuple)):
+        return [_normalize(v) for v in obj]
+    if isinstance(obj, (set, frozenset)):
+        return sorted(_normalize(v) for v in obj)
+    if isinstance(obj, (pd.Timestamp, dt.date, dt.datetime)):
+        return pd.Timestamp(obj).isoformat()
+    if isinstance(obj, (np.ndarray, pd.Series, pd.DataFrame)):
+        return {"__data__": fingerprint(obj)}
+    raise TypeError(f"No se puede usar {type(obj).__name__} en una clave de caché")
+
+def make_key(namespace, *parts):
+    """Hash (hex) del espacio de nombres y las entradas normalizadas."""
+    body = json.dumps([namespace, _normalize(parts)], sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(body.encode(), digest_size=20).hexdigest()
+
+# ─────────────────────────────────────────────────────────────────────
+# Caché en dos niveles
+# ─────────────────────────────────────────────────────────────────────
+class ResultCache:
+    """LRU en memoria acotada en bytes + nivel opcional en disco (seguro entre hilos)."""
+
+    def __init__(self, max_bytes=int(MEMORY_MB * 2**20), disk_dir=DISK_DIR, disk_max_bytes=int(DISK_MB * 2**20)):
+        self.max_bytes = int(max_bytes)
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = int(disk_max_bytes)
+        self._mem = OrderedDict()          # clave -> (valor, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._computing = {}               # clave -> Lock (una sola sesión calcula cada clave)
+        self._disk_bytes = None            # bytes en disco (se cuentan una vez al primer uso)
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+
+    # ───────── memoria ─────────
+    def _mem_get(self, key):
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None:
+                self._mem.move_to_end(key)
+            return item
+
+    def _mem_put(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._mem.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._mem[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._mem:
+                _, (_, freed) = self._mem.popitem(last=False)
+                self._bytes -= freed
+                self._stats["evictions"] += 1
+
+    # ───────── disco ─────────
+    def _path(self, key):
+        return self.disk_dir / key[:2] / f"{key}.pkl"
+
+    def _disk_get(self, key):
+        if self.disk_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+            os.utime(path)                 # último acceso, para la LRU del disco
+            return pickle.loads(blob), len(blob)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+
+    def _disk_put(self, key, blob):
+        if self.disk_dir is None or len(blob) > self.disk_max_bytes:
+            return
+        path = self._path(key)
+        try:
+            if self._disk_bytes is None:
+                self._disk_evict()         # primer uso: cuenta lo que ya hay (y limpia)
+            try:
+                replaced = path.stat().st_size
+            except OSError:
+                replaced = 0
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(blob)
+            os.replace(tmp, path)
+            with self._lock:
+                over = False
+                if self._disk_bytes is not None:   # None: `clear` lo vació, se recuenta en la próxima
+                    self._disk_bytes += len(blob) - replaced
+                    over = self._disk_bytes > self.disk_max_bytes
+            if over:
+                self._disk_evict()
+        except OSError:
+            pass
+
+    def _disk_evict(self):
+        """
+        Recorre el directorio: recuenta los bytes, borra temporales huérfanos y,
+        si se pasa del límite, los ficheros menos usados hasta bajar al 90 %
+        (así no se vuelve a recorrer en la siguiente escritura). Solo se llama
+        al primer uso y cuando el total llevado en memoria supera el límite;
+        también recoge lo que hayan escrito o borrado otros procesos.
+        """
+        files = []
+        now = time.time()
+        for sub in self.disk_dir.iterdir() if self.disk_dir.is_dir() else ():
+            if not sub.is_dir():
+                continue
+            for f in sub.iterdir():
+                try:
+                    st = f.stat()
+                    if f.suffix == ".tmp":
+                        # Un escritor vivo tarda milisegundos; uno de hace una hora murió a medias
+                        if now - st.st_mtime > STALE_TMP_SECONDS:
+                            f.unlink()
+                    elif f.suffix == ".pkl":
+                        files.append((st.st_mtime, st.st_size, f))
+                except OSError:
+                    continue
+        total = sum(size for _, size, _ in files)
+        if total > self.disk_max_bytes:
+            target = int(self.disk_max_bytes * 0.9)
+            for _, size, f in sorted(files):
+                if total <= target:
+                    break
+                try:
+                    f.unlink()
+                    total -= size
+                    with self._lock:
+                        self._stats["disk_evictions"] += 1
+                except OSError:
+                    pass
+        with self._lock:
+            self._disk_bytes = total
+
+    # ───────── API ─────────
+    def _lookup(self, key, count_miss=True):
+        """(True, valor) si está en memoria o en disco (y lo sube a memoria); (False, None) si no."""
+        item = self._mem_get(key)
+        if item is not None:
+            self._count("memory_hits", "results.memory", True)
+            return True, item[0]
+        if self.disk_dir is not None:
+            found = self._disk_get(key)
+            telemetry.cache_event("results.disk", found is not None)
+            if found is not None:
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+                self._mem_put(key, *found)
+                return True, found[0]
+        if count_miss:
+            self._count("misses", "results.memory", False)
+        return False, None
+
+    def _count(self, stat, cache, hit):
+        with self._lock:
+            self._stats[stat] += 1
+        telemetry.cache_event(cache, hit)
+
+    def get(self, key, default=None):
+        hit, value = self._lookup(key)
+        return value if hit else default
+
+    def put(self, key, value):
+        """Guarda `value`; si no se puede serializar con pickle no se cachea."""
+        try:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return
+        self._mem_put(key, value, len(blob))
+        self._disk_put(key, blob)
+
+    def get_or_compute(self, key, fn):
+        """Valor de `key` o, si no está, `fn()` (calculado una sola vez aunque lo pidan varias sesiones)."""
+        hit, value = self._lookup(key, count_miss=False)
+        if hit:
+            return value
+        with self._lock:
+            gate = self._computing.setdefault(key, threading.Lock())
+        with gate:
+            item = self._mem_get(key)      # otra sesión pudo calcularlo mientras esperábamos
+            if item is not None:
+                self._count("memory_hits", "results.memory", True)
+                return item[0]
+            self._count("misses", "results.memory", False)
+            try:
+                value = fn()
+                self.put(key, value)
+            finally:
+                with self._lock:
+                    self._computing.pop(key, None)
+        return value
+
+    def clear(self, disk=False):
+        with self._lock:
+            self._mem.clear()
+            self._bytes = 0
+        if disk and self.disk_dir is not None and self.disk_dir.exists():
+            for f in self.disk_dir.glob("*/*.pkl"):
+                try:
+                    f.unlink()
+                except OSError:
+                    pass
+            with self._lock:
+                self._disk_bytes = None
+
+    def stats(self):
+        """Aciertos por nivel, fallos, expulsiones, tasa de acierto y ocupación en memoria."""
+        with self._lock:
+            s = dict(self._stats, entries=len(self._mem), bytes=self._bytes, max_bytes=self.max_bytes)
+        lookups = s["memory_hits"] + s["disk_hits"] + s["misses"]
+        s["hit_rate"] = (s["memory_hits"] + s["disk_hits"]) / lookups if lookups else 0.0
+        return s
+
+RESULTS = ResultCache()     # compartida por todas las sesiones del proceso
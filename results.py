@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Resultados de una simulación de la app (serie de la cartera, métricas,
+proyección y mapa de fechas de entrada), cacheados en result_cache con una
+clave por entradas + huella de los precios: si otra sesión ya simuló lo mismo
+(lo normal con los valores por defecto, que además precalienta warmup.py) se
+reutiliza. Los resultados se comparten entre sesiones: no modificarlos.
+
+Sin Streamlit: lo usan la app y el precalentado en segundo plano.
+"""
+import telemetry
+from core import perf_stats, price_version, risk_level, simulate_portfolio
+from entry_dates import all_start_dates
+from projection import project_dca
+from result_cache import RESULTS, make_key
+
+def calcular_resultados(assets, aportacion, start, rb, display_currency, costes, horizonte):
+    """Simulación, métricas, proyección y mapa de fechas de entrada; None si no hay datos."""
+    df, prices_m, pf = simulate_portfolio(
+        portfolio=assets,
+        monthly_contribution=float(aportacion),
+        start=start, end=None,
+        rebalance_months=rb,
+        display_currency=display_currency,
+        costs=costes,
+    )
+    if df is None or df.empty:
+        return None
+    stats = perf_stats(df["total"])
+    with telemetry.stage("app.projection"):
+        proj = project_dca(pf.price_frame(prices_m), pf.weights, float(aportacion),
+                           horizon_years=horizonte, rebalance_months=rb, n_paths=10_000, seed=42)
+    with telemetry.stage("app.entry_dates"):
+        grid = all_start_dates(pf.price_frame(prices_m), pf.weights, float(aportacion), rb)
+    cagr_grid = grid["CAGR"].dropna(axis=1, how="all").dropna(axis=0, how="all")
+    cagr_grid.columns = cagr_grid.columns // 12
+    return {"df": df, "prices_m": prices_m, "pf": pf, "stats": stats,
+            "risk": risk_level(stats["Vol"], stats["MaxDD"]), "proj": proj, "cagr_grid": cagr_grid}
+
+def resultados(assets, aportacion, start, rb, display_currency, costes, horizonte):
+    """(clave, resultados) de la simulación; resultados es None si no hay datos en el rango."""
+    version = price_version([a.ticker for a in assets], [a.currency for a in assets],
+                            start, display_currency)
+    key = make_key("app.resultados", assets, float(aportacion), start, rb, display_currency,
+                   costes, horizonte, version)
+    with telemetry.stage("app.resultados"):
+        return key, RESULTS.get_or_compute(key, lambda: calcular_resultados(
+            assets, aportacion, start, rb, display_currency, costes, horizonte))
@@ -1,8 +1,11 @@
 import numpy as np
 import pandas as pd
-import yfinance as yf
 from dataclasses import dataclass
 
+from core import month_end_prices, perf_stats
+from engine import dca_engine, sweep
+from price_store import load_prices_many
+
 # ─────────────────────────────────────────────────────────────────────
 # Config por defecto de ETFs (Europa)
 # ─────────────────────────────────────────────────────────────────────
@@ -23,6 +26,9 @@ PROFILE_WEIGHTS = {
     "Agresivo": (0.80, 0.20)
 }
 
+# Opciones de rebalanceo del sidebar (0 = sin rebalanceo)
+REBALANCE_OPTIONS = (2, 4, 6, 8, 10, 12, 0)
+
 @dataclass
 class PortfolioConfig:
     equity_ticker: str = DEFAULT_EQUITY["ticker"]
@@ -38,87 +44,77 @@ class PortfolioConfig:
 # Utilidades de datos
 # ─────────────────────────────────────────────────────────────────────
 def download_prices(tickers, start, end=None):
-    data = yf.download(tickers, start=start, end=end, progress=False, auto_adjust=True)
-    if isinstance(data, pd.DataFrame) and "Close" in data.columns:
-        px = data["Close"]
-    else:
-        px = data
-    if isinstance(px, pd.Series):
-        px = px.to_frame(tickers if isinstance(tickers, str) else tickers[0])
-    return px.ffill().dropna(how="all")
+    # Desde el almacén en disco (price_store); lo que falte, en una descarga agrupada
+    tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+    px = pd.concat(load_prices_many(tickers, start, end), axis=1)
+    if px.empty:
+        return px
+    return px[tickers].dropna(how="all").ffill()
 
 def monthly_dates(index):
-    return pd.to_datetime(index).to_period("M").to_timestamp("M").unique()
+    return pd.DatetimeIndex(index).to_period("M").to_timestamp("M").unique()
 
 # ─────────────────────────────────────────────────────────────────────
 # Simulación DCA + rebalanceo
 # ─────────────────────────────────────────────────────────────────────
-def simulate_dca(cfg: PortfolioConfig):
+def monthly_prices(cfg: PortfolioConfig, prices=None):
+    """
+    Panel mensual alineado (meses × [equity, bond]) para la configuración: en
+    cada fin de mes, la última vela disponible de ese mes (aunque el último día
+    sea festivo o fin de semana). `prices`: cierres diarios ya cargados (p.ej.
+    de un panel compartido, con NaN donde no hay vela); si no se pasan, se
+    descargan.
+    """
     tickers = [cfg.equity_ticker, cfg.bond_ticker]
-    prices = download_prices(tickers, cfg.start, cfg.end)
+    if prices is None:
+        prices = download_prices(tickers, cfg.start, cfg.end)
+    else:
+        prices = prices[tickers].dropna(how="all").ffill()
     if prices is None or prices.empty:
-        return pd.DataFrame(), pd.DataFrame()
+        return pd.DataFrame()
 
     prices = prices.ffill().dropna()
-    m_idx = monthly_dates(prices.index)
-    prices_m = prices.reindex(m_idx).ffill()
-
-    target_w = np.array([cfg.equity_weight, cfg.bond_weight])
-    shares = np.array([0.0, 0.0], dtype=float)
-    cash = 0.0
-
-    history = []
-    months_since_reb = 0
+    # Mismo muestreo que core.simulate_portfolio y la API (core.month_end_prices)
+    return month_end_prices(prices, monthly_dates(prices.index))
 
-    for d in prices_m.index:
-        # Aportación del mes
-        cash += cfg.monthly_contribution
-
-        # Compra proporcional a pesos objetivo
-        alloc = cfg.monthly_contribution * target_w
-        price_vec = prices_m.loc[d, tickers].values.astype(float)
-        buy_shares = np.where(price_vec > 0, alloc / price_vec, 0)
-        shares += buy_shares
-
-        # Rebalanceo periódico
-        months_since_reb += 1
-        port_value = (shares * price_vec).sum() + cash
-        if cfg.rebalance_months and months_since_reb >= cfg.rebalance_months and port_value > 0:
-            target_values = target_w * port_value
-            current_values = shares * price_vec
-            diff_values = target_values - current_values
-            shares += diff_values / price_vec
-            cash = 0.0
-            months_since_reb = 0
-
-        port_value = (shares * price_vec).sum() + cash
-        history.append({
-            "date": d,
-            "equity_value": shares[0] * price_vec[0],
-            "bond_value": shares[1] * price_vec[1],
-            "cash": cash,
-            "total": port_value
-        })
+def simulate_dca(cfg: PortfolioConfig, prices=None):
+    tickers = [cfg.equity_ticker, cfg.bond_ticker]
+    prices_m = monthly_prices(cfg, prices)
+    if prices_m.empty:
+        return pd.DataFrame(), pd.DataFrame()
 
-    df = pd.DataFrame(history).set_index("date")
+    target_w = np.array([cfg.equity_weight, cfg.bond_weight])
+    price_mat = prices_m[tickers].to_numpy(dtype=float)
+    _, values, cash, total = dca_engine(price_mat, target_w, cfg.monthly_contribution, cfg.rebalance_months)
+
+    df = pd.DataFrame({
+        "equity_value": values[:, 0],
+        "bond_value": values[:, 1],
+        "cash": cash,
+        "total": total,
+    }, index=pd.DatetimeIndex(prices_m.index, name="date", freq=None))
     return df, prices_m
 
+def sweep_profiles(cfg: PortfolioConfig, profiles=None, rebalance_options=REBALANCE_OPTIONS, contributions=None):
+    """
+    Compara perfiles × rebalanceos × aportaciones con una sola descarga y
+    alineación de precios. Devuelve una fila por combinación con valor final,
+    aportado y métricas (ver engine.sweep).
+    """
+    prices_m = monthly_prices(cfg)
+    if prices_m.empty:
+        return pd.DataFrame()
+    return sweep(prices_m[[cfg.equity_ticker, cfg.bond_ticker]],
+                 profiles or PROFILE_WEIGHTS,
+                 rebalance_options,
+                 contributions or [cfg.monthly_contribution])
+
 # ─────────────────────────────────────────────────────────────────────
 # Métricas
 # ─────────────────────────────────────────────────────────────────────
 def performance_stats(series: pd.Series):
-    returns = series.pct_change().dropna()
-    if returns.empty:
-        return {"CAGR": 0.0, "Vol": 0.0, "MaxDD": 0.0, "Sharpe": 0.0}
-
-    n_years = (series.index[-1] - series.index[0]).days / 365.25
-    cagr = (series.iloc[-1] / series.iloc[0]) ** (1 / n_years) - 1 if n_years > 0 else 0.0
-    vol = returns.std() * np.sqrt(12)
-    cummax = series.cummax()
-    dd = series / cummax - 1.0
-    maxdd = dd.min()
-    sharpe = (returns.mean() * 12) / vol if vol != 0 else 0.0
-    return {"CAGR": cagr, "Vol": vol, "MaxDD": maxdd, "Sharpe": sharpe}
+    # Misma definición que la app (core.perf_stats)
+    return perf_stats(series)
 
 def profile_to_weights(profile: str):
     return PROFILE_WEIGHTS.get(profile, PROFILE_WEIGHTS["Moderado"])
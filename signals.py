@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Señales de tendencia incrementales para muchas series a la vez: medias
+móviles (50/100/200 por defecto), precio por debajo de cada media y cruces
+entre medias (p.ej. 50/200).
+
+Por ticker se guarda solo la cola de las últimas max(ventanas) velas, los
+trozos de historial ya calculados y el estado de los cruces. Al llegar velas
+nuevas las medias se calculan con una suma acumulada sobre cola + velas
+nuevas: O(max ventana + velas nuevas), no O(historial). Si la vela solapada
+cambia (reajuste por dividendo o split) o la serie empieza antes que la
+guardada, el ticker se recalcula entero.
+"""
+import threading
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+WINDOWS = (50, 100, 200)
+CROSSES = ((50, 200),)
+ADJ_TOLERANCE = 1e-4
+MAX_CHUNKS = 64              # trozos de historial antes de compactarlos
+
+@dataclass
+class _Track:
+    first: pd.Timestamp
+    last: pd.Timestamp
+    tail: np.ndarray                                  # últimas max(ventanas) velas
+    n: int = 0                                        # nº total de velas
+    chunks: list = field(default_factory=list)        # [(fechas, cierres, {w: medias})]
+    prev_diff: dict = field(default_factory=dict)     # (f, s) -> última diferencia finita
+    last_cross: dict = field(default_factory=dict)    # (f, s) -> (fecha, +1/−1)
+
+def _moving_averages(tail, new, n_before, windows):
+    """Medias de las velas `new` usando la cola previa; NaN mientras no haya `w` velas."""
+    ext = np.concatenate([tail, new])
+    c = np.concatenate([[0.0], np.cumsum(ext)])
+    m, k = len(tail), len(new)
+    pos = np.arange(m, m + k)                          # posición de cada vela nueva en `ext`
+    count = n_before + np.arange(1, k + 1)            # velas acumuladas hasta cada una
+    out = {}
+    for w in windows:
+        lo = np.maximum(pos + 1 - w, 0)
+        out[w] = np.where(count >= w, (c[pos + 1] - c[lo]) / w, np.nan)
+    return out
+
+def _finite(dates, values):
+    ok = np.isfinite(values)
+    return (dates, values) if ok.all() else (dates[ok], values[ok])
+
+class SignalEngine:
+    """Estado incremental de medias móviles y cruces por ticker (seguro entre hilos)."""
+
+    def __init__(self, windows=WINDOWS, crosses=CROSSES):
+        self.windows = tuple(sorted(set(int(w) for w in windows)))
+        self.crosses = tuple((int(f), int(s)) for f, s in crosses)
+        for f, s in self.crosses:
+            if f not in self.windows or s not in self.windows:
+                raise ValueError(f"El cruce {f}/{s} necesita ambas ventanas en {self.windows}")
+        self._tracks = {}
+        self._lock = threading.Lock()
+
+    # ───────── actualización ─────────
+    def update(self, ticker, series):
+        """
+        Incorpora las velas de `series` posteriores a las ya vistas.
+        Devuelve el nº de velas procesadas (todas si hubo que recalcular).
+        """
+        if series is None or series.empty:
+            return 0
+        with self._lock:
+            tr = self._tracks.get(ticker)
+            new = self._new_bars(tr, series) if tr is not None else None
+            if new is None:
+                dates, x = _finite(series.index.values, series.to_numpy(dtype=float))
+                if len(x) == 0:
+                    return 0
+                tr = _Track(first=pd.Timestamp(dates[0]), last=pd.Timestamp(dates[0]) - pd.Timedelta(days=1),
+                            tail=np.empty(0))
+                self._tracks[ticker] = tr
+                new = dates, x
+            if len(new[1]):
+                self._extend(tr, *new)
+            return len(new[1])
+
+    def _new_bars(self, tr, series):
+        """(fechas, cierres) posteriores a `tr.last`, o None si hay que recalcular el ticker."""
+        idx = series.index
+        if idx[0] < tr.first and series.first_valid_index() < tr.first:
+            return None
+        i = idx.searchsorted(tr.last)
+        if i < len(idx) and idx[i] == tr.last:
+            values = series.to_numpy(dtype=float)
+            if abs(values[i] / tr.tail[-1] - 1.0) > ADJ_TOLERANCE:
+                return None
+            return _finite(idx.values[i + 1:], values[i + 1:])
+        if idx[-1] < tr.last:
+            return idx.values[:0], np.empty(0)
+        return None
+
+    def _extend(self, tr, dates, x):
+        mas = _moving_averages(tr.tail, x, tr.n, self.windows)
+        for pair in self.crosses:
+            f, s = pair
+            diff = mas[f] - mas[s]
+            seq = np.concatenate([[tr.prev_diff.get(pair, np.nan)], diff])
+            ok = np.flatnonzero(np.isfinite(seq) & (seq != 0))
+            if ok.size:
+                signs = np.sign(seq[ok])
+                flips = np.flatnonzero(signs[1:] != signs[:-1])
+                if flips.size:
+                    j = ok[flips[-1] + 1] - 1
+                    tr.last_cross[pair] = (pd.Timestamp(dates[j]), int(signs[flips[-1] + 1]))
+                tr.prev_diff[pair] = seq[ok[-1]]
+        tr.chunks.append((dates, x, mas))
+        if len(tr.chunks) > MAX_CHUNKS:
+            tr.chunks = [(np.concatenate([c[0] for c in tr.chunks]), np.concatenate([c[1] for c in tr.chunks]),
+                          {w: np.concatenate([c[2][w] for c in tr.chunks]) for w in self.windows})]
+        keep = self.windows[-1]
+        tr.tail = np.concatenate([tr.tail, x])[-keep:]
+        tr.n += len(x)
+        tr.last = pd.Timestamp(dates[-1])
+
+    def drop(self, ticker):
+        with self._lock:
+            self._tracks.pop(ticker, None)
+
+    # ───────── lectura ─────────
+    def _snapshot(self, ticker):
+        """(trozos, nº de velas, últimos cruces) coherentes entre sí, tomados con el lock; None si no hay."""
+        with self._lock:
+            tr = self._tracks.get(ticker)
+            if tr is None or not tr.chunks:
+                return None
+            # Los trozos no se modifican en sitio (se añaden o se sustituyen): basta copiar la lista
+            return list(tr.chunks), tr.n, dict(tr.last_cross)
+
+    def tickers(self):
+        with self._lock:
+            return list(self._tracks)
+
+    def history(self, ticker):
+        """DataFrame fechas × [close, ma50, ma100, ...] de un ticker."""
+        snap = self._snapshot(ticker)
+        if snap is None:
+            return pd.DataFrame(columns=["close"] + [f"ma{w}" for w in self.windows])
+        chunks = snap[0]
+        dates = np.concatenate([c[0] for c in chunks])
+        data = {"close": np.concatenate([c[1] for c in chunks])}
+        for w in self.windows:
+            data[f"ma{w}"] = np.concatenate([c[2][w] for c in chunks])
+        return pd.DataFrame(data, index=pd.DatetimeIndex(dates, name="date"))
+
+    def matrix(self, column, tickers=None):
+        """Matriz fechas × tickers de una columna de `history` (close, ma200...)."""
+        known = self.tickers()
+        tickers = known if tickers is None else list(tickers)
+        known = set(known)
+        cols = {t: self.history(t)[column] for t in tickers if t in known}
+        if not cols:
+            return pd.DataFrame(columns=tickers, dtype=float)
+        return pd.DataFrame(cols).reindex(columns=tickers)
+
+    def below_ma(self, window=200, tickers=None):
+        """1.0 si el cierre está por debajo de la media, 0.0 si no, NaN sin media."""
+        close = self.matrix("close", tickers)
+        ma = self.matrix(f"ma{window}", tickers)
+        return (close < ma).astype(float).where(ma.notna() & close.notna())
+
+    def crossovers(self, fast=50, slow=200, tickers=None):
+        """+1 el día en que la media rápida cruza por encima de la lenta, −1 por debajo, 0 el resto."""
+        diff = self.matrix(f"ma{fast}", tickers) - self.matrix(f"ma{slow}", tickers)
+        sign = np.sign(diff).replace(0.0, np.nan)
+        prev = sign.ffill().shift(1)
+        out = (sign != prev) & sign.notna() & prev.notna()
+        return (sign.where(out, 0.0)).fillna(0.0)
+
+    def latest(self, tickers=None):
+        """Una fila por ticker con la última vela, sus medias, señales y último cruce."""
+        tickers = self.tickers() if tickers is None else list(tickers)
+        rows = {}
+        for t in tickers:
+            snap = self._snapshot(t)
+            if snap is None:
+                continue
+            chunks, n, last_cross = snap
+            dates, close, mas = chunks[-1]
+            row = {"date": pd.Timestamp(dates[-1]), "close": float(close[-1]), "bars": n}
+            for w in self.windows:
+                ma = float(mas[w][-1])
+                row[f"ma{w}"] = ma
+                row[f"below_ma{w}"] = None if np.isnan(ma) else bool(close[-1] < ma)
+            for f, s in self.crosses:
+                when, sign = last_cross.get((f, s), (pd.NaT, 0))
+                row[f"cross_{f}_{s}"] = sign
+                row[f"cross_{f}_{s}_date"] = when
+            rows[t] = row
+        return pd.DataFrame.from_dict(rows, orient="index")
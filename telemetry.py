@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentación por etapas: duración, aciertos/fallos de caché y bytes
+descargados, acumulados por proceso como contadores e histogramas y
+exportables en texto Prometheus (formato del "textfile collector") o JSON.
+
+- `stage("nombre")` (gestor de contexto) o `@timed("nombre")` miden una etapa;
+  las etapas anidadas se miden enteras (el tiempo de la hija cuenta también en
+  la madre).
+- `cache_event` y `add_bytes` se atribuyen además a la etapa activa.
+- `start_trace()` recoge lo que pasa en la ejecución actual (una pulsación de
+  "Simular cartera") para el panel de depuración. Vive en un `contextvar`, así
+  cada sesión de Streamlit ve solo lo suyo; los hilos de price_store la
+  heredan con `propagate`.
+
+Sin dependencias: se importa desde core sin coste apreciable.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+PREFIX = "fincontrol"
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+MAX_TRACE_EVENTS = 10_000
+METRICS_FILE = os.environ.get("FINCONTROL_METRICS_FILE")   # export tras cada simulación si está definido
+
+_LOCK = threading.Lock()
+_HIST = {}                 # etapa -> [cuentas por cubo..., suma, nº]
+_ERRORS = {}               # etapa -> nº de excepciones
+_CACHE = {}                # (caché, 'hit'|'miss') -> nº
+_BYTES = {}                # origen -> bytes
+_STARTED = time.time()
+
+_STAGE = contextvars.ContextVar("telemetry_stage", default=None)
+_TRACE = contextvars.ContextVar("telemetry_trace", default=None)
+
+# ─────────────────────────────────────────────────────────────────────
+# Traza de una ejecución
+# ─────────────────────────────────────────────────────────────────────
+class Trace:
+    """Eventos de una ejecución: (tipo, etapa, nombre, valor) en orden de llegada."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.events = []
+        self._lock = threading.Lock()
+
+    def _add(self, event):
+        with self._lock:
+            if len(self.events) < MAX_TRACE_EVENTS:
+                self.events.append(event)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def stages(self):
+        """Una fila por etapa: llamadas, ms (total y máximo), errores, aciertos/fallos de caché y bytes."""
+        rows = {}
+        with self._lock:
+            events = list(self.events)
+        for kind, stage, name, value in events:
+            key = stage or "-"
+            row = rows.setdefault(key, {"stage": key, "calls": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                        "errors": 0, "cache_hits": 0, "cache_misses": 0, "bytes": 0})
+            if kind == "stage":
+                row["calls"] += 1
+                row["total_ms"] += value * 1e3
+                row["max_ms"] = max(row["max_ms"], value * 1e3)
+            elif kind == "error":
+                row["errors"] += 1
+            elif kind == "cache":
+                row["cache_hits" if value else "cache_misses"] += 1
+            elif kind == "bytes":
+                row["bytes"] += value
+        return sorted(rows.values(), key=lambda r: -r["total_ms"])
+
+def start_trace():
+    """Empieza una traza nueva en el contexto actual y la devuelve."""
+    tr = Trace()
+    _TRACE.set(tr)
+    return tr
+
+def stop_trace():
+    _TRACE.set(None)
+
+def current_trace():
+    return _TRACE.get()
+
+def propagate(fn):
+    """`fn` ejecutada con una copia del contexto actual (traza y etapa activas) en otro hilo."""
+    ctx = contextvars.copy_context()
+    # Una copia por llamada: un mismo Context no puede estar activo en dos hilos a la vez
+    return functools.wraps(fn)(lambda *a, **kw: ctx.copy().run(fn, *a, **kw))
+
+# ─────────────────────────────────────────────────────────────────────
+# Registro
+# ─────────────────────────────────────────────────────────────────────
+def observe(stage, seconds, error=False):
+    with _LOCK:
+        h = _HIST.get(stage)
+        if h is None:
+            h = _HIST[stage] = [0] * len(BUCKETS) + [0.0, 0]
+        for i, le in enumerate(BUCKETS):
+            if seconds <= le:
+                h[i] += 1
+                break
+        h[-2] += seconds
+        h[-1] += 1
+        if error:
+            _ERRORS[stage] = _ERRORS.get(stage, 0) + 1
+    tr = _TRACE.get()
+    if tr is not None:
+        tr._add(("stage", stage, stage, seconds))
+        if error:
+            tr._add(("error", stage, stage, 1))
+
+@contextmanager
+def stage(name):
+    token = _STAGE.set(name)
+    t0 = time.perf_counter()
+    error = False
+    try:
+        yield
+    except Exception:
+        # st.stop()/st.rerun() salen con BaseException y no cuentan como error
+        error = True
+        raise
+    finally:
+        _STAGE.reset(token)
+        observe(name, time.perf_counter() - t0, error)
+
+def timed(name):
+    """Decorador equivalente a envolver la función en `stage(name)`."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def cache_event(cache, hit):
+    key = (cache, "hit" if hit else "miss")
+    with _LOCK:
+        _CACHE[key] = _CACHE.get(key, 0) + 1
+    tr = _TRACE.get()
+    if tr is not None:
+        tr._add(("cache", _STAGE.get(), cache, bool(hit)))
+
+def add_bytes(source, n):
+    n = int(n)
+    if n <= 0:
+        return
+    with _LOCK:
+        _BYTES[source] = _BYTES.get(source, 0) + n
+    tr = _TRACE.get()
+    if tr is not None:
+        tr._add(("bytes", _STAGE.get(), source, n))
+
+def reset():
+    global _STARTED
+    with _LOCK:
+        _HIST.clear()
+        _ERRORS.clear()
+        _CACHE.clear()
+        _BYTES.clear()
+        _STARTED = time.time()
+
+# ─────────────────────────────────────────────────────────────────────
+# Exportación
+# ─────────────────────────────────────────────────────────────────────
+def snapshot():
+    """Copia de todos los acumulados como dict serializable en JSON."""
+    with _LOCK:
+        stages = {}
+        for name, h in sorted(_HIST.items()):
+            cum, buckets = 0, {}
+            for le, n in zip(BUCKETS, h):
+                cum += n
+                buckets[repr(le)] = cum
+            buckets["+Inf"] = h[-1]
+            stages[name] = {"count": h[-1], "sum_seconds": h[-2], "errors": _ERRORS.get(name, 0),
+                            "buckets": buckets}
+        cache = {}
+        for (name, result), n in sorted(_CACHE.items()):
+            cache.setdefault(name, {"hit": 0, "miss": 0})[result] = n
+        return {"started": _STARTED, "generated": time.time(), "stages": stages,
+                "cache": cache, "bytes_fetched": dict(sorted(_BYTES.items()))}
+
+def to_json(snap=None):
+    return json.dumps(snap or snapshot(), indent=2)
+
+def _label(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def to_prometheus(snap=None):
+    """Exposición en formato de texto de Prometheus 0.0.4."""
+    snap = snap or snapshot()
+    p = PREFIX
+    out = [f"# HELP {p}_stage_duration_seconds Duración de cada etapa.",
+           f"# TYPE {p}_stage_duration_seconds histogram"]
+    for name, s in snap["stages"].items():
+        lbl = f'stage="{_label(name)}"'
+        for le, n in s["buckets"].items():
+            out.append(f'{p}_stage_duration_seconds_bucket{{{lbl},le="{le}"}} {n}')
+        out.append(f"{p}_stage_duration_seconds_sum{{{lbl}}} {s['sum_seconds']!r}")
+        out.append(f"{p}_stage_duration_seconds_count{{{lbl}}} {s['count']}")
+    out += [f"# HELP {p}_stage_errors_total Etapas terminadas con excepción.",
+            f"# TYPE {p}_stage_errors_total counter"]
+    out += [f'{p}_stage_errors_total{{stage="{_label(name)}"}} {s["errors"]}'
+            for name, s in snap["stages"].items()]
+    out += [f"# HELP {p}_cache_requests_total Consultas a cada caché por resultado.",
+            f"# TYPE {p}_cache_requests_total counter"]
+    for name, c in snap["cache"].items():
+        for result in ("hit", "miss"):
+            out.append(f'{p}_cache_requests_total{{cache="{_label(name)}",result="{result}"}} {c[result]}')
+    out += [f"# HELP {p}_fetched_bytes_total Bytes leídos por origen (Yahoo: tamaño de lo descargado ya decodificado).",
+            f"# TYPE {p}_fetched_bytes_total counter"]
+    out += [f'{p}_fetched_bytes_total{{source="{_label(src)}"}} {n}' for src, n in snap["bytes_fetched"].items()]
+    out += [f"# HELP {p}_process_start_time_seconds Inicio de los acumulados (epoch).",
+            f"# TYPE {p}_process_start_time_seconds gauge",
+            f"{p}_process_start_time_seconds {snap['started']!r}"]
+    return "\n".join(out) + "\n"
+
+def export(path):
+    """
+    Escribe los acumulados en `path`: JSON si termina en .json, texto
+    Prometheus si no. Escritura atómica (temporal + `os.replace`), apta para
+    que la recoja el textfile collector de node_exporter.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    body = to_json() if path.suffix.lower() == ".json" else to_prometheus()
+    tmp = path.with_suffix(f"{path.suffix}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(body, encoding="utf-8")
+    os.replace(tmp, path)
+    return path
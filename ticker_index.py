@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Índice persistente de metadatos por ticker (SQLite): moneda, bolsa, nombre,
+tipo de activo, primera y última vela, nº de velas guardadas y desde cuándo
+está cubierto en el almacén de precios.
+
+Se alimenta solo: price_store registra cada serie que escribe y cada moneda
+que consulta (fetch trae también bolsa y, por HTTP, la primera fecha), y
+`build` lo rellena en bloque desde el almacén en disco. Así las
+comprobaciones de la app (`has_history`, `first_available_month`, moneda)
+responden con una consulta por clave primaria (microsegundos) en lugar de
+descargar históricos, y `search` busca por prefijo para las sugerencias.
+
+    python ticker_index.py                     # indexa el almacén de precios
+    python ticker_index.py VWRA.L AGGU.L       # + moneda y bolsa de esos tickers
+    python ticker_index.py --search VW
+
+Lo comparten todos los procesos (modo WAL). Si la base no se puede abrir, las
+consultas devuelven "no sé" y las escrituras se ignoran: el índice solo acelera.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass, fields
+from pathlib import Path
+
+import pandas as pd
+
+DB_PATH = Path(os.environ.get("FINCONTROL_TICKER_INDEX", ".cache/tickers.sqlite"))
+FIRST_DATE_GAP = pd.Timedelta(days=31)     # serie que empieza tan tarde respecto a lo pedido: esa es la primera vela
+NEGATIVE_TTL = 3600                         # segundos que vale un "no hay velas desde esa fecha"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickers (
+    symbol       TEXT PRIMARY KEY,
+    name         TEXT,
+    kind         TEXT,
+    currency     TEXT,
+    exchange     TEXT,
+    first_date   TEXT,
+    last_date    TEXT,
+    covered_from TEXT,
+    bars         INTEGER,
+    updated      REAL,
+    currency_at  REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tickers_kind ON tickers(kind, symbol);
+"""
+
+@dataclass(frozen=True)
+class TickerInfo:
+    symbol: str
+    name: str | None = None
+    kind: str | None = None          # 'equity' | 'bond' | 'crypto' | None
+    currency: str | None = None
+    exchange: str | None = None
+    first_date: str | None = None    # primera vela según Yahoo (ISO)
+    last_date: str | None = None     # última vela guardada (ISO)
+    covered_from: str | None = None  # desde cuándo cubre el almacén de precios
+    bars: int | None = None          # velas guardadas
+    updated: float | None = None     # última serie registrada (epoch)
+    currency_at: float | None = None  # última consulta de moneda (epoch)
+
+COLUMNS = tuple(f.name for f in fields(TickerInfo))
+_UPSERT = (
+    f"INSERT INTO tickers ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+    "ON CONFLICT(symbol) DO UPDATE SET "
+    + ", ".join(f"{c} = COALESCE(excluded.{c}, tickers.{c})" for c in COLUMNS[1:] if c != "first_date")
+    # La primera vela solo puede adelantarse (lo inferido de una serie es cota superior)
+    + ", first_date = CASE WHEN tickers.first_date IS NULL THEN excluded.first_date"
+      " WHEN excluded.first_date IS NULL THEN tickers.first_date"
+      " ELSE MIN(tickers.first_date, excluded.first_date) END"
+)
+
+def _symbol(ticker):
+    return ticker.strip().upper()
+
+def _day(ts):
+    return None if ts is None else pd.Timestamp(ts).strftime("%Y-%m-%d")
+
+# ─────────────────────────────────────────────────────────────────────
+# Conexión (una por hilo y proceso)
+# ─────────────────────────────────────────────────────────────────────
+_LOCAL = threading.local()
+_READY = set()             # rutas con el esquema ya creado en este proceso
+_READY_LOCK = threading.Lock()
+
+def configure(path):
+    """Cambia de base (p.ej. a un directorio temporal en pruebas)."""
+    global DB_PATH
+    DB_PATH = Path(path)
+
+def _conn():
+    key = (os.getpid(), str(DB_PATH))
+    conn = getattr(_LOCAL, "conns", {}).get(key)
+    if conn is not None:
+        return conn
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=5.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with _READY_LOCK:
+        if key not in _READY:
+            conn.executescript(_SCHEMA)
+            _READY.add(key)
+    if not hasattr(_LOCAL, "conns"):
+        _LOCAL.conns = {}
+    _LOCAL.conns[key] = conn
+    return conn
+
+# ─────────────────────────────────────────────────────────────────────
+# Escritura
+# ─────────────────────────────────────────────────────────────────────
+def upsert(rows):
+    """
+    Inserta o completa filas ({symbol, ...campos de TickerInfo}) en una sola
+    transacción; un campo ausente o None conserva lo que ya hubiera.
+    """
+    params = [tuple([_symbol(r["symbol"])] + [r.get(c) for c in COLUMNS[1:]]) for r in rows]
+    if not params:
+        return 0
+    try:
+        conn = _conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(_UPSERT, params)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    except (sqlite3.Error, OSError):
+        return 0
+    return len(params)
+
+def series_row(ticker, series, covered_from, now=None):
+    """Fila con lo que dice una serie del almacén (última vela, nº de velas y, si se deduce, la primera)."""
+    covered_from = pd.Timestamp(covered_from) if covered_from is not None else None
+    row = {"symbol": ticker, "bars": int(len(series)), "updated": time.time() if now is None else now,
+           "covered_from": _day(covered_from)}
+    if len(series):
+        first, last = series.index[0], series.index[-1]
+        row["last_date"] = _day(last)
+        if covered_from is not None and first - covered_from > FIRST_DATE_GAP:
+            row["first_date"] = _day(first)
+    return row
+
+def record_series(ticker, series, covered_from, now=None):
+    return upsert([series_row(ticker, series, covered_from, now)])
+
+def record_info(ticker, info, now=None):
+    """Guarda lo que devuelve fetch.info (moneda, bolsa, nombre, primera fecha)."""
+    row = {"symbol": ticker, "currency": info.get("currency"), "exchange": info.get("exchange"),
+           "name": info.get("name"), "first_date": _day(info.get("first_date"))}
+    if row["currency"]:
+        row["currency_at"] = time.time() if now is None else now
+    return upsert([row])
+
+# ─────────────────────────────────────────────────────────────────────
+# Consultas
+# ─────────────────────────────────────────────────────────────────────
+def lookup(ticker):
+    """TickerInfo del ticker o None si no está (o no se puede leer el índice)."""
+    try:
+        row = _conn().execute(f"SELECT {', '.join(COLUMNS)} FROM tickers WHERE symbol = ?",
+                              (_symbol(ticker),)).fetchone()
+    except (sqlite3.Error, OSError):
+        return None
+    return TickerInfo(*row) if row else None
+
+def has_history(ticker, start, now=None):
+    """
+    True/False si el índice lo sabe (hay velas desde `start`: la última es
+    posterior; no las hay: lo cubierto empieza antes y se comprobó hace menos
+    de NEGATIVE_TTL), None si hay que preguntar a Yahoo.
+    """
+    info = lookup(ticker)
+    if info is None:
+        return None
+    start = _day(start)
+    if info.last_date is not None and info.last_date >= start:
+        return True
+    now = time.time() if now is None else now
+    if (info.covered_from is not None and info.covered_from <= start
+            and info.updated is not None and now - info.updated <= NEGATIVE_TTL):
+        return False
+    return None
+
+def first_date(ticker):
+    """Primera vela conocida (Timestamp) o None."""
+    info = lookup(ticker)
+    return pd.Timestamp(info.first_date) if info is not None and info.first_date else None
+
+def search(prefix="", kind=None, limit=20):
+    """Tickers cuyo símbolo empieza por `prefix` (sin distinguir mayúsculas), en orden alfabético."""
+    p = _symbol(prefix)
+    sql = f"SELECT {', '.join(COLUMNS)} FROM tickers WHERE symbol >= ? AND symbol < ?"
+    args = [p, p + "\U0010ffff"]
+    if kind is not None:
+        sql += " AND kind = ?"
+        args.append(kind)
+    sql += " ORDER BY symbol LIMIT ?"
+    args.append(int(limit))
+    try:
+        return [TickerInfo(*r) for r in _conn().execute(sql, args).fetchall()]
+    except (sqlite3.Error, OSError):
+        return []
+
+# ─────────────────────────────────────────────────────────────────────
+# Construcción en bloque
+# ─────────────────────────────────────────────────────────────────────
+def index_store(store_dir=None):
+    """Registra cada serie del almacén de precios (una transacción); devuelve cuántas."""
+    import price_store  # diferido: price_store importa este módulo
+    from urllib.parse import unquote
+
+    store_dir = Path(store_dir or price_store.STORE_DIR)
+    rows = []
+    for path in sorted(store_dir.glob("*.parquet")):
+        ticker = unquote(path.stem)
+        s, meta = price_store.read_store(ticker)
+        if meta.get("covered_from"):
+            rows.append(series_row(ticker, s, meta["covered_from"], meta.get("fetched_at")))
+    return upsert(rows)
+
+def seed_kinds(kinds):
+    """{ticker: tipo} (p.ej. las listas de core.recommend_tickers)."""
+    return upsert([{"symbol": t, "kind": k} for t, k in kinds.items()])
+
+def build(tickers=(), max_age=0):
+    """Indexa el almacén de precios y consulta moneda y bolsa de `tickers` en paralelo."""
+    import price_store
+
+    n = index_store()
+    if tickers:
+        price_store.ticker_currencies(tickers, max_age=max_age)
+    return n + len(tickers)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("tickers", nargs="*", help="tickers de los que consultar moneda y bolsa")
+    ap.add_argument("--search", help="muestra los tickers que empiezan por este prefijo")
+    ap.add_argument("--kind", choices=["equity", "bond", "crypto"])
+    args = ap.parse_args(argv)
+
+    if args.search is not None:
+        for info in search(args.search, args.kind, limit=50):
+            print(f"{info.symbol:12s} {info.currency or '-':4s} {info.exchange or '-':8s} "
+                  f"{info.first_date or '-':10s} → {info.last_date or '-':10s} {info.bars or 0:6d}  {info.name or ''}")
+        return 0
+    t0 = time.perf_counter()
+    n = build(args.tickers)
+    print(f"{n} tickers indexados en {DB_PATH} ({time.perf_counter() - t0:.1f} s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Precalentado en segundo plano: refresca los precios de los tickers por
+defecto, de las listas de sugerencias y de los pares EUR/USD antes de que
+caduquen (price_store.REFRESH_TTL), las monedas de cotización y las
+simulaciones por defecto de cada perfil × rebalanceo, así quien entra después
+de una caducidad no paga la descarga ni la simulación.
+
+- `Scheduler` ejecuta tareas periódicas en su propio hilo. El reloj se
+  inyecta (`clock`), así que con un reloj falso y `run_pending()` se prueba
+  sin esperas ni hilos (ver benchmarks/bench_warmup.py, con el mercado
+  sintético como proveedor).
+- `freshness()` da por tarea el último refresco correcto, su antigüedad, la
+  próxima ejecución y el último error (se muestra en el panel de depuración).
+- `start_default(...)` arranca una sola vez por proceso el planificador con
+  las tareas por defecto; `FINCONTROL_WARMUP_INTERVAL=0` lo desactiva.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import telemetry
+import ticker_index
+from core import Asset, recommend_tickers
+from fx import FXUnavailable, fx_matrix, pairs_for
+from price_store import CURRENCY_TTL, REFRESH_TTL, load_prices_many, ticker_currencies, ticker_currency
+from results import resultados
+from robo import PROFILE_WEIGHTS, REBALANCE_OPTIONS
+
+WARMUP_INTERVAL = float(os.environ.get("FINCONTROL_WARMUP_INTERVAL", REFRESH_TTL / 2))   # 0 = desactivado
+RETRY_DELAY = 60.0         # segundos hasta reintentar una tarea fallida
+MAX_SLEEP = 60.0           # el hilo vuelve a mirar el reloj al menos cada minuto
+CURRENCIES = ("EUR", "USD")
+FX_PAIRS = ("EURUSD=X", "USDEUR=X")
+
+# ─────────────────────────────────────────────────────────────────────
+# Planificador
+# ─────────────────────────────────────────────────────────────────────
+@dataclass
+class Job:
+    name: str
+    fn: object
+    interval: float                 # segundos entre ejecuciones correctas
+    next_run: float = 0.0           # instante (según el reloj del planificador)
+    last_run: float | None = None
+    last_ok: float | None = None
+    last_error: str | None = None
+    duration: float = 0.0           # segundos de la última ejecución
+    runs: int = 0
+    failures: int = 0
+
+class Scheduler:
+    """Tareas periódicas (en orden de alta cuando vencen a la vez) con reloj inyectable."""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.jobs = {}
+        self._lock = threading.Lock()       # una sola ejecución de tareas a la vez
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, name, fn, interval, delay=0.0):
+        self.jobs[name] = Job(name, fn, float(interval), next_run=self.clock() + delay)
+        return self.jobs[name]
+
+    def run_pending(self):
+        """Ejecuta las tareas vencidas; devuelve sus nombres."""
+        ran = []
+        with self._lock:
+            for job in list(self.jobs.values()):
+                now = self.clock()
+                if job.next_run > now:
+                    continue
+                t0 = time.perf_counter()
+                try:
+                    with telemetry.stage(f"warmup.{job.name}"):
+                        job.fn()
+                except Exception as e:
+                    job.failures += 1
+                    job.last_error = f"{type(e).__name__}: {e}"
+                    job.next_run = now + min(job.interval, RETRY_DELAY)
+                else:
+                    job.last_ok = self.clock()
+                    job.last_error = None
+                    job.next_run = now + job.interval
+                job.last_run = now
+                job.runs += 1
+                job.duration = time.perf_counter() - t0
+                ran.append(job.name)
+        return ran
+
+    def next_run(self):
+        return min((j.next_run for j in self.jobs.values()), default=None)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.run_pending()
+            nxt = self.next_run()
+            wait = MAX_SLEEP if nxt is None else max(0.0, nxt - self.clock())
+            self._stop.wait(min(wait, MAX_SLEEP))
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="warmup", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def freshness(self):
+        """Una fila por tarea: último refresco correcto (UTC), antigüedad, próxima ejecución y errores."""
+        now = self.clock()
+        rows = []
+        for j in self.jobs.values():
+            rows.append({
+                "job": j.name,
+                "last_ok": (datetime.fromtimestamp(j.last_ok, timezone.utc).isoformat(timespec="seconds")
+                            if j.last_ok is not None else None),
+                "age_s": None if j.last_ok is None else round(now - j.last_ok, 1),
+                "next_in_s": round(max(0.0, j.next_run - now), 1),
+                "runs": j.runs, "failures": j.failures,
+                "duration_ms": round(j.duration * 1e3, 1), "last_error": j.last_error,
+            })
+        return rows
+
+# ─────────────────────────────────────────────────────────────────────
+# Tareas por defecto
+# ─────────────────────────────────────────────────────────────────────
+def watched_tickers(tickers, currencies=CURRENCIES):
+    """Tickers por defecto + los de las listas de sugerencias (sin repetir, en orden)."""
+    return list(dict.fromkeys([t for t in tickers if t] + list(suggested_kinds(currencies))))
+
+def suggested_kinds(currencies=CURRENCIES):
+    """{ticker: tipo} de las listas de sugerencias."""
+    return {t: kind for cur in currencies for kind in ("equity", "bond", "crypto")
+            for t in recommend_tickers(kind, cur)}
+
+def refresh_currencies(tickers, kinds=None):
+    """Vuelve a consultar la moneda de cotización (y bolsa, en ticker_index) de todos los tickers."""
+    if kinds:
+        ticker_index.seed_kinds(kinds)
+    return ticker_currencies(tickers, max_age=0)
+
+def refresh_prices(tickers, start, currencies=CURRENCIES):
+    """
+    Pide las velas nuevas de los tickers y de los pares FX que necesitan para
+    cada moneda de la app (y de EUR/USD), en una descarga agrupada.
+    """
+    native = ticker_currencies(tickers)
+    pairs = {p for dst in currencies for p in pairs_for(native.values(), dst)}
+    load_prices_many(list(tickers) + sorted(pairs | set(FX_PAIRS)), start, max_age=0)
+
+def warm_simulations(equity, bond, start, aportacion, horizonte, currencies=CURRENCIES,
+                     profiles=PROFILE_WEIGHTS, rebalance_options=REBALANCE_OPTIONS):
+    """Simula (o encuentra ya en result_cache) cada perfil × rebalanceo con los valores por defecto de la app."""
+    eq_cur, bd_cur = ticker_currency(equity), ticker_currency(bond)
+    for dst in currencies:
+        try:
+            # Tipos recién refrescados: si no han cambiado, la huella (y la clave) es la misma
+            fx_matrix({eq_cur, bd_cur}, dst, start, max_age=0)
+            for w_equity, w_bond in profiles.values():
+                assets = [Asset(equity, role="equity", weight=w_equity, currency=eq_cur),
+                          Asset(bond, role="bond", weight=w_bond, currency=bd_cur)]
+                for rb in rebalance_options:
+                    resultados(assets, aportacion, start, rb, dst, None, horizonte)
+        except FXUnavailable:
+            continue
+
+def default_scheduler(equity, bond, crypto, start, aportacion, horizonte, currencies=CURRENCIES,
+                      interval=WARMUP_INTERVAL, clock=time.time):
+    """Planificador con las tareas por defecto: monedas, precios y simulaciones (en ese orden)."""
+    tickers = watched_tickers([equity, bond, crypto], currencies)
+    sched = Scheduler(clock)
+    kinds = {**suggested_kinds(currencies), equity: "equity", bond: "bond", crypto: "crypto"}
+    sched.add("currencies", lambda: refresh_currencies(tickers, kinds), max(interval, CURRENCY_TTL / 2))
+    sched.add("prices", lambda: refresh_prices(tickers, start, currencies), interval)
+    sched.add("simulations", lambda: warm_simulations(equity, bond, start, aportacion, horizonte, currencies),
+              interval)
+    return sched
+
+_DEFAULT = None
+_DEFAULT_LOCK = threading.Lock()
+
+def start_default(*args, **kwargs):
+    """Arranca (una vez por proceso) `default_scheduler(...)` en segundo plano; None si está desactivado."""
+    global _DEFAULT
+    interval = kwargs.get("interval", WARMUP_INTERVAL)
+    if interval <= 0:
+        return None
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = default_scheduler(*args, **kwargs).start()
+        return _DEFAULT
+
+def current():
+    """Planificador por defecto si está en marcha (para mostrar su frescura)."""
+    return _DEFAULT